@@ -48,12 +48,83 @@ from routes.dictation_editor import editor_bp
 from routes.dictation import dictation_bp
 from routes.user_routes import user_bp
 from routes.statistics import statistics_bp
+from routes.review import review_bp
+from routes.jobs import jobs_bp
 
 app.register_blueprint(index_bp)
 app.register_blueprint(editor_bp)
 app.register_blueprint(dictation_bp)
 app.register_blueprint(user_bp)
 app.register_blueprint(statistics_bp)
+app.register_blueprint(review_bp)
+app.register_blueprint(jobs_bp)
+
+
+# ================================
+# CLI-команды обслуживания данных (flask --app app <команда>)
+import click
+from helpers.user_helpers import USERS_BASE_DIR
+
+
+def iter_user_emails():
+    """Email всех пользователей, у которых есть info.json"""
+    import json
+    if not os.path.isdir(USERS_BASE_DIR):
+        return
+    for folder in sorted(os.listdir(USERS_BASE_DIR)):
+        info_path = os.path.join(USERS_BASE_DIR, folder, 'info.json')
+        if not os.path.isfile(info_path):
+            continue
+        try:
+            with open(info_path, 'r', encoding='utf-8') as f:
+                email = json.load(f).get('email')
+        except Exception as e:
+            print(f"❌ Ошибка чтения {info_path}: {e}", file=sys.stderr)
+            continue
+        if email:
+            yield email
+
+
+@app.cli.command('history-migrate')
+def history_migrate_command():
+    """Миграция h_YYYYMM.json всех пользователей в формат по датам + хранилище отчетов
+
+    Запускается и после смены HISTORY_ANALYTICS_STORE: строит выбранное
+    хранилище (rollups.json или columns/*.npy) заранее, а не в первом запросе.
+    """
+    from helpers.history_log import compact, migrate_months
+    from helpers.history_columns import ensure_history_analytics
+    from helpers.streak import recompute_streak
+    from helpers.user_helpers import load_user_info
+    for email in iter_user_emails():
+        compact(email)
+        migrated = migrate_months(email)
+        ensure_history_analytics(email)
+        # streak, сохраненный до инкрементального обновления, строится по истории сразу
+        if not isinstance((load_user_info(email) or {}).get('streak'), dict):
+            recompute_streak(email)
+        if migrated:
+            click.echo(f"{email}: {', '.join(migrated)}")
+
+
+@app.cli.command('streak-recompute')
+@click.option('--email', default=None, help='Пересчитать только для одного пользователя')
+def streak_recompute_command(email):
+    """Полный пересчет streak по истории (ремонт данных)"""
+    from helpers.streak import recompute_streak
+    emails = [email] if email else list(iter_user_emails())
+    for user_email in emails:
+        state = recompute_streak(user_email)
+        click.echo(f"{user_email}: {state}")
+
+
+@app.cli.command('difficulty-update')
+@click.option('--workers', default=None, type=int, help='Число процессов (по умолчанию - по числу CPU)')
+def difficulty_update_command(workers):
+    """Пересчет сложности диктантов по истории всех пользователей (только измененные месяцы)"""
+    from helpers.dictation_difficulty import update_difficulty
+    users, changed_months = update_difficulty(iter_user_emails(), workers=workers)
+    click.echo(f"Пользователей: {users}, обработано месяцев: {changed_months}")
 
 
 @app.route('/favicon.ico')
@@ -24,3 +24,9 @@ graceful_timeout = 30
 max_requests = 0
 max_requests_jitter = 0
 
+
+
+def worker_exit(server, worker):
+    """Сброс буфера отложенной записи (история, черновики) при остановке воркера"""
+    from helpers.write_behind import drain
+    drain()
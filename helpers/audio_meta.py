@@ -0,0 +1,126 @@
+"""
+Метаданные аудиофайлов без декодирования
+
+Частота дискретизации, каналы, число кадров и длительность читаются из
+заголовков контейнера: soundfile (WAV, FLAC, OGG, MP3), для остальных
+форматов (WebM, M4A, ...) - ffprobe. Результат кэшируется в процессе по
+(путь, mtime, размер): измененный файл читается заново.
+"""
+import json
+import logging
+import os
+import subprocess
+import threading
+from collections import OrderedDict
+
+import soundfile as sf
+
+
+logger = logging.getLogger(__name__)
+
+AUDIO_META_CACHE_SIZE = 1024
+
+FFPROBE_TIMEOUT_SECONDS = 10
+
+
+def _signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _from_soundfile(path):
+    info = sf.info(path)
+    return {
+        'sample_rate': info.samplerate,
+        'channels': info.channels,
+        'frames': info.frames,
+        'duration': info.frames / info.samplerate if info.samplerate else 0.0,
+        'format': info.format
+    }
+
+
+def _from_ffprobe(path):
+    cmd = [
+        'ffprobe', '-v', 'error', '-select_streams', 'a:0',
+        '-show_entries', 'stream=sample_rate,channels,duration:format=duration,format_name',
+        '-of', 'json', path
+    ]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=FFPROBE_TIMEOUT_SECONDS)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.decode(errors='ignore').strip() or 'ffprobe error')
+
+    data = json.loads(proc.stdout or b'{}')
+    streams = data.get('streams') or []
+    if not streams:
+        raise RuntimeError('в файле нет аудиодорожки')
+    stream = streams[0]
+    container = data.get('format') or {}
+
+    sample_rate = int(stream.get('sample_rate') or 0)
+    # У WebM длительность есть только у контейнера
+    duration = float(stream.get('duration') or container.get('duration') or 0.0)
+    return {
+        'sample_rate': sample_rate,
+        'channels': int(stream.get('channels') or 0),
+        'frames': int(round(duration * sample_rate)),
+        'duration': duration,
+        'format': container.get('format_name', '')
+    }
+
+
+class AudioMetaCache:
+    """LRU-кэш метаданных: путь -> (подпись файла, метаданные)"""
+
+    def __init__(self, maxsize=AUDIO_META_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def probe(self, path):
+        """Метаданные файла (dict: sample_rate, channels, frames, duration, format)
+
+        FileNotFoundError - файла нет, ValueError - заголовок не прочитать.
+        """
+        signature = _signature(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(path)
+                return dict(entry[1])
+
+        try:
+            meta = _from_soundfile(path)
+        except Exception as soundfile_error:
+            try:
+                meta = _from_ffprobe(path)
+            except FileNotFoundError:
+                raise ValueError(f'Формат не поддерживается soundfile, ffprobe не установлен: {soundfile_error}')
+            except Exception as e:
+                raise ValueError(f'Не удалось прочитать заголовок {path}: {e}')
+
+        with self._lock:
+            self._entries[path] = (signature, meta)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return dict(meta)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_audio_meta_cache = AudioMetaCache()
+
+
+def probe_audio(path):
+    """Метаданные аудиофайла из общего кэша процесса"""
+    return _audio_meta_cache.probe(path)
+
+
+def get_sample_rate(path):
+    return probe_audio(path)['sample_rate']
+
+
+def get_duration(path):
+    return probe_audio(path)['duration']
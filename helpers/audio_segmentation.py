@@ -0,0 +1,98 @@
+"""
+Автоматическая разметка записи на предложения по паузам
+
+Сигнал делится на кадры (frame_ms), для каждого считается RMS. Кадр -
+речь, если его уровень относительно опорного (95-й перцентиль RMS) выше
+threshold_db. Паузы не короче min_gap разделяют предложения, отрезки
+короче min_sentence (щелчки, вдохи) отбрасываются, границы расширяются
+на padding секунд. Сигнал обрабатывается блоками: в памяти - блок и по
+одному числу на кадр, поэтому длина файла не важна.
+"""
+import numpy
+
+
+DEFAULT_SEGMENT_PARAMS = {
+    'frame_ms': 20,
+    'threshold_db': -35.0,
+    'min_gap': 0.35,
+    'min_sentence': 0.3,
+    'padding': 0.1,
+}
+
+# Кадров в блоке обработки (при 20 мс - около 80 секунд)
+SEGMENT_BLOCK_FRAMES = 4096
+
+REFERENCE_PERCENTILE = 95
+
+
+def frame_rms(samples, frame_length, progress=None):
+    """RMS неперекрывающихся кадров по блокам (последний неполный кадр - по его длине)"""
+    frame_count = -(-len(samples) // frame_length)
+    rms = numpy.empty(frame_count, dtype=numpy.float32)
+    block_length = frame_length * SEGMENT_BLOCK_FRAMES
+
+    for block_index, start in enumerate(range(0, len(samples), block_length)):
+        block = numpy.asarray(samples[start:start + block_length], dtype=numpy.float32)
+        full = len(block) // frame_length
+        first = block_index * SEGMENT_BLOCK_FRAMES
+
+        frames = block[:full * frame_length].reshape(full, frame_length)
+        rms[first:first + full] = numpy.sqrt(numpy.mean(numpy.square(frames), axis=1))
+        if len(block) > full * frame_length:
+            tail = block[full * frame_length:]
+            rms[first + full] = numpy.sqrt(numpy.mean(numpy.square(tail)))
+
+        if progress is not None:
+            progress(min(1.0, (start + block_length) / len(samples)))
+    return rms
+
+
+def _runs(mask):
+    """Отрезки подряд идущих True: массивы начал и концов (конец не включается)"""
+    edges = numpy.diff(numpy.concatenate(([0], mask.astype(numpy.int8), [0])))
+    return numpy.flatnonzero(edges == 1), numpy.flatnonzero(edges == -1)
+
+
+def find_sentences(rms, frame_seconds, duration, threshold_db, min_gap, min_sentence, padding):
+    """Границы предложений [(начало, конец)] в секундах по RMS кадров"""
+    if len(rms) == 0:
+        return []
+
+    reference = float(numpy.percentile(rms, REFERENCE_PERCENTILE))
+    if reference <= 0:
+        # Тишина во всем файле
+        return []
+    level_db = 20 * numpy.log10(numpy.maximum(rms, 1e-10) / reference)
+    voiced = level_db > threshold_db
+
+    # Короткие паузы внутри фразы считаются речью
+    gap_starts, gap_ends = _runs(~voiced)
+    for start, end in zip(gap_starts, gap_ends):
+        if start > 0 and end < len(voiced) and (end - start) * frame_seconds < min_gap:
+            voiced[start:end] = True
+
+    starts, ends = _runs(voiced)
+    lengths = (ends - starts) * frame_seconds
+    keep = lengths >= min_sentence
+    starts = starts[keep] * frame_seconds - padding
+    ends = numpy.minimum(ends[keep] * frame_seconds + padding, duration)
+    starts = numpy.maximum(starts, 0.0)
+
+    # Расширенные границы соседних предложений не пересекаются: делим паузу пополам
+    for index in range(1, len(starts)):
+        if starts[index] < ends[index - 1]:
+            middle = (starts[index] + padding + ends[index - 1] - padding) / 2
+            ends[index - 1] = starts[index] = middle
+
+    return [(round(float(start), 3), round(float(end), 3)) for start, end in zip(starts, ends)]
+
+
+def segment_samples(samples, sr, params=None, progress=None):
+    """Предложения записи: [(начало, конец)] в секундах"""
+    params = dict(DEFAULT_SEGMENT_PARAMS, **(params or {}))
+    frame_length = max(1, int(sr * params['frame_ms'] / 1000))
+    rms = frame_rms(samples, frame_length, progress)
+    return find_sentences(
+        rms, frame_length / sr, len(samples) / sr,
+        params['threshold_db'], params['min_gap'], params['min_sentence'], params['padding']
+    )
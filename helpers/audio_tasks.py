@@ -0,0 +1,536 @@
+"""
+Обработка аудио в редакторе диктантов
+
+Функции-задания для helpers.jobs: task(params, progress) -> тело ответа.
+Маршруты проверяют запрос и либо вызывают задание сразу (синхронный
+режим), либо ставят его в пул процессов (async=true). Пути в params
+относительные (static/data/temp/...) - как и в маршрутах.
+"""
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy
+import soundfile as sf
+
+from helpers.audio_meta import get_duration, get_sample_rate
+from helpers.audio_segmentation import segment_samples
+from helpers.disk_cache import DiskLRUCache
+from helpers.jobs import JobError
+from helpers.pcm_cache import get_pcm_cache
+from helpers.tts_cache import TTSCache, create_tts_backend
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_RATE = 22050
+
+# Размер блока потоковой склейки (кадров)
+MIX_BLOCK_FRAMES = 65536
+
+# Кодирование частей при разрезании: по потоку на ядро
+SEGMENT_WORKERS = int(os.getenv('SEGMENT_WORKERS', str(os.cpu_count() or 1)))
+
+_segment_executor = None
+_segment_executor_lock = threading.Lock()
+
+
+def _get_segment_executor():
+    global _segment_executor
+    with _segment_executor_lock:
+        if _segment_executor is None:
+            _segment_executor = ThreadPoolExecutor(max_workers=SEGMENT_WORKERS, thread_name_prefix='segment')
+        return _segment_executor
+
+
+def _encode_segment(path, samples, sr):
+    started = time.perf_counter()
+    sf.write(path, samples, sr)
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def encode_segments(samples, sr, segments, progress):
+    """Пишет части сигнала параллельно: segments = [(путь, начало, конец)] в кадрах
+
+    soundfile кодирует в libsndfile без GIL, поэтому потоки занимают все
+    ядра, а части - срезы одного буфера (без копирования). Возвращает
+    время кодирования каждой части, мс, в порядке segments.
+    """
+    executor = _get_segment_executor()
+    futures = {
+        executor.submit(_encode_segment, path, samples[start:end], sr): index
+        for index, (path, start, end) in enumerate(segments)
+    }
+    timings = [0.0] * len(segments)
+    for done_count, future in enumerate(as_completed(futures), 1):
+        timings[futures[future]] = future.result()
+        progress(done_count / len(segments))
+    return timings
+
+
+def _get_task_pcm_cache(params):
+    """Кеш PCM по настройкам из params (папка - в instance/ приложения)"""
+    return get_pcm_cache(params['pcm_cache']['cache_dir'], params['pcm_cache']['max_bytes'])
+
+
+def _split_timings(decode_ms, timings, started):
+    return {
+        'decode_ms': decode_ms,
+        'encode_ms': round(sum(timings), 1),
+        'wall_ms': round((time.perf_counter() - started) * 1000, 1),
+        'workers': SEGMENT_WORKERS
+    }
+
+
+def split_into_parts_task(params, progress):
+    """Равные части исходного файла: 000_<lang>_mp3_1.mp3, 001_..."""
+    dictation_id = params['dictation_id']
+    language = params['language']
+    source_path = params['source_path']
+    parts_dir = params['parts_dir']
+    num_parts = params['num_parts']
+    start_time = params['start_time']
+    part_duration = (params['end_time'] - start_time) / num_parts
+
+    # Загружаем исходный аудио файл
+    started = time.perf_counter()
+    try:
+        y, sr = _get_task_pcm_cache(params).load(source_path)
+        logger.info(f"Загружен аудио файл: {len(y)} samples, sample rate: {sr}")
+    except Exception as e:
+        logger.error(f"Ошибка загрузки аудио файла: {e}")
+        raise JobError(f'Cannot load audio file: {str(e)}', {'error': f'Cannot load audio file: {str(e)}'}, 400)
+    decode_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    os.makedirs(parts_dir, exist_ok=True)
+    created_files = []
+    segments = []
+    for i in range(num_parts):
+        # Учитываем время старта диктанта, которое установил пользователь
+        part_start_time = start_time + (i * part_duration)
+        part_end_time = start_time + ((i + 1) * part_duration)
+
+        # Имя файла в формате 001_en_mp3_1.mp3
+        part_filename = f"{i:03d}_{language}_mp3_1.mp3"
+
+        # Нужный кусок аудио (в сэмплах) сохраняется отдельным файлом
+        segments.append((os.path.join(parts_dir, part_filename), int(part_start_time * sr), int(part_end_time * sr)))
+        created_files.append({
+            'filename': part_filename,
+            'start_time': part_start_time,
+            'end_time': part_end_time,
+            'url': f"/static/data/temp/{dictation_id}/{language}/mp3_1/{part_filename}"
+        })
+
+    timings = encode_segments(y, sr, segments, progress)
+    for created, encode_ms in zip(created_files, timings):
+        created['encode_ms'] = encode_ms
+
+    logger.info(f"✅ Создано {len(created_files)} частей аудио")
+
+    return {
+        "success": True,
+        "message": f"Аудио разделено на {num_parts} частей",
+        "parts": created_files,
+        "timings": _split_timings(decode_ms, timings, started)
+    }
+
+
+def cut_audio_task(params, progress):
+    """Обрезка файла на месте через ffmpeg (без перекодирования)"""
+    physical_path = params['physical_path']
+    start_time = params['start_time']
+    end_time = params['end_time']
+
+    try:
+        ext = os.path.splitext(physical_path)[1].lower()
+
+        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp_out:
+            tmp_out_path = tmp_out.name
+
+        # Команда ffmpeg: копирование дорожек без перекодирования (-c copy)
+        cmd = [
+            'ffmpeg', '-y',
+            '-i', physical_path,
+            '-ss', str(max(0.0, float(start_time))),
+            '-to', str(max(0.0, float(end_time))),
+            '-c', 'copy',
+            tmp_out_path
+        ]
+        logger.info(f"Запуск ffmpeg: {' '.join(cmd)}")
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if proc.returncode != 0:
+            logger.error(f"ffmpeg error: {proc.stderr.decode(errors='ignore')}")
+            raise JobError('ffmpeg не смог обрезать файл', {'success': False, 'error': 'ffmpeg не смог обрезать файл'})
+
+        # Заменяем исходный файл обрезанной версией
+        os.replace(tmp_out_path, physical_path)
+        logger.info(f"Аудиофайл успешно обрезан и перезаписан (ffmpeg): {params['filename']}")
+
+    except JobError:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка при обрезании аудио (ffmpeg): {e}", exc_info=True)
+        message = f'Ошибка обрезания аудио: {str(e)}'
+        raise JobError(message, {'success': False, 'error': message})
+
+    return {
+        'success': True,
+        'filename': params['filename'],
+        'filepath': params['filepath'],
+        'start_time': start_time,
+        'end_time': end_time,
+        'message': 'Аудиофайл успешно обрезан'
+    }
+
+
+# Режимы разрезания на предложения: перекодирование (librosa + soundfile)
+# или копирование потока ffmpeg (без декодирования и потери качества)
+SPLIT_MODE_ENCODE = 'encode'
+SPLIT_MODE_COPY = 'copy'
+
+# Копирование потока возможно, только если исходник уже в формате частей
+STREAM_COPY_EXTENSIONS = ('.mp3',)
+
+
+def split_stream_copy(source_path, segments):
+    """Одним запуском ffmpeg режет source_path на части без перекодирования
+
+    segments = [(путь, начало, конец)] в секундах; у каждого выхода свои
+    -ss/-to (обрезка на выходе - с точностью до кадра MP3).
+    """
+    cmd = ['ffmpeg', '-y', '-v', 'error', '-i', source_path]
+    for path, start_time, end_time in segments:
+        cmd += [
+            '-map', '0:a:0', '-c', 'copy',
+            '-ss', f'{max(0.0, float(start_time)):.3f}', '-to', f'{max(0.0, float(end_time)):.3f}',
+            path
+        ]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.decode(errors='ignore').strip() or 'ffmpeg error')
+
+
+def split_sentences_task(params, progress):
+    """Файл на предложения: <key>_<lang>_user.mp3 рядом с исходным
+
+    mode='copy' - копирование потока ffmpeg, если исходник MP3; иначе
+    (или при ошибке ffmpeg) - декодирование и кодирование частей.
+    """
+    physical_path = params['physical_path']
+    sentences = params['sentences']
+    mode = params.get('mode') or SPLIT_MODE_ENCODE
+    output_dir = os.path.dirname(physical_path)
+
+    created_files = []  # Список созданных файлов для ответа
+    for sentence in sentences:
+        key = sentence.get('key')
+        start_time = sentence.get('start_time', 0)
+        end_time = sentence.get('end_time', 0)
+        language = sentence.get('language', 'en')
+
+        if not key or start_time >= end_time:
+            continue
+
+        created_files.append({
+            'key': key,
+            'filename': f"{key}_{language}_user.mp3",
+            'start_time': start_time,
+            'end_time': end_time
+        })
+
+    started = time.perf_counter()
+    if mode == SPLIT_MODE_COPY:
+        if os.path.splitext(physical_path)[1].lower() in STREAM_COPY_EXTENSIONS:
+            try:
+                split_stream_copy(physical_path, [
+                    (os.path.join(output_dir, created['filename']), created['start_time'], created['end_time'])
+                    for created in created_files
+                ])
+                logger.info(f"Аудиофайл разрезан копированием потока на {len(created_files)} предложений")
+                return {
+                    'success': True,
+                    'message': f'Аудиофайл успешно разрезан на {len(created_files)} предложений',
+                    'sentences_count': len(created_files),
+                    'files': created_files,
+                    'mode': SPLIT_MODE_COPY,
+                    'timings': {'wall_ms': round((time.perf_counter() - started) * 1000, 1)}
+                }
+            except Exception as e:
+                # ffmpeg не установлен или не справился с файлом
+                logger.warning(f"Копирование потока не удалось, перекодируем: {e}")
+        else:
+            logger.info(f"Копирование потока невозможно для {physical_path}, перекодируем")
+
+    try:
+        # Загружаем аудиофайл
+        y, sr = _get_task_pcm_cache(params).load(physical_path)
+        decode_ms = round((time.perf_counter() - started) * 1000, 1)
+
+        # Файл предложения - отрезок аудио (индексы в сэмплах)
+        segments = [
+            (os.path.join(output_dir, created['filename']), int(created['start_time'] * sr), int(created['end_time'] * sr))
+            for created in created_files
+        ]
+        timings = encode_segments(y, sr, segments, progress)
+        for created, encode_ms in zip(created_files, timings):
+            created['encode_ms'] = encode_ms
+            logger.info(f"Создан файл: {created['filename']} ({created['start_time']:.2f}s - {created['end_time']:.2f}s)")
+
+        logger.info(f"Аудиофайл успешно разрезан на {len(sentences)} предложений")
+
+    except Exception as e:
+        logger.error(f"Ошибка при разрезании аудио: {e}")
+        message = f'Ошибка разрезания аудио: {str(e)}'
+        raise JobError(message, {'success': False, 'error': message})
+
+    return {
+        'success': True,
+        'message': f'Аудиофайл успешно разрезан на {len(created_files)} предложений',
+        'sentences_count': len(created_files),
+        'files': created_files,  # Возвращаем информацию о созданных файлах
+        'mode': SPLIT_MODE_ENCODE,
+        'timings': _split_timings(decode_ms, timings, started)
+    }
+
+
+def segment_task(params, progress):
+    """Предлагаемые границы предложений по паузам - в формате sentences для /split-audio"""
+    physical_path = params['physical_path']
+    language = params['language']
+
+    try:
+        y, sr = _get_task_pcm_cache(params).load(physical_path)
+    except Exception as e:
+        logger.error(f"Ошибка загрузки аудио файла для разметки: {e}")
+        message = f'Cannot load audio file: {str(e)}'
+        raise JobError(message, {'success': False, 'error': message}, 400)
+
+    boundaries = segment_samples(y, sr, params['segment_params'], progress)
+    logger.info(f"Разметка {physical_path}: {len(boundaries)} предложений")
+
+    return {
+        'success': True,
+        'duration': round(len(y) / sr, 3),
+        'sentences': [
+            {'key': f"{index:03d}", 'start_time': start_time, 'end_time': end_time, 'language': language}
+            for index, (start_time, end_time) in enumerate(boundaries)
+        ],
+        'params': params['segment_params']
+    }
+
+
+def _pause_file_frames(item, temp_dir, sample_rate):
+    """Длина паузы в кадрах: длительность указанного файла (fallback_duration, если файла нет)"""
+    duration_file = item.get('duration_file')
+    language = item.get('language', 'en')
+    fallback_duration = item.get('fallback_duration', 1.0)
+
+    if duration_file:
+        file_path = os.path.join(temp_dir, language, duration_file)
+        if os.path.exists(file_path):
+            try:
+                # Длительность - из заголовка, без декодирования файла
+                duration_sec = get_duration(file_path)
+                logger.info(f"Пауза длиной в файл {duration_file}: {duration_sec:.2f}s")
+                return int(duration_sec * sample_rate)
+            except Exception as e:
+                logger.warning(f"Не удалось определить длительность файла для паузы {duration_file}: {e}")
+                # Fallback на 1 секунду
+                return int(sample_rate)
+    return int(fallback_duration * sample_rate)
+
+
+def _mix_plan(file_sequence, temp_dir, sample_rate, pcm_cache, progress):
+    """Части склейки и пик результата до финальной нормализации
+
+    Часть - ('silence', кадров) или ('file', путь, усиление). Файл с пиком
+    больше 1.0 приводится к 1.0 (усиление 1/пик), пики - из кеша PCM.
+    """
+    plan = []
+    peak = 0.0
+    for index, item in enumerate(file_sequence):
+        item_type = item.get('type')
+
+        if item_type == 'pause':
+            plan.append(('silence', int(item.get('duration', 1.0) * sample_rate)))
+
+        elif item_type == 'pause_file':
+            plan.append(('silence', _pause_file_frames(item, temp_dir, sample_rate)))
+
+        elif item_type == 'file' and item.get('filename'):
+            filename = item['filename']
+            file_path = os.path.join(temp_dir, item.get('language', 'en'), filename)
+            if not os.path.exists(file_path):
+                # Пропускаем файл, если не найден
+                logger.warning(f"Файл не найден: {file_path}")
+                continue
+            try:
+                # Сигнал в sample_rate из кеша PCM (при промахе - декодирование и ресемплирование)
+                file_peak = pcm_cache.peak(file_path, sample_rate)
+            except Exception as e:
+                # Пропускаем файл, если не удалось загрузить
+                logger.error(f"Ошибка загрузки файла {file_path}: {e}", exc_info=True)
+                continue
+
+            gain = 1.0
+            if file_peak > 1.0:
+                gain = 1.0 / file_peak
+                logger.warning(f"Нормализация {filename}: max_val={file_peak}")
+            plan.append(('file', file_path, gain))
+            peak = max(peak, file_peak * gain)
+
+        progress((index + 1) / len(file_sequence) * 0.5)
+    return plan, peak
+
+
+def combined_audio_task(params, progress):
+    """Склейка последовательности файлов и пауз в один файл
+
+    Потоковая: усиления считаются заранее по пикам, в выходной файл пишутся
+    блоки по MIX_BLOCK_FRAMES кадров - память не зависит от длины результата.
+    """
+    dictation_id = params['dictation_id']
+    temp_dir = params['temp_dir']
+    file_sequence = params['file_sequence']
+    output_filename = params['output_filename']
+    output_path = os.path.join(temp_dir, output_filename)
+
+    # sample_rate всех файлов из заголовков (берется самый высокий)
+    sample_rates = []
+    for item in file_sequence:
+        if item.get('type') == 'file' and item.get('filename'):
+            file_path = os.path.join(temp_dir, item.get('language', 'en'), item['filename'])
+            if os.path.exists(file_path):
+                try:
+                    sample_rates.append(get_sample_rate(file_path))
+                except Exception as e:
+                    logger.warning(f"Не удалось определить sample_rate для {item['filename']}: {e}")
+
+    sample_rate = max(sample_rates) if sample_rates else DEFAULT_SAMPLE_RATE
+    logger.info(f"Используемый sample_rate для склейки: {sample_rate} Hz")
+
+    pcm_cache = _get_task_pcm_cache(params)
+    plan, peak = _mix_plan(file_sequence, temp_dir, sample_rate, pcm_cache, progress)
+    if not plan:
+        message = 'Не удалось загрузить ни одного аудио сегмента'
+        raise JobError(message, {'success': False, 'error': message}, 400)
+
+    # Финальная нормализация для предотвращения клиппинга
+    final_gain = 1.0
+    if peak > 0.95:
+        final_gain = 0.95 / peak
+        logger.info(f"Применена финальная нормализация: коэффициент {final_gain:.3f}")
+
+    # Пишем во временный файл рядом: недописанный результат не виден по имени
+    output_format = os.path.splitext(output_filename)[1].lstrip('.').upper()
+    tmp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+    silence = numpy.zeros(MIX_BLOCK_FRAMES, dtype=numpy.float32)
+    total_frames = 0
+    try:
+        with sf.SoundFile(tmp_path, 'w', samplerate=sample_rate, channels=1, format=output_format) as output:
+            for index, part in enumerate(plan):
+                if part[0] == 'silence':
+                    remaining = part[1]
+                    while remaining > 0:
+                        block = silence[:min(remaining, MIX_BLOCK_FRAMES)]
+                        output.write(block)
+                        remaining -= len(block)
+                    total_frames += part[1]
+                else:
+                    _, file_path, gain = part
+                    samples, _ = pcm_cache.load(file_path, sr=sample_rate)
+                    for start in range(0, len(samples), MIX_BLOCK_FRAMES):
+                        output.write(samples[start:start + MIX_BLOCK_FRAMES] * (gain * final_gain))
+                    total_frames += len(samples)
+                progress(0.5 + (index + 1) / len(plan) * 0.5)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    logger.info(f"✅ Создан комбинированный аудио файл: {output_filename}, длительность: {total_frames/sample_rate:.2f}s")
+
+    return {
+        'success': True,
+        'filename': output_filename,
+        'filepath': f"/static/data/temp/{dictation_id}/{output_filename}",
+        'message': 'Комбинированный аудио файл успешно создан'
+    }
+
+
+# ==================== ПАКЕТНЫЙ СИНТЕЗ РЕЧИ ====================
+
+# Синтез - сетевое ожидание, поэтому пул потоков (общий для всех пакетов процесса)
+TTS_BATCH_WORKERS = int(os.getenv('TTS_BATCH_WORKERS', '8'))
+
+_tts_executor = None
+_tts_executor_lock = threading.Lock()
+
+# Кеши TTS процесса пула по (папка, квота, движок): у задания нет контекста Flask
+_task_tts_caches = {}
+
+
+def _get_tts_executor():
+    global _tts_executor
+    with _tts_executor_lock:
+        if _tts_executor is None:
+            _tts_executor = ThreadPoolExecutor(max_workers=TTS_BATCH_WORKERS, thread_name_prefix='tts')
+        return _tts_executor
+
+
+def _generate_tts_item(tts_cache, dictation_id, item):
+    """Аудио одного элемента пакета -> результат для ответа"""
+    key = item.get('key')
+    try:
+        audio_dir = os.path.join('static', 'data', 'temp', dictation_id, item['language'])
+        synthesized = tts_cache.synthesize_to(item['text'], item['language'], os.path.join(audio_dir, item['filename_audio']))
+        return {
+            'key': key,
+            'success': True,
+            'filename': item['filename_audio'],
+            'audio_url': f"/static/data/temp/{dictation_id}/{item['language']}/{item['filename_audio']}",
+            'cached': not synthesized
+        }
+    except Exception as e:
+        logger.error(f"Ошибка генерации аудио для {key}: {e}")
+        return {'key': key, 'success': False, 'error': f'Ошибка генерации аудио: {e}'}
+
+
+def generate_tts_batch(tts_cache, dictation_id, items, progress):
+    """Синтезирует элементы параллельно -> тело ответа с результатами в порядке items"""
+    started = time.time()
+    executor = _get_tts_executor()
+    futures = {
+        executor.submit(_generate_tts_item, tts_cache, dictation_id, item): index
+        for index, item in enumerate(items)
+    }
+    results = [None] * len(items)
+    for done_count, future in enumerate(as_completed(futures), 1):
+        results[futures[future]] = future.result()
+        progress(done_count / len(items))
+
+    failed = sum(1 for result in results if not result['success'])
+    cached = sum(1 for result in results if result.get('cached'))
+    logger.info(
+        f"Пакетная генерация аудио {dictation_id}: {len(items)} шт., из кеша {cached}, "
+        f"ошибок {failed}, {time.time() - started:.2f} с"
+    )
+    return {'success': failed == 0, 'results': results}
+
+
+def tts_batch_task(params, progress):
+    """Пакет синтеза в процессе пула: кеш TTS строится по настройкам из params"""
+    cache_key = (params['cache_dir'], params['cache_max_bytes'], params['backend'])
+    tts_cache = _task_tts_caches.get(cache_key)
+    if tts_cache is None:
+        tts_cache = TTSCache(
+            DiskLRUCache(params['cache_dir'], params['cache_max_bytes']), create_tts_backend(params['backend'])
+        )
+        _task_tts_caches[cache_key] = tts_cache
+    return generate_tts_batch(tts_cache, params['dictation_id'], params['items'], progress)
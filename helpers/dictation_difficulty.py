@@ -0,0 +1,260 @@
+"""
+Сложность диктантов по истории всех пользователей (офлайн-агрегация)
+
+Каждая запись statistics_sentenses - одно завершение диктанта с итогами
+perfect / corrected / audio / total_time_ms. CLI-команда
+`flask --app app difficulty-update` собирает их по всем пользователям
+в пуле процессов и пишет компактную таблицу:
+
+    static/data/dictation_difficulty.json
+        {"format": 1, "updated_at": ..., "columns": [...],
+         "dictations": {"<dictation_id>": [значения по columns]}}
+
+Запуск инкрементальный: в dictation_difficulty.state.json лежат вклады
+каждого документа месяца (h_YYYYMM.json) с его mtime/размером, поэтому
+повторно читаются только измененные с прошлого запуска файлы. Итоговая
+таблица пересчитывается из вкладов векторно (NumPy).
+
+Ключи состояния - email пользователей, поэтому оно лежит не в static/
+(раздается как есть), а в instance/ приложения или в DIFFICULTY_STATE_PATH.
+"""
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+from flask import current_app
+
+from helpers.history_log import (
+    compact, get_history_folder, index_month, load_month_file, write_json_atomic
+)
+
+
+DIFFICULTY_TABLE_PATH = os.path.join('static', 'data', 'dictation_difficulty.json')
+DIFFICULTY_STATE_NAME = 'dictation_difficulty.state.json'
+# Прежнее место состояния (публичная папка) - переносится при первом запуске
+LEGACY_DIFFICULTY_STATE_PATH = os.path.join('static', 'data', DIFFICULTY_STATE_NAME)
+DIFFICULTY_FORMAT_VERSION = 1
+
+# Вклад месяца по диктанту: [завершений, perfect, corrected, audio, total_time_ms]
+CONTRIBUTION_FIELDS = ('completions', 'perfect', 'corrected', 'audio', 'total_time_ms')
+
+# Столбцы итоговой таблицы
+DIFFICULTY_COLUMNS = ('completions', 'users', 'error_rate', 'audio_rate', 'avg_time_ms', 'level')
+
+# Уровень (1 - легкий, 2 - средний, 3 - сложный) ставится только при достаточном числе завершений
+MIN_COMPLETIONS_FOR_LEVEL = 3
+
+
+# ==================== СБОР (воркеры пула) ====================
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _month_contribution(raw, email, month):
+    """{dictation_id: [завершений, perfect, corrected, audio, total_time_ms]} документа месяца"""
+    contribution = {}
+    for entry in index_month(raw, email, month)['sentenses'].values():
+        dictation_id = entry.get('dictation_id')
+        if not dictation_id:
+            continue
+        totals = contribution.setdefault(dictation_id, [0] * len(CONTRIBUTION_FIELDS))
+        totals[0] += 1
+        for position, field in enumerate(CONTRIBUTION_FIELDS[1:], start=1):
+            try:
+                totals[position] += int(entry.get(field, 0) or 0)
+            except (TypeError, ValueError):
+                pass
+    return contribution
+
+
+def scan_user(email, known_signatures):
+    """Вклады измененных месяцев пользователя (выполняется в процессе пула)
+
+    known_signatures - {month: [mtime_ns, size]} с прошлого запуска.
+    Возвращает (email, {month: {'signature', 'dictations'}} для измененных,
+    список всех месяцев на диске).
+    """
+    history_folder = get_history_folder(email)
+    if not os.path.isdir(history_folder):
+        return email, {}, []
+
+    # Несвернутые события журнала попадают в документы месяцев
+    compact(email)
+
+    changed = {}
+    months = []
+    for filename in sorted(os.listdir(history_folder)):
+        if not (filename.startswith('h_') and filename.endswith('.json')):
+            continue
+        month = filename[len('h_'):-len('.json')]
+        path = os.path.join(history_folder, filename)
+        try:
+            signature = _file_signature(path)
+        except FileNotFoundError:
+            continue
+        months.append(month)
+        if known_signatures.get(month) == signature:
+            continue
+
+        raw = load_month_file(path)
+        changed[month] = {
+            'signature': signature,
+            'dictations': _month_contribution(raw, email, month) if raw is not None else {}
+        }
+    return email, changed, months
+
+
+# ==================== АГРЕГАЦИЯ ====================
+
+def get_difficulty_state_path():
+    """Файл состояния сбора вне публичной папки"""
+    return os.getenv('DIFFICULTY_STATE_PATH') or os.path.join(current_app.instance_path, DIFFICULTY_STATE_NAME)
+
+
+def _load_state(state_path):
+    for path in (state_path, LEGACY_DIFFICULTY_STATE_PATH):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('format') == DIFFICULTY_FORMAT_VERSION and isinstance(state.get('users'), dict):
+                return state
+        except FileNotFoundError:
+            continue
+        except Exception as e:
+            print(f'❌ [DIFFICULTY] Ошибка чтения {path}: {e}')
+        break
+    return {'format': DIFFICULTY_FORMAT_VERSION, 'users': {}}
+
+
+def build_table(users_state):
+    """Таблица сложности по вкладам всех пользователей (векторно)"""
+    dictation_ids, user_indexes, rows = [], [], []
+    for user_index, months in enumerate(users_state.values()):
+        for month_state in months.values():
+            for dictation_id, totals in month_state['dictations'].items():
+                dictation_ids.append(dictation_id)
+                user_indexes.append(user_index)
+                rows.append(totals)
+
+    if not rows:
+        return {}
+
+    unique_ids, inverse = numpy.unique(numpy.array(dictation_ids), return_inverse=True)
+    sums = numpy.zeros((len(unique_ids), len(CONTRIBUTION_FIELDS)), dtype=numpy.int64)
+    numpy.add.at(sums, inverse, numpy.array(rows, dtype=numpy.int64))
+
+    # Разные пользователи каждого диктанта: уникальные пары (диктант, пользователь)
+    pairs = numpy.unique(numpy.stack([inverse, numpy.array(user_indexes)]), axis=1)
+    users = numpy.bincount(pairs[0], minlength=len(unique_ids))
+
+    completions, perfect, corrected, audio, total_time = sums.T
+    sentences = perfect + corrected
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        # Доля предложений, написанных не с первого раза, и прослушиваний на предложение
+        error_rate = numpy.where(sentences > 0, corrected / sentences, 0.0)
+        audio_rate = numpy.where(sentences > 0, audio / sentences, 0.0)
+        avg_time = numpy.where(completions > 0, total_time / completions, 0.0)
+
+    # Уровень - терциль доли ошибок среди диктантов с достаточным числом завершений
+    levels = numpy.zeros(len(unique_ids), dtype=numpy.int64)
+    rated = completions >= MIN_COMPLETIONS_FOR_LEVEL
+    if rated.any():
+        low, high = numpy.quantile(error_rate[rated], [1 / 3, 2 / 3])
+        levels[rated] = 1 + (error_rate[rated] > low) + (error_rate[rated] > high)
+
+    return {
+        dictation_id: [
+            int(completions[i]), int(users[i]),
+            round(float(error_rate[i]), 4), round(float(audio_rate[i]), 3),
+            int(avg_time[i]), int(levels[i])
+        ]
+        for i, dictation_id in enumerate(unique_ids.tolist())
+    }
+
+
+def update_difficulty(emails, workers=None, state_path=None):
+    """Инкрементальный пересчет таблицы сложности; возвращает (пользователей, измененных месяцев)"""
+    state_path = state_path or get_difficulty_state_path()
+    state = _load_state(state_path)
+    users_state = state['users']
+    emails = list(emails)
+
+    changed_months = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(scan_user, email, {
+                month: month_state['signature']
+                for month, month_state in users_state.get(email, {}).items()
+            })
+            for email in emails
+        ]
+        for future in futures:
+            try:
+                email, changed, months = future.result()
+            except Exception as e:
+                print(f'❌ [DIFFICULTY] Ошибка обработки истории: {e}')
+                continue
+            user_state = {
+                month: month_state for month, month_state in users_state.get(email, {}).items()
+                if month in months
+            }
+            user_state.update(changed)
+            changed_months += len(changed)
+            if user_state:
+                users_state[email] = user_state
+            else:
+                users_state.pop(email, None)
+
+    # Пользователи, которых больше нет
+    for email in set(users_state) - set(emails):
+        del users_state[email]
+
+    os.makedirs(os.path.dirname(DIFFICULTY_TABLE_PATH), exist_ok=True)
+    os.makedirs(os.path.dirname(os.path.abspath(state_path)), exist_ok=True)
+    write_json_atomic(state_path, state)
+    if os.path.exists(LEGACY_DIFFICULTY_STATE_PATH) and os.path.abspath(state_path) != os.path.abspath(LEGACY_DIFFICULTY_STATE_PATH):
+        os.remove(LEGACY_DIFFICULTY_STATE_PATH)
+    write_json_atomic(DIFFICULTY_TABLE_PATH, {
+        'format': DIFFICULTY_FORMAT_VERSION,
+        'updated_at': int(time.time()),
+        'columns': list(DIFFICULTY_COLUMNS),
+        'dictations': build_table(users_state)
+    })
+    return len(users_state), changed_months
+
+
+# ==================== ЧТЕНИЕ ====================
+
+_table_cache = {'signature': None, 'dictations': {}}
+
+
+def load_difficulty_table():
+    """{dictation_id: {completions, users, error_rate, ...}}; перечитывается при изменении файла"""
+    try:
+        signature = _file_signature(DIFFICULTY_TABLE_PATH)
+    except FileNotFoundError:
+        return {}
+
+    if _table_cache['signature'] != signature:
+        try:
+            with open(DIFFICULTY_TABLE_PATH, 'r', encoding='utf-8') as f:
+                table = json.load(f)
+            columns = table.get('columns') or []
+            dictations = {
+                dictation_id: dict(zip(columns, values))
+                for dictation_id, values in (table.get('dictations') or {}).items()
+            }
+        except Exception as e:
+            print(f'❌ [DIFFICULTY] Ошибка чтения {DIFFICULTY_TABLE_PATH}: {e}')
+            return _table_cache['dictations']
+        _table_cache.update(signature=signature, dictations=dictations)
+    return _table_cache['dictations']
+
+
+def get_dictation_difficulty(dictation_id):
+    """Сложность диктанта или None, если данных еще нет"""
+    return load_difficulty_table().get(dictation_id)
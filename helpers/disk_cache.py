@@ -0,0 +1,108 @@
+"""
+Дисковый LRU-кеш с ограничением по размеру
+
+Записи - обычные файлы, имя = хеш ключа. Запись атомарная (временный файл
++ os.replace), поэтому кеш можно разделять между несколькими воркерами.
+Время последнего использования хранится в mtime файла.
+"""
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+
+
+class DiskLRUCache:
+    """LRU-кеш файлов в папке base_dir, общий размер не больше max_bytes"""
+
+    # После вытеснения оставляем запас, чтобы не чистить кеш на каждой записи
+    LOW_WATERMARK = 0.9
+
+    def __init__(self, base_dir, max_bytes):
+        self.base_dir = base_dir
+        self.max_bytes = max_bytes
+        self._approx_size = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts):
+        """Хеш ключа из произвольных частей (id, mtime, параметры...)"""
+        raw = '\x1f'.join(str(part) for part in parts)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def path_for(self, key, ext):
+        """Путь к файлу записи (с разбиением по подпапкам по первым символам хеша)"""
+        return os.path.join(self.base_dir, key[:2], f'{key}.{ext}')
+
+    def get(self, key, ext):
+        """Путь к записи или None; отмечает запись как недавно использованную"""
+        path = self.path_for(key, ext)
+        try:
+            os.utime(path, None)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def store(self, key, ext, write_func):
+        """Создает запись: write_func(tmp_path) пишет содержимое во временный файл"""
+        path = self.path_for(key, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+
+        try:
+            write_func(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self._account(os.path.getsize(path))
+        return path
+
+    def store_file(self, key, ext, source_path):
+        """Создает запись копией существующего файла"""
+        return self.store(key, ext, lambda tmp_path: shutil.copyfile(source_path, tmp_path))
+
+    def _account(self, added_bytes):
+        with self._lock:
+            if self._approx_size is None:
+                self._approx_size = self._scan_size()
+            else:
+                self._approx_size += added_bytes
+
+            if self._approx_size > self.max_bytes:
+                self._approx_size = self.evict()
+
+    def _iter_entries(self):
+        if not os.path.isdir(self.base_dir):
+            return
+        for root, _, files in os.walk(self.base_dir):
+            for filename in files:
+                if filename.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._iter_entries())
+
+    def evict(self):
+        """Удаляет самые давно использованные записи; возвращает новый размер кеша"""
+        entries = sorted(self._iter_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * self.LOW_WATERMARK
+
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                total -= size
+
+        return total
@@ -0,0 +1,371 @@
+"""
+Хранение черновиков диктантов (resume state) в history_dictations/
+
+Черновик на диске:
+    <id>.json или <id>.json.gz - база (компактный JSON; большие - в gzip);
+    <id>.patches               - журнал дельт после базы, строка JSON на
+                                 сохранение: {"version": N, "ops": [...]};
+    drafts.manifest            - сводка по всем черновикам папки
+                                 (date_saved, версия, размер, прогресс), чтобы
+                                 список черновиков не открывал каждый файл.
+
+Автосохранение присылает дельту (JSON Patch: add/replace/remove) к версии,
+которая есть у клиента; на диск дописывается только эта дельта. Когда
+журнал дельт становится больше базы, черновик сворачивается в новую базу.
+"""
+import copy
+import gzip
+import json
+import os
+import threading
+import time
+
+
+DRAFT_EXTENSIONS = ('.json', '.json.gz')
+PATCH_LOG_SUFFIX = '.patches'
+MANIFEST_NAME = 'drafts.manifest'
+MANIFEST_FORMAT_VERSION = 1
+
+# Черновики больше этого размера хранятся сжатыми
+DRAFT_COMPRESS_MIN_BYTES = 16 * 1024
+
+# Журнал дельт сворачивается в базу, когда вырастает больше базы (но не раньше этого размера)
+PATCH_LOG_MIN_COMPACT_BYTES = 8 * 1024
+
+
+class DraftPatchError(ValueError):
+    """Дельта не может быть применена к черновику"""
+
+
+# ==================== JSON PATCH ====================
+
+def _parse_pointer(pointer):
+    """JSON Pointer (RFC 6901) -> список ключей"""
+    if pointer == '':
+        return []
+    if not isinstance(pointer, str) or not pointer.startswith('/'):
+        raise DraftPatchError(f'Некорректный путь: {pointer}')
+    return [part.replace('~1', '/').replace('~0', '~') for part in pointer[1:].split('/')]
+
+
+def _resolve_parent(document, parts):
+    parent = document
+    for part in parts[:-1]:
+        if isinstance(parent, dict) and part in parent:
+            parent = parent[part]
+        elif isinstance(parent, list) and part.isdigit() and int(part) < len(parent):
+            parent = parent[int(part)]
+        else:
+            raise DraftPatchError(f'Путь не найден: /{"/".join(parts)}')
+    return parent
+
+
+def apply_patch(state, ops):
+    """Применяет операции add/replace/remove (RFC 6902) к копии state"""
+    if not isinstance(ops, list):
+        raise DraftPatchError('Дельта должна быть списком операций')
+
+    document = copy.deepcopy(state)
+    for op in ops:
+        if not isinstance(op, dict) or op.get('op') not in ('add', 'replace', 'remove'):
+            raise DraftPatchError(f'Неподдерживаемая операция: {op}')
+
+        parts = _parse_pointer(op.get('path'))
+        if not parts:
+            if op['op'] == 'remove' or not isinstance(op.get('value'), dict):
+                raise DraftPatchError('Корень черновика можно только заменить объектом')
+            document = copy.deepcopy(op['value'])
+            continue
+
+        parent = _resolve_parent(document, parts)
+        key = parts[-1]
+
+        if isinstance(parent, dict):
+            if op['op'] == 'remove':
+                if key not in parent:
+                    raise DraftPatchError(f'Путь не найден: {op["path"]}')
+                del parent[key]
+            else:
+                parent[key] = copy.deepcopy(op.get('value'))
+        elif isinstance(parent, list):
+            if key == '-' and op['op'] == 'add':
+                parent.append(copy.deepcopy(op.get('value')))
+                continue
+            if not key.isdigit() or int(key) > len(parent) or (op['op'] != 'add' and int(key) == len(parent)):
+                raise DraftPatchError(f'Некорректный индекс: {op["path"]}')
+            index = int(key)
+            if op['op'] == 'add':
+                parent.insert(index, copy.deepcopy(op.get('value')))
+            elif op['op'] == 'replace':
+                parent[index] = copy.deepcopy(op.get('value'))
+            else:
+                del parent[index]
+        else:
+            raise DraftPatchError(f'Путь не найден: {op["path"]}')
+
+    return document
+
+
+# ==================== ВЕРСИИ ====================
+
+def get_version(state):
+    """Версия черновика (0 - черновик в старом формате, без версии)"""
+    try:
+        return int(state.get('version', 0))
+    except (TypeError, ValueError, AttributeError):
+        return 0
+
+
+def new_version():
+    """Начальная версия нового черновика: миллисекунды, чтобы после удаления
+    и повторного создания версии (и ETag) не повторялись"""
+    return time.time_ns() // 1_000_000
+
+
+# ==================== ФАЙЛЫ ====================
+
+def get_base_path(folder, dictation_id, compressed):
+    return os.path.join(folder, f'{dictation_id}{".json.gz" if compressed else ".json"}')
+
+
+def get_patch_log_path(folder, dictation_id):
+    return os.path.join(folder, f'{dictation_id}{PATCH_LOG_SUFFIX}')
+
+
+def _find_base(folder, dictation_id):
+    for compressed in (True, False):
+        path = get_base_path(folder, dictation_id, compressed)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def list_draft_ids(folder):
+    """id всех черновиков папки"""
+    if not os.path.isdir(folder):
+        return []
+    ids = set()
+    for filename in os.listdir(folder):
+        for extension in DRAFT_EXTENSIONS:
+            if filename.endswith(extension):
+                ids.add(filename[:-len(extension)])
+                break
+    return sorted(ids)
+
+
+def _read_base(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _read_patch_log(path):
+    entries = []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Неполная последняя строка после сбоя
+                    print(f'⚠️ [DRAFTS] Пропущена поврежденная строка {path}')
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def read_draft(folder, dictation_id):
+    """Черновик с диска: база + дельты журнала (None, если черновика нет)"""
+    base_path = _find_base(folder, dictation_id)
+    if base_path is None:
+        return None
+
+    state = _read_base(base_path)
+    for entry in _read_patch_log(get_patch_log_path(folder, dictation_id)):
+        # Дельты, уже вошедшие в базу (сбой между записью базы и удалением журнала)
+        if entry.get('version', 0) <= get_version(state):
+            continue
+        try:
+            state = apply_patch(state, entry.get('ops'))
+        except DraftPatchError as e:
+            print(f'❌ [DRAFTS] Ошибка применения дельты {dictation_id}: {e}')
+            break
+    return state
+
+
+def write_draft(folder, dictation_id, state):
+    """Записывает черновик новой базой (атомарно) и удаляет журнал дельт; возвращает размер"""
+    os.makedirs(folder, exist_ok=True)
+    data = json.dumps(state, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    compressed = len(data) >= DRAFT_COMPRESS_MIN_BYTES
+    if compressed:
+        data = gzip.compress(data, compresslevel=6)
+
+    path = get_base_path(folder, dictation_id, compressed)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+    _remove(get_base_path(folder, dictation_id, not compressed))
+    _remove(get_patch_log_path(folder, dictation_id))
+    return len(data)
+
+
+def append_draft_patches(folder, dictation_id, entries):
+    """Дописывает дельты [{"version": N, "ops": [...]}] в журнал; при росте сворачивает"""
+    base_path = _find_base(folder, dictation_id)
+    if base_path is None:
+        raise DraftPatchError(f'Черновик {dictation_id} не найден')
+
+    log_path = get_patch_log_path(folder, dictation_id)
+    data = ''.join(
+        json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n' for entry in entries
+    ).encode('utf-8')
+    with open(log_path, 'ab') as f:
+        f.write(data)
+        log_size = f.tell()
+
+    if log_size >= max(PATCH_LOG_MIN_COMPACT_BYTES, os.path.getsize(base_path)):
+        compact_draft(folder, dictation_id)
+
+
+def compact_draft(folder, dictation_id):
+    """Сворачивает базу и журнал дельт в новую базу"""
+    state = read_draft(folder, dictation_id)
+    if state is not None:
+        write_draft(folder, dictation_id, state)
+
+
+def delete_draft_files(folder, dictation_id):
+    for compressed in (True, False):
+        _remove(get_base_path(folder, dictation_id, compressed))
+    _remove(get_patch_log_path(folder, dictation_id))
+
+
+# ==================== МАНИФЕСТ ====================
+
+_manifest_lock = threading.Lock()
+
+
+def get_manifest_path(folder):
+    return os.path.join(folder, MANIFEST_NAME)
+
+
+def draft_summary(state):
+    """Прогресс черновика для списка: общие счетчики + счетчики по предложениям"""
+    def to_number(value):
+        try:
+            return int(value or 0)
+        except (TypeError, ValueError):
+            return 0
+
+    per_sentence = state.get('per_sentence') or {}
+    summary = {
+        'perfect': to_number(state.get('number_of_perfect')),
+        'corrected': to_number(state.get('number_of_corrected')),
+        'audio': to_number(state.get('number_of_audio')),
+        'sentences': len(per_sentence),
+        'current_index': to_number(state.get('current_index'))
+    }
+    for sentence in per_sentence.values():
+        if not isinstance(sentence, dict):
+            continue
+        for counter in ('perfect', 'corrected', 'audio'):
+            summary[counter] += (
+                to_number(sentence.get(f'number_of_{counter}'))
+                + to_number(sentence.get(f'circle_number_of_{counter}'))
+            )
+    return summary
+
+
+def manifest_entry(state, size):
+    return {
+        'date_saved': state.get('date_saved', 0),
+        'version': get_version(state),
+        'size': size,
+        'summary': draft_summary(state)
+    }
+
+
+def get_draft_size(folder, dictation_id):
+    """Размер черновика на диске: база + журнал дельт"""
+    size = 0
+    for path in (_find_base(folder, dictation_id), get_patch_log_path(folder, dictation_id)):
+        if path and os.path.exists(path):
+            size += os.path.getsize(path)
+    return size
+
+
+def _write_manifest(folder, drafts):
+    os.makedirs(folder, exist_ok=True)
+    path = get_manifest_path(folder)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'format': MANIFEST_FORMAT_VERSION, 'drafts': drafts}, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def _rebuild_manifest(folder):
+    """Манифест по самим черновикам (однократно для папок без манифеста)"""
+    drafts = {}
+    for dictation_id in list_draft_ids(folder):
+        try:
+            state = read_draft(folder, dictation_id)
+        except Exception as e:
+            print(f'❌ [DRAFTS] Ошибка чтения черновика {dictation_id}: {e}')
+            continue
+        if state is not None:
+            drafts[dictation_id] = manifest_entry(state, get_draft_size(folder, dictation_id))
+    if drafts or os.path.isdir(folder):
+        _write_manifest(folder, drafts)
+    return drafts
+
+
+def _load_manifest(folder):
+    try:
+        with open(get_manifest_path(folder), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('format') == MANIFEST_FORMAT_VERSION and isinstance(data.get('drafts'), dict):
+            return data['drafts']
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f'❌ [DRAFTS] Ошибка чтения манифеста {folder}: {e}')
+    return None
+
+
+def read_manifest(folder):
+    """{dictation_id: {date_saved, version, size, summary}} всех черновиков папки"""
+    with _manifest_lock:
+        drafts = _load_manifest(folder)
+        if drafts is None:
+            drafts = _rebuild_manifest(folder) if os.path.isdir(folder) else {}
+        return drafts
+
+
+def update_manifest(folder, changes):
+    """Обновляет манифест после записи черновиков: changes = {id: состояние или None (удален)}"""
+    with _manifest_lock:
+        drafts = _load_manifest(folder)
+        if drafts is None:
+            # Черновики уже записаны - манифест строится по ним целиком
+            _rebuild_manifest(folder)
+            return
+
+        for dictation_id, state in changes.items():
+            if state is None:
+                drafts.pop(dictation_id, None)
+            else:
+                drafts[dictation_id] = manifest_entry(state, get_draft_size(folder, dictation_id))
+        _write_manifest(folder, drafts)
@@ -0,0 +1,106 @@
+"""
+Микро-замеры хранилища истории (helpers.history_log)
+
+    python -m helpers.history_bench [--months 12] [--events 2000]
+
+Работает во временной папке (текущий каталог меняется на нее), данные
+пользователей не затрагиваются. Печатает время операций: дозапись
+событий, чтение месяца без кэша и с кэшем, чтение при растущем журнале,
+список месяцев и сворачивание журнала.
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from helpers import history_log
+from helpers.history_log import (
+    append_events, clear_read_cache, compact, day_stats_event,
+    list_months, month_merge_event, read_month
+)
+
+
+BENCH_EMAIL = 'bench@example.com'
+
+
+def _timed(label, func, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f'{label:<44} {elapsed * 1000:10.3f} мс')
+    return result
+
+
+def _random_events(months, count):
+    events = []
+    for _ in range(count):
+        month = random.choice(months)
+        date_key = month * 100 + random.randint(1, 28)
+        if random.random() < 0.8:
+            events.append(day_stats_event(month, {
+                'date': date_key,
+                'perfect': random.randint(0, 5),
+                'corrected': random.randint(0, 5),
+                'audio': random.randint(0, 5)
+            }))
+        else:
+            events.append(month_merge_event(month, {'statistics_sentenses': [{
+                'date': date_key,
+                'dictation_id': f'dicta_{random.randint(1, 200)}',
+                'perfect': random.randint(0, 20),
+                'corrected': random.randint(0, 20),
+                'total_time_ms': random.randint(10_000, 600_000)
+            }]}))
+    return events
+
+
+def run(months_count, events_count):
+    months = [(2024 + index // 12) * 100 + index % 12 + 1 for index in range(months_count)]
+    events = _random_events(months, events_count)
+    month = months[-1]
+
+    print(f'Месяцев: {len(months)}, событий: {events_count}, HISTORY_DURABILITY={history_log.HISTORY_DURABILITY}')
+
+    _timed('append_events: по одному событию', lambda: [append_events(BENCH_EMAIL, [e]) for e in events[:200]])
+    _timed('append_events: пакет остальных событий', lambda: append_events(BENCH_EMAIL, events[200:]))
+
+    clear_read_cache()
+    _timed('read_month: журнал без кэша', lambda: read_month(BENCH_EMAIL, month))
+    _timed('read_month: журнал из кэша', lambda: read_month(BENCH_EMAIL, month), repeat=20)
+
+    _timed('compact: сворачивание журнала', lambda: compact(BENCH_EMAIL))
+
+    clear_read_cache()
+    _timed('read_month: документ без кэша', lambda: read_month(BENCH_EMAIL, month))
+    _timed('read_month: документ из кэша', lambda: read_month(BENCH_EMAIL, month), repeat=20)
+
+    def append_and_read():
+        append_events(BENCH_EMAIL, _random_events([month], 1))
+        return read_month(BENCH_EMAIL, month)
+
+    _timed('append + read_month (дочитывается хвост)', append_and_read, repeat=50)
+    _timed('list_months', lambda: list_months(BENCH_EMAIL), repeat=20)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--events', type=int, default=2000)
+    args = parser.parse_args()
+
+    previous_dir = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix='history_bench_')
+    try:
+        # Папки пользователей задаются относительно текущего каталога
+        os.chdir(work_dir)
+        run(max(args.months, 1), max(args.events, 201))
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,368 @@
+"""
+Колоночное хранилище истории активности (NumPy, по годам)
+
+history/columns/YYYY.npy - массив int64 формы (367, 4):
+    строки 0..365 - дни года (индекс = день года - 1),
+    столбцы       - active (0/1), perfect, corrected, audio;
+    строка 366    - служебная: [версия формата, log_generation, 0, 0].
+
+Файлы открываются через np.load(mmap_mode='r'): дашборд за несколько лет
+читает несколько маленьких файлов фиксированного размера вместо десятков
+JSON-документов месяцев, а агрегаты считаются векторно.
+
+Как и rollups.json, файлы обновляются компактором журнала для свернутых
+месяцев (только если HISTORY_ANALYTICS_STORE='columns'); несвернутые
+события журнала накладываются при чтении.
+"""
+import os
+import shutil
+from datetime import date
+from functools import lru_cache
+
+import numpy
+
+from helpers.history_log import (
+    COMPACT_LOCK_NAME, DAY_COUNTERS,
+    file_lock, get_history_folder, get_month_filename, index_month, load_month_file, pending_events
+)
+from helpers.history_rollups import (
+    date_key_to_date, drop_rollups, ensure_rollups, period_bounds, period_key, read_rollups, update_rollups
+)
+
+
+COLUMNS_FOLDER = 'columns'
+COLUMNS_FORMAT_VERSION = 1
+
+COLUMNS = ('active',) + DAY_COUNTERS
+DAYS_IN_YEAR_MAX = 366
+META_ROW = DAYS_IN_YEAR_MAX
+YEAR_SHAPE = (DAYS_IN_YEAR_MAX + 1, len(COLUMNS))
+
+# Хранилище для отчетов: 'rollups' (rollups.json) или 'columns' (этот модуль)
+HISTORY_ANALYTICS_STORE = os.getenv('HISTORY_ANALYTICS_STORE', 'rollups')
+
+
+# ==================== КАЛЕНДАРЬ ====================
+
+def day_index(date_key):
+    """Индекс строки дня в массиве года"""
+    return date_key_to_date(date_key).timetuple().tm_yday - 1
+
+
+@lru_cache(maxsize=64)
+def year_calendar(year):
+    """Даты (YYYYMMDD) всех строк-дней года; для невисокосного года последняя - 0"""
+    first = date(year, 1, 1).toordinal()
+    last = date(year, 12, 31).toordinal()
+    keys = numpy.zeros(DAYS_IN_YEAR_MAX, dtype=numpy.int64)
+    for ordinal in range(first, last + 1):
+        value = date.fromordinal(ordinal)
+        keys[ordinal - first] = value.year * 10000 + value.month * 100 + value.day
+    keys.flags.writeable = False
+    return keys
+
+
+@lru_cache(maxsize=64)
+def year_period_keys(year, period):
+    """Ключ периода (неделя/месяц/год) для каждой строки-дня года"""
+    return tuple(period_key(key, period) if key else '' for key in year_calendar(year))
+
+
+# ==================== ФАЙЛЫ ====================
+
+def get_columns_folder(history_folder):
+    return os.path.join(history_folder, COLUMNS_FOLDER)
+
+
+def get_year_path(history_folder, year):
+    return os.path.join(get_columns_folder(history_folder), f'{year}.npy')
+
+
+def empty_year():
+    array = numpy.zeros(YEAR_SHAPE, dtype=numpy.int64)
+    array[META_ROW, 0] = COLUMNS_FORMAT_VERSION
+    return array
+
+
+def load_year(history_folder, year, mmap=True):
+    """Массив года (только чтение через mmap) или None"""
+    path = get_year_path(history_folder, year)
+    try:
+        array = numpy.load(path, mmap_mode='r' if mmap else None)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f'❌ [HISTORY_COLUMNS] Ошибка чтения {path}: {e}')
+        return None
+
+    if array.shape != YEAR_SHAPE or array[META_ROW, 0] != COLUMNS_FORMAT_VERSION:
+        print(f'⚠️ [HISTORY_COLUMNS] Неизвестный формат {path}')
+        return None
+    return array
+
+
+def save_year(history_folder, year, array):
+    """Атомарная запись массива года: временный файл + fsync + os.replace"""
+    path = get_year_path(history_folder, year)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        numpy.save(f, numpy.ascontiguousarray(array, dtype=numpy.int64))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def list_years(history_folder):
+    folder = get_columns_folder(history_folder)
+    if not os.path.isdir(folder):
+        return []
+    return sorted(
+        int(filename[:-len('.npy')]) for filename in os.listdir(folder)
+        if filename.endswith('.npy') and filename[:-len('.npy')].isdigit()
+    )
+
+
+# ==================== ИЗМЕНЕНИЯ ====================
+
+def _fill_month(array, month, days):
+    """Заменяет строки месяца в массиве года данными days (записи statistics)"""
+    first, last = period_bounds(str(month), 'month')
+    array[day_index(first):day_index(last) + 1, :] = 0
+
+    for stat in days:
+        if not isinstance(stat, dict) or not stat.get('date'):
+            continue
+        date_key = int(stat['date'])
+        if not first <= date_key <= last:
+            continue
+        row = array[day_index(date_key)]
+        row[0] = 1
+        for position, counter in enumerate(DAY_COUNTERS, start=1):
+            row[position] += int(stat.get(counter, 0) or 0)
+
+
+def _add_day(array, stats):
+    row = array[day_index(stats['date'])]
+    row[0] = 1
+    for position, counter in enumerate(DAY_COUNTERS, start=1):
+        row[position] += int(stats.get(counter, 0) or 0)
+
+
+def _apply_event(arrays, history_folder, event):
+    """Применяет событие журнала к массивам лет (копиям в памяти)"""
+    event_type = event.get('type')
+    if event_type == 'day_stats':
+        stats = event.get('stats') or {}
+        if not stats.get('date'):
+            return
+        year = int(stats['date']) // 10000
+        _add_day(_writable_year(arrays, history_folder, year), stats)
+    elif event_type == 'month_merge' and 'statistics' in event and event.get('month'):
+        year = int(event['month']) // 100
+        _fill_month(_writable_year(arrays, history_folder, year), event['month'], event['statistics'])
+
+
+def _writable_year(arrays, history_folder, year):
+    """Массив года для изменения: mmap (только чтение) копируется в память"""
+    array = arrays.get(year)
+    if array is None:
+        array = load_year(history_folder, year, mmap=False)
+        if array is None:
+            array = empty_year()
+    elif not array.flags.writeable:
+        array = numpy.array(array)
+    arrays[year] = array
+    return array
+
+
+def update_columns(email, history_folder, months, generation):
+    """Вызывается компактором под его блокировкой после записи документов месяцев"""
+    if not list_years(history_folder):
+        _build_from_months(email, history_folder, generation)
+        return
+
+    months_by_year = {}
+    for month in months:
+        months_by_year.setdefault(int(month) // 100, []).append(month)
+
+    for year, year_months in months_by_year.items():
+        array = load_year(history_folder, year, mmap=False)
+        if array is None:
+            array = empty_year()
+        for month in year_months:
+            raw = load_month_file(os.path.join(history_folder, get_month_filename(month)))
+            days = index_month(raw, email, month)['days'].values() if raw is not None else []
+            _fill_month(array, month, days)
+        array[META_ROW, 1] = max(int(array[META_ROW, 1]), generation)
+        save_year(history_folder, year, array)
+
+
+def _build_from_months(email, history_folder, generation=None):
+    """Массивы всех лет по документам месяцев на диске
+
+    generation=None - последний журнал, уже свернутый в документы месяцев.
+    """
+    arrays = {}
+    folded_generation = 0
+    for filename in sorted(os.listdir(history_folder)):
+        if filename.startswith('h_') and filename.endswith('.json'):
+            month = filename[len('h_'):-len('.json')]
+            raw = load_month_file(os.path.join(history_folder, filename))
+            if raw is not None:
+                year = int(month) // 100
+                array = arrays.setdefault(year, empty_year())
+                indexed = index_month(raw, email, month)
+                _fill_month(array, month, indexed['days'].values())
+                folded_generation = max(folded_generation, indexed.get('log_generation', 0))
+    if generation is None:
+        generation = folded_generation
+
+    for year, array in arrays.items():
+        array[META_ROW, 1] = generation
+        save_year(history_folder, year, array)
+
+
+def drop_columns(history_folder):
+    """Удаляет колоночные файлы: отчеты строятся по rollups.json, файлы больше не обновляются"""
+    shutil.rmtree(get_columns_folder(history_folder), ignore_errors=True)
+
+
+def ensure_columns(email):
+    """Создает колоночные файлы для пользователя, у которого их еще нет
+
+    Строятся по документам месяцев без сворачивания журнала: несвернутые
+    события накладываются при чтении.
+    """
+    history_folder = get_history_folder(email)
+    if not os.path.isdir(history_folder) or list_years(history_folder):
+        return
+
+    with file_lock(os.path.join(history_folder, COMPACT_LOCK_NAME), exclusive=True):
+        if not list_years(history_folder):
+            _build_from_months(email, history_folder)
+
+
+# ==================== ЗАПРОСЫ ====================
+
+class HistoryColumns:
+    """Массивы лет пользователя; тот же интерфейс запросов, что у HistoryRollups"""
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+
+    def _year_slices(self, start_date, end_date):
+        """(год, массив, срез строк) для всех лет диапазона, где есть данные"""
+        start_date, end_date = int(start_date), int(end_date)
+        for year in sorted(self.arrays):
+            if year < start_date // 10000 or year > end_date // 10000:
+                continue
+            calendar_keys = year_calendar(year)
+            left = int(numpy.searchsorted(calendar_keys[calendar_keys > 0], start_date, side='left'))
+            right = int(numpy.searchsorted(calendar_keys[calendar_keys > 0], end_date, side='right'))
+            if left < right:
+                yield year, self.arrays[year], slice(left, right)
+
+    def days(self, start_date, end_date):
+        """Записи статистики по дням за период, отсортированные по дате"""
+        result = []
+        for year, array, rows in self._year_slices(start_date, end_date):
+            block = array[rows]
+            active = numpy.flatnonzero(block[:, 0])
+            dates = year_calendar(year)[rows][active]
+            counters = block[active, 1:]
+            for date_key, values in zip(dates.tolist(), counters.tolist()):
+                entry = {'date': date_key}
+                entry.update(zip(DAY_COUNTERS, values))
+                result.append(entry)
+        return result
+
+    def totals(self, start_date, end_date, period=None):
+        """Итоги за период (см. HistoryRollups.totals): суммы по столбцам NumPy"""
+        if period is None:
+            total = numpy.zeros(len(COLUMNS), dtype=numpy.int64)
+            for _, array, rows in self._year_slices(start_date, end_date):
+                total += array[rows].sum(axis=0)
+            return self._totals_dict(total.tolist())
+
+        grouped = {}
+        for year, array, rows in self._year_slices(start_date, end_date):
+            block = array[rows]
+            active = numpy.flatnonzero(block[:, 0])
+            if not len(active):
+                continue
+            keys = numpy.array(year_period_keys(year, period)[rows])[active]
+            unique_keys, inverse = numpy.unique(keys, return_inverse=True)
+            sums = numpy.zeros((len(unique_keys), len(COLUMNS)), dtype=numpy.int64)
+            numpy.add.at(sums, inverse, block[active])
+            for key, values in zip(unique_keys.tolist(), sums.tolist()):
+                # Неделя может начинаться в одном году, а заканчиваться в другом
+                previous = grouped.get(key)
+                grouped[key] = values if previous is None else [a + b for a, b in zip(previous, values)]
+
+        return [dict(self._totals_dict(grouped[key]), period=key) for key in sorted(grouped)]
+
+    @staticmethod
+    def _totals_dict(values):
+        active_days, *counters = values
+        totals = dict(zip(DAY_COUNTERS, counters))
+        totals['active_days'] = active_days
+        return totals
+
+
+def read_columns(email):
+    """Колоночное хранилище пользователя с учетом несвернутых событий журнала"""
+    history_folder = get_history_folder(email)
+    ensure_columns(email)
+
+    arrays = {}
+    for year in list_years(history_folder):
+        array = load_year(history_folder, year)
+        if array is not None:
+            arrays[year] = array
+
+    for generation, event in pending_events(history_folder):
+        if generation is not None:
+            year = _event_year(event)
+            array = arrays.get(year)
+            if array is not None and generation <= array[META_ROW, 1]:
+                continue
+        _apply_event(arrays, history_folder, event)
+
+    return HistoryColumns(arrays)
+
+
+def _event_year(event):
+    if event.get('type') == 'day_stats':
+        date_key = (event.get('stats') or {}).get('date')
+        return int(date_key) // 10000 if date_key else None
+    return int(event['month']) // 100 if event.get('month') else None
+
+
+def read_history_analytics(email):
+    """Хранилище для отчетов по настройке HISTORY_ANALYTICS_STORE"""
+    if HISTORY_ANALYTICS_STORE == 'columns':
+        return read_columns(email)
+    return read_rollups(email)
+
+
+def ensure_history_analytics(email):
+    """Создает хранилище HISTORY_ANALYTICS_STORE (после смены настройки - flask history-migrate)"""
+    if HISTORY_ANALYTICS_STORE == 'columns':
+        ensure_columns(email)
+    else:
+        ensure_rollups(email)
+
+
+def update_history_analytics(email, history_folder, months, generation):
+    """Вызывается компактором: обновляется только хранилище из настройки
+
+    Файлы другого хранилища удаляются - иначе после смены настройки
+    читались бы устаревшие итоги; при чтении оно построится заново.
+    """
+    if HISTORY_ANALYTICS_STORE == 'columns':
+        update_columns(email, history_folder, months, generation)
+        drop_rollups(history_folder)
+    else:
+        update_rollups(email, history_folder, months, generation)
+        drop_columns(history_folder)
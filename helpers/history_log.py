@@ -0,0 +1,724 @@
+"""
+Журнал событий истории активности пользователя (append-only) и компактор
+
+Каждое сохранение истории - одна строка JSON в history/events.log
+(O(1), без чтения и перезаписи h_YYYYMM.json). Компактор сворачивает
+накопленные события в документы месяцев h_YYYYMM.json (атомарно:
+временный файл + rename). Чтение видит документ месяца плюс еще не
+свернутые события, поэтому данные доступны сразу после сохранения.
+
+Несколько воркеров: дозапись строк идет под разделяемой блокировкой
+(flock LOCK_SH), переименование журнала компактором - под эксклюзивной,
+поэтому ни одно событие не теряется между чтением и удалением журнала.
+
+Это единственное хранилище истории: blueprints statistics и user читают
+и пишут h_YYYYMM.json только через функции этого модуля (запись - через
+helpers.write_behind). Кэш чтения, блокировки и атомарная запись - здесь;
+замеры - python -m helpers.history_bench.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+
+from helpers.user_helpers import get_user_folder
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировки только внутри процесса
+    fcntl = None
+
+
+HISTORY_LOG_NAME = 'events.log'
+COMPACTING_SUFFIX = '.compacting'
+APPEND_LOCK_NAME = '.events.lock'
+COMPACT_LOCK_NAME = '.compact.lock'
+
+# Журнал сворачивается, когда вырастает больше этого размера
+COMPACT_THRESHOLD_BYTES = 64 * 1024
+
+# Режим долговечности записи событий:
+#   'always' - fsync после каждой строки
+#   'batch'  - fsync фоновым потоком раз в FSYNC_INTERVAL секунд
+#   'none'   - без fsync (решает ОС)
+HISTORY_DURABILITY = os.getenv('HISTORY_DURABILITY', 'batch')
+FSYNC_INTERVAL = 1.0
+
+# Сколько разобранных документов месяцев и журналов держит кэш чтения процесса
+HISTORY_CACHE_SIZE = int(os.getenv('HISTORY_CACHE_SIZE', '256'))
+
+# Поля, которые не хранятся в "statistics" (остаются только в "statistics_sentenses")
+DAY_STATS_EXCLUDED_FIELDS = ('end', 'id_diktation', 'number', 'total')
+
+_process_lock = threading.RLock()
+
+_pending_sources = []
+
+
+# ==================== ПУТИ ====================
+
+def get_history_folder(email):
+    """Путь к папке history пользователя"""
+    return os.path.join(get_user_folder(email), 'history')
+
+
+def get_month_filename(month):
+    """Имя файла истории для месяца (month в формате 202511)"""
+    return f'h_{month}.json'
+
+
+def get_month_path(email, month):
+    return os.path.join(get_history_folder(email), get_month_filename(month))
+
+
+def empty_month(email, month):
+    """Пустой документ месяца"""
+    return {
+        'id_user': email,
+        'month': int(month),
+        'statistics': [],
+        'statistics_sentenses': []
+    }
+
+
+# ==================== БЛОКИРОВКИ ====================
+
+@contextmanager
+def file_lock(path, exclusive, blocking=True):
+    """Межпроцессная блокировка на файле (flock); отдает True, если захвачена"""
+    if fcntl is None:
+        acquired = _process_lock.acquire(blocking)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                _process_lock.release()
+        return
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        flags = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(fd, flags)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+# ==================== ПАКЕТНЫЙ FSYNC ====================
+
+class _FsyncBatcher:
+    """Фоновый поток, который раз в interval секунд делает fsync измененных журналов"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def mark(self, path):
+        with self._lock:
+            self._pending.add(path)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='history-fsync', daemon=True)
+                self._thread.start()
+
+    def flush(self):
+        with self._lock:
+            paths, self._pending = self._pending, set()
+        for path in paths:
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+            except FileNotFoundError:
+                # Журнал уже свернут компактором (он делает fsync сам)
+                continue
+            try:
+                os.fsync(fd)
+            except OSError as e:
+                print(f'❌ [HISTORY_LOG] Ошибка fsync {path}: {e}')
+            finally:
+                os.close(fd)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+
+_fsync_batcher = _FsyncBatcher(FSYNC_INTERVAL)
+
+
+def flush_pending_fsync():
+    """Принудительный fsync всех журналов (например, при остановке воркера)"""
+    _fsync_batcher.flush()
+
+
+# ==================== ЗАПИСЬ СОБЫТИЙ ====================
+
+def append_events(email, events):
+    """Дописывает события в журнал пользователя одной записью (строка JSON на событие)"""
+    if not events:
+        return
+
+    history_folder = get_history_folder(email)
+    os.makedirs(history_folder, exist_ok=True)
+    log_path = os.path.join(history_folder, HISTORY_LOG_NAME)
+
+    now = time.time()
+    lines = []
+    for event in events:
+        event = dict(event)
+        event.setdefault('ts', now)
+        lines.append(json.dumps(event, ensure_ascii=False, separators=(',', ':')) + '\n')
+    data = ''.join(lines).encode('utf-8')
+
+    with file_lock(os.path.join(history_folder, APPEND_LOCK_NAME), exclusive=False):
+        fd = os.open(log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            if HISTORY_DURABILITY == 'always':
+                os.fsync(fd)
+            log_size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+
+    if HISTORY_DURABILITY == 'batch':
+        _fsync_batcher.mark(log_path)
+
+    if log_size >= COMPACT_THRESHOLD_BYTES:
+        # Сворачиваем журнал, если этим сейчас не занят другой воркер
+        compact(email, blocking=False)
+
+
+def append_event(email, event):
+    """Дописывает одно событие в журнал пользователя"""
+    append_events(email, [event])
+
+
+def day_stats_event(month, statistics):
+    """Событие из /api/statistics/history/save: приращения за день"""
+    return {'type': 'day_stats', 'month': int(month), 'stats': statistics}
+
+
+def month_merge_event(month, incoming_data):
+    """Событие из /user/api/history/<month>: слияние данных месяца"""
+    event = {'type': 'month_merge', 'month': int(month)}
+    if isinstance(incoming_data.get('statistics'), list):
+        event['statistics'] = incoming_data['statistics']
+    if isinstance(incoming_data.get('statistics_sentenses'), list):
+        event['statistics_sentenses'] = incoming_data['statistics_sentenses']
+    return event
+
+
+def coalesce_events(events):
+    """Схлопывает события пакета без изменения результата применения
+
+    - day_stats за один день складываются в одно событие;
+    - statistics_sentenses без statistics объединяются в одно событие на месяц;
+    - month_merge со statistics (замена дней месяца) отсекает предыдущие
+      приращения этого месяца от последующих.
+    """
+    result = []
+    day_positions = {}
+    sentense_positions = {}
+
+    for event in events:
+        month = event.get('month')
+        if event.get('type') == 'day_stats':
+            stats = event.get('stats') or {}
+            key = (month, stats.get('date'))
+            position = day_positions.get(key)
+            if position is None:
+                day_positions[key] = len(result)
+                result.append({'type': 'day_stats', 'month': month, 'stats': dict(stats)})
+            else:
+                merged = result[position]['stats']
+                for counter in DAY_COUNTERS:
+                    merged[counter] = int(merged.get(counter, 0) or 0) + int(stats.get(counter, 0) or 0)
+            continue
+
+        if event.get('type') == 'month_merge' and 'statistics' not in event:
+            position = sentense_positions.get(month)
+            if position is None:
+                sentense_positions[month] = len(result)
+                result.append({'type': 'month_merge', 'month': month, 'statistics_sentenses': []})
+                position = sentense_positions[month]
+            result[position]['statistics_sentenses'].extend(event.get('statistics_sentenses', []))
+            continue
+
+        # Замена statistics месяца: дальнейшие события месяца идут после нее
+        for key in [key for key in day_positions if key[0] == month]:
+            del day_positions[key]
+        sentense_positions.pop(month, None)
+        result.append(event)
+
+    return result
+
+
+# ==================== ФОРМАТ МЕСЯЦА ====================
+# На диске (format 2) данные месяца хранятся словарями:
+#   "days":      {"YYYYMMDD": запись statistics за день}
+#   "sentenses": {"<dictation_id>|YYYYMMDD": запись statistics_sentenses}
+# Поиск и upsert - O(1) на входящую запись. API по-прежнему отдает списки
+# statistics / statistics_sentenses (см. month_to_api).
+
+MONTH_FORMAT_VERSION = 2
+
+# Счетчики, которые суммируются при слиянии записей за один день
+DAY_COUNTERS = ('perfect', 'corrected', 'audio')
+
+
+def _sum_counters(existing, incoming):
+    """Новая запись дня: existing + счетчики incoming"""
+    merged = existing.copy()
+    for counter in DAY_COUNTERS:
+        merged[counter] = int(existing.get(counter, 0) or 0) + int(incoming.get(counter, 0) or 0)
+    for field in DAY_STATS_EXCLUDED_FIELDS:
+        merged.pop(field, None)
+    return merged
+
+
+def _sentense_key(entry, sentenses):
+    """Ключ записи statistics_sentenses: (dictation_id, date) или уникальный для неполных"""
+    dictation_id = entry.get('dictation_id')
+    date = entry.get('date')
+    if dictation_id and date:
+        return f'{dictation_id}|{date}'
+    return f'{dictation_id or ""}|{date or ""}|{len(sentenses)}'
+
+
+def _index_days(statistics, days=None):
+    """Список записей statistics -> словарь по дате (дубли дат суммируются)"""
+    days = {} if days is None else days
+    for stat in statistics:
+        if not isinstance(stat, dict) or not stat.get('date'):
+            continue
+        day_key = str(stat['date'])
+        if day_key in days:
+            days[day_key] = _sum_counters(days[day_key], stat)
+        else:
+            days[day_key] = stat.copy()
+    return days
+
+
+def _upsert_sentenses(sentenses, entries):
+    for entry in entries:
+        if isinstance(entry, dict):
+            sentenses[_sentense_key(entry, sentenses)] = entry
+
+
+def index_month(data, email, month):
+    """Документ месяца в формате 2; старые форматы (списки) мигрируются"""
+    if isinstance(data, dict) and data.get('format') == MONTH_FORMAT_VERSION:
+        data.setdefault('id_user', email)
+        data.setdefault('month', int(month))
+        if not isinstance(data.get('days'), dict):
+            data['days'] = {}
+        if not isinstance(data.get('sentenses'), dict):
+            data['sentenses'] = {}
+        return data
+
+    # Старый формат: dict со списками или просто список статистик
+    if isinstance(data, list):
+        data = {'statistics': data}
+    if not isinstance(data, dict):
+        data = {}
+
+    indexed = {
+        'id_user': data.get('id_user', email),
+        'month': int(data.get('month', month)),
+        'format': MONTH_FORMAT_VERSION,
+        'days': _index_days(data.get('statistics') or []),
+        'sentenses': {}
+    }
+    _upsert_sentenses(indexed['sentenses'], data.get('statistics_sentenses') or [])
+    if 'log_generation' in data:
+        indexed['log_generation'] = data['log_generation']
+    return indexed
+
+
+def month_to_api(indexed):
+    """Документ формата 2 -> структура API (списки, statistics отсортированы по дате)"""
+    return {
+        'id_user': indexed.get('id_user'),
+        'month': indexed.get('month'),
+        'statistics': [indexed['days'][day_key] for day_key in sorted(indexed['days'])],
+        'statistics_sentenses': list(indexed['sentenses'].values())
+    }
+
+
+# ==================== ПРИМЕНЕНИЕ СОБЫТИЙ ====================
+
+def _apply_day_stats(indexed, statistics):
+    """Суммирует perfect/corrected/audio в запись дня (поиск по дате - O(1))"""
+    if not statistics.get('date'):
+        return
+    day_key = str(statistics['date'])
+    existing = indexed['days'].get(day_key)
+    if existing is None:
+        # Первая запись за день — добавляем без лишних полей
+        existing = {}
+        for field, value in statistics.items():
+            if field not in DAY_STATS_EXCLUDED_FIELDS and field not in DAY_COUNTERS:
+                existing[field] = value
+    indexed['days'][day_key] = _sum_counters(existing, statistics)
+
+
+def _apply_month_merge(indexed, event):
+    """statistics_sentenses - upsert по (dictation_id, date); statistics - замена"""
+    _upsert_sentenses(indexed['sentenses'], event.get('statistics_sentenses', []))
+
+    if 'statistics' in event:
+        indexed['days'] = _index_days(event['statistics'])
+
+
+def apply_event(indexed, event):
+    """Применяет одно событие журнала к документу месяца (формат 2)"""
+    event_type = event.get('type')
+    if event_type == 'day_stats':
+        _apply_day_stats(indexed, event.get('stats') or {})
+    elif event_type == 'month_merge':
+        _apply_month_merge(indexed, event)
+    else:
+        print(f'⚠️ [HISTORY_LOG] Неизвестный тип события: {event_type}')
+
+
+# ==================== ЧТЕНИЕ ====================
+
+def load_month_file(filepath):
+    """Читает h_YYYYMM.json; при повреждении пытается восстановить структуру"""
+    if not os.path.exists(filepath):
+        return None
+
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except json.JSONDecodeError as e:
+        print(f'❌ [HISTORY_LOG] Ошибка парсинга JSON в файле {filepath}: {e}')
+        # Файлы прежних версий могли быть обрезаны при сбое во время записи
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                content = f.read()
+            last_valid_brace = content.rfind('}')
+            if last_valid_brace > 0:
+                data = json.loads(content[:last_valid_brace + 1])
+                print(f'⚠️ [HISTORY_LOG] Восстановлена структура из поврежденного файла')
+                return data
+        except Exception:
+            pass
+        print(f'❌ [HISTORY_LOG] Не удалось восстановить файл {filepath}')
+        return None
+    except Exception as e:
+        print(f'❌ [HISTORY_LOG] Ошибка чтения файла {filepath}: {e}')
+        return None
+
+
+# ==================== КЭШ ЧТЕНИЯ ====================
+# Документы месяцев и журналы читаются при каждом запросе истории, поэтому
+# разобранные данные кэшируются в процессе. Документ месяца меняется только
+# через os.replace (новый inode) - перечитывается при смене подписи файла.
+# Журнал только дописывается - читается лишь хвост после уже прочитанного.
+
+class _ReadCache:
+    """LRU-кэш разобранных файлов: путь -> запись"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                self._entries.move_to_end(path)
+            return entry
+
+    def put(self, path, entry):
+        with self._lock:
+            self._entries[path] = entry
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, path):
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_month_cache = _ReadCache(HISTORY_CACHE_SIZE)
+_log_cache = _ReadCache(HISTORY_CACHE_SIZE)
+
+# Начало журнала, по которому проверяется, что под тем же inode тот же файл
+LOG_HEAD_BYTES = 64
+
+
+def clear_read_cache():
+    """Сбрасывает кэш чтения (измерения, ремонт файлов вручную)"""
+    _month_cache.clear()
+    _log_cache.clear()
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _read_indexed_month(month_path, email, month):
+    """Документ месяца в формате 2 (None, если файла нет); копия, которую можно изменять"""
+    signature = _file_signature(month_path)
+    if signature is None:
+        return None
+
+    cached = _month_cache.get(month_path)
+    if cached is None or cached[0] != signature:
+        raw = load_month_file(month_path)
+        if raw is None:
+            return None
+        cached = (signature, index_month(raw, email, month))
+        _month_cache.put(month_path, cached)
+
+    # События заменяют записи дней и предложений целиком, поэтому достаточно копий словарей
+    indexed = cached[1]
+    return dict(indexed, days=dict(indexed['days']), sentenses=dict(indexed['sentenses']))
+
+
+def _parse_log_lines(data, path):
+    events = []
+    for line in data.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            events.append(json.loads(line))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            print(f'⚠️ [HISTORY_LOG] Пропущена поврежденная строка журнала {path}')
+    return events
+
+
+def _read_log(path):
+    """События из файла журнала; неполная последняя строка (сбой при записи) пропускается
+
+    Повторное чтение того же журнала разбирает только дописанные с прошлого раза строки.
+    """
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return []
+
+    with f:
+        stat = os.fstat(f.fileno())
+        cached = _log_cache.get(path)
+        events, offset, head = [], 0, b''
+        if cached is not None and cached['ino'] == stat.st_ino and cached['offset'] <= stat.st_size:
+            # Тот же inode мог достаться новому журналу после удаления свернутого
+            if f.read(len(cached['head'])) == cached['head']:
+                events, offset, head = cached['events'], cached['offset'], cached['head']
+
+        if offset < stat.st_size:
+            f.seek(offset)
+            data = f.read()
+            # Разбираются только полные строки; хвост без \n дочитается в следующий раз
+            complete = data.rfind(b'\n') + 1
+            if complete:
+                events = events + _parse_log_lines(data[:complete], path)
+                offset += complete
+                if len(head) < LOG_HEAD_BYTES:
+                    f.seek(0)
+                    head = f.read(min(offset, LOG_HEAD_BYTES))
+                _log_cache.put(path, {'ino': stat.st_ino, 'offset': offset, 'head': head, 'events': events})
+            tail = data[complete:].strip()
+            if tail:
+                try:
+                    # Последняя строка без перевода строки (журнал после сбоя)
+                    return events + [json.loads(tail)]
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    print(f'⚠️ [HISTORY_LOG] Пропущена поврежденная строка журнала {path}')
+        return events
+
+
+def _compacting_logs(history_folder):
+    """Журналы, которые сворачиваются (или остались после сбоя): [(поколение, путь)]"""
+    if not os.path.isdir(history_folder):
+        return []
+    result = []
+    for filename in os.listdir(history_folder):
+        if filename.startswith('events.') and filename.endswith(COMPACTING_SUFFIX):
+            generation = filename[len('events.'):-len(COMPACTING_SUFFIX)]
+            if generation.isdigit():
+                result.append((int(generation), os.path.join(history_folder, filename)))
+    return sorted(result)
+
+
+def register_pending_source(source, lock):
+    """Источник событий, еще не записанных в журнал: source(history_folder) -> [событие]
+
+    Используется буфером отложенной записи (helpers.write_behind), чтобы
+    чтение видело сохраненные, но еще не сброшенные на диск данные. lock
+    держится источником на время переноса событий в журнал: под ним чтение
+    не увидит событие ни дважды, ни ни разу.
+    """
+    _pending_sources.append((source, lock))
+
+
+def pending_events(history_folder):
+    """Все еще не свернутые события: [(поколение или None, событие)] в порядке записи"""
+    with ExitStack() as stack:
+        for _, lock in _pending_sources:
+            stack.enter_context(lock)
+
+        pending = []
+        for generation, path in _compacting_logs(history_folder):
+            pending.extend((generation, event) for event in _read_log(path))
+        for event in _read_log(os.path.join(history_folder, HISTORY_LOG_NAME)):
+            pending.append((None, event))
+        for source, _ in _pending_sources:
+            pending.extend((None, event) for event in source(history_folder))
+        return pending
+
+
+def read_month(email, month):
+    """Документ месяца с учетом несвернутых событий (None, если данных нет)"""
+    history_folder = get_history_folder(email)
+    indexed = _read_indexed_month(os.path.join(history_folder, get_month_filename(month)), email, month)
+    events = [
+        (generation, event) for generation, event in pending_events(history_folder)
+        if str(event.get('month')) == str(month)
+    ]
+
+    if indexed is None and not events:
+        return None
+
+    if indexed is None:
+        indexed = index_month(None, email, month)
+    applied_generation = indexed.get('log_generation', 0)
+    for generation, event in events:
+        if generation is not None and generation <= applied_generation:
+            continue
+        apply_event(indexed, event)
+    return month_to_api(indexed)
+
+
+def list_months(email):
+    """Все месяцы с историей (файлы и несвернутые события), по возрастанию"""
+    history_folder = get_history_folder(email)
+
+    months = set()
+    if os.path.isdir(history_folder):
+        for filename in os.listdir(history_folder):
+            if filename.startswith('h_') and filename.endswith('.json'):
+                months.add(filename[len('h_'):-len('.json')])
+    # Папки может еще не быть: события нового пользователя ждут в буфере записи
+    for _, event in pending_events(history_folder):
+        if event.get('month'):
+            months.add(str(event['month']))
+    return sorted(months)
+
+
+# ==================== КОМПАКТОР ====================
+
+def write_json_atomic(path, data):
+    """Атомарная запись JSON: временный файл + fsync + os.replace"""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _fold_log(email, history_folder, generation, log_path):
+    """Сворачивает один журнал в документы месяцев (идемпотентно по поколению)"""
+    events_by_month = {}
+    for event in _read_log(log_path):
+        if event.get('month'):
+            events_by_month.setdefault(str(event['month']), []).append(event)
+
+    for month, events in events_by_month.items():
+        month_path = os.path.join(history_folder, get_month_filename(month))
+        indexed = index_month(load_month_file(month_path), email, month)
+        if indexed.get('log_generation', 0) >= generation:
+            # Этот журнал уже применен к месяцу до сбоя компактора
+            continue
+        for event in events:
+            apply_event(indexed, event)
+        indexed['log_generation'] = generation
+        write_json_atomic(month_path, indexed)
+
+    # Итоги для отчетов (rollups.json или columns/*.npy) обновляются до удаления
+    # журнала: после сбоя повторное сворачивание пересчитает те же месяцы
+    from helpers.history_columns import update_history_analytics
+    update_history_analytics(email, history_folder, list(events_by_month), generation)
+
+    os.remove(log_path)
+    _log_cache.pop(log_path)
+
+
+def migrate_months(email):
+    """Однократная миграция файлов месяцев пользователя в формат 2 (по датам)
+
+    Дубли записей за один день в statistics суммируются. Возвращает список
+    перезаписанных месяцев.
+    """
+    history_folder = get_history_folder(email)
+    if not os.path.isdir(history_folder):
+        return []
+
+    migrated = []
+    with file_lock(os.path.join(history_folder, COMPACT_LOCK_NAME), exclusive=True):
+        for filename in sorted(os.listdir(history_folder)):
+            if not (filename.startswith('h_') and filename.endswith('.json')):
+                continue
+            month = filename[len('h_'):-len('.json')]
+            month_path = os.path.join(history_folder, filename)
+            raw = load_month_file(month_path)
+            if raw is None or (isinstance(raw, dict) and raw.get('format') == MONTH_FORMAT_VERSION):
+                continue
+            write_json_atomic(month_path, index_month(raw, email, month))
+            migrated.append(month)
+    return migrated
+
+
+def compact(email, blocking=True):
+    """Сворачивает журнал событий пользователя в h_YYYYMM.json; True, если выполнено"""
+    history_folder = get_history_folder(email)
+    if not os.path.isdir(history_folder):
+        return True
+
+    with file_lock(os.path.join(history_folder, COMPACT_LOCK_NAME), exclusive=True, blocking=blocking) as acquired:
+        if not acquired:
+            return False
+
+        log_path = os.path.join(history_folder, HISTORY_LOG_NAME)
+        if os.path.exists(log_path):
+            # Новое поколение: журнал переименовывается, новые события пишутся в новый файл
+            generation = time.time_ns()
+            with file_lock(os.path.join(history_folder, APPEND_LOCK_NAME), exclusive=True):
+                os.replace(log_path, os.path.join(history_folder, f'events.{generation}{COMPACTING_SUFFIX}'))
+
+        for generation, path in _compacting_logs(history_folder):
+            try:
+                _fold_log(email, history_folder, generation, path)
+            except Exception as e:
+                print(f'❌ [HISTORY_LOG] Ошибка сворачивания журнала {path}: {e}')
+                return False
+
+    return True
@@ -0,0 +1,339 @@
+"""
+Предрасчитанные итоги истории активности для отчетов за период
+
+history/rollups.json хранит:
+- отсортированные массивы по дням (dates + perfect/corrected/audio) -
+  диапазон дней находится двумя бинарными поисками;
+- итоги по неделям (ISO), месяцам и годам: [perfect, corrected, audio, активных дней].
+
+Файл обновляется компактором журнала (helpers.history_log) для свернутых
+месяцев, если HISTORY_ANALYTICS_STORE='rollups'; еще не свернутые события журнала накладываются при чтении, так же
+как в read_month. Сохранение истории остается одной строкой в журнале.
+"""
+import calendar
+import json
+import os
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+
+from helpers.history_log import (
+    COMPACT_LOCK_NAME, DAY_COUNTERS,
+    file_lock, get_history_folder, index_month, load_month_file, pending_events, write_json_atomic
+)
+
+
+ROLLUPS_NAME = 'rollups.json'
+ROLLUPS_FORMAT_VERSION = 1
+
+ROLLUP_PERIODS = ('week', 'month', 'year')
+
+
+# ==================== ПЕРИОДЫ ====================
+
+def date_key_to_date(date_key):
+    date_key = int(date_key)
+    return date(date_key // 10000, date_key // 100 % 100, date_key % 100)
+
+
+def date_to_key(value):
+    return value.year * 10000 + value.month * 100 + value.day
+
+
+def period_key(date_key, period):
+    """Ключ периода для дня: неделя '2025W45', месяц '202511', год '2025'"""
+    date_key = int(date_key)
+    if period == 'year':
+        return str(date_key // 10000)
+    if period == 'month':
+        return str(date_key // 100)
+    iso_year, iso_week, _ = date_key_to_date(date_key).isocalendar()
+    return f'{iso_year}W{iso_week:02d}'
+
+
+def period_bounds(key, period):
+    """Первый и последний день периода (YYYYMMDD)"""
+    if period == 'year':
+        year = int(key)
+        return year * 10000 + 101, year * 10000 + 1231
+    if period == 'month':
+        month = int(key)
+        last_day = calendar.monthrange(month // 100, month % 100)[1]
+        return month * 100 + 1, month * 100 + last_day
+    iso_year, iso_week = key.split('W')
+    monday = date.fromisocalendar(int(iso_year), int(iso_week), 1)
+    return date_to_key(monday), date_to_key(monday + timedelta(days=6))
+
+
+# ==================== ИТОГИ ====================
+
+class HistoryRollups:
+    """Массивы по дням + итоги по периодам для одного пользователя"""
+
+    def __init__(self, dates=None, values=None, periods=None, log_generation=0):
+        self.dates = list(dates or [])
+        self.values = {
+            counter: list((values or {}).get(counter) or [0] * len(self.dates))
+            for counter in DAY_COUNTERS
+        }
+        self.log_generation = log_generation
+        if isinstance(periods, dict) and all(period in periods for period in ROLLUP_PERIODS):
+            self.periods = periods
+        else:
+            self._rebuild_periods()
+
+    # ---------- сериализация ----------
+
+    @classmethod
+    def from_doc(cls, doc):
+        if not isinstance(doc, dict) or doc.get('format') != ROLLUPS_FORMAT_VERSION:
+            return None
+        return cls(doc.get('dates'), doc, doc.get('periods'), doc.get('log_generation', 0))
+
+    def to_doc(self):
+        doc = {
+            'format': ROLLUPS_FORMAT_VERSION,
+            'log_generation': self.log_generation,
+            'dates': self.dates
+        }
+        doc.update(self.values)
+        doc['periods'] = self.periods
+        return doc
+
+    # ---------- изменения ----------
+
+    def _rebuild_periods(self):
+        self.periods = {period: {} for period in ROLLUP_PERIODS}
+        for index, date_key in enumerate(self.dates):
+            self._add_to_periods(date_key, [self.values[c][index] for c in DAY_COUNTERS], 1)
+
+    def _add_to_periods(self, date_key, counters, active_days):
+        for period in ROLLUP_PERIODS:
+            bucket = self.periods[period].setdefault(period_key(date_key, period), [0] * (len(DAY_COUNTERS) + 1))
+            for position, value in enumerate(counters):
+                bucket[position] += value
+            bucket[-1] += active_days
+            if not bucket[-1]:
+                del self.periods[period][period_key(date_key, period)]
+
+    def add_day(self, date_key, stats):
+        """Прибавляет счетчики к дню (как событие day_stats)"""
+        date_key = int(date_key)
+        counters = [int(stats.get(counter, 0) or 0) for counter in DAY_COUNTERS]
+        index = bisect_left(self.dates, date_key)
+        is_new = index == len(self.dates) or self.dates[index] != date_key
+
+        if is_new:
+            self.dates.insert(index, date_key)
+            for counter, value in zip(DAY_COUNTERS, counters):
+                self.values[counter].insert(index, value)
+        else:
+            for counter, value in zip(DAY_COUNTERS, counters):
+                self.values[counter][index] += value
+
+        self._add_to_periods(date_key, counters, 1 if is_new else 0)
+
+    def replace_month(self, month, days):
+        """Заменяет все дни месяца (days - список записей statistics)"""
+        start, end = period_bounds(str(month), 'month')
+        left = bisect_left(self.dates, start)
+        right = bisect_right(self.dates, end)
+
+        merged = {}
+        for stat in days:
+            if isinstance(stat, dict) and stat.get('date'):
+                date_key = int(stat['date'])
+                if start <= date_key <= end:
+                    existing = merged.setdefault(date_key, [0] * len(DAY_COUNTERS))
+                    for position, counter in enumerate(DAY_COUNTERS):
+                        existing[position] += int(stat.get(counter, 0) or 0)
+
+        # Итоги периодов: вычитаем старые дни месяца, прибавляем новые
+        for index in range(left, right):
+            self._add_to_periods(self.dates[index], [-self.values[c][index] for c in DAY_COUNTERS], -1)
+        for date_key, counters in merged.items():
+            self._add_to_periods(date_key, counters, 1)
+
+        new_dates = sorted(merged)
+        self.dates[left:right] = new_dates
+        for position, counter in enumerate(DAY_COUNTERS):
+            self.values[counter][left:right] = [merged[date_key][position] for date_key in new_dates]
+
+    def apply_event(self, event):
+        """Применяет событие журнала истории (см. helpers.history_log.apply_event)"""
+        event_type = event.get('type')
+        if event_type == 'day_stats':
+            stats = event.get('stats') or {}
+            if stats.get('date'):
+                self.add_day(stats['date'], stats)
+        elif event_type == 'month_merge' and 'statistics' in event and event.get('month'):
+            self.replace_month(event['month'], event['statistics'])
+
+    # ---------- запросы ----------
+
+    def day_range(self, start_date, end_date):
+        """Индексы [left, right) дней в диапазоне (бинарный поиск)"""
+        return bisect_left(self.dates, int(start_date)), bisect_right(self.dates, int(end_date))
+
+    def days(self, start_date, end_date):
+        """Записи статистики по дням за период, отсортированные по дате"""
+        left, right = self.day_range(start_date, end_date)
+        return [
+            dict({'date': self.dates[index]}, **{c: self.values[c][index] for c in DAY_COUNTERS})
+            for index in range(left, right)
+        ]
+
+    def _sum_days(self, start_date, end_date):
+        left, right = self.day_range(start_date, end_date)
+        totals = [sum(self.values[counter][left:right]) for counter in DAY_COUNTERS]
+        return totals + [right - left]
+
+    def totals(self, start_date, end_date, period=None):
+        """Итоги за период: {'perfect', 'corrected', 'audio', 'active_days'}
+
+        period - разбивка по 'week'/'month'/'year': полностью попавшие в
+        диапазон периоды берутся из предрасчитанных итогов, крайние -
+        досчитываются по массивам дней.
+        """
+        start_date, end_date = int(start_date), int(end_date)
+        if period is None:
+            return self._totals_dict(self._range_sum(start_date, end_date))
+
+        result = []
+        keys = self.periods.get(period, {})
+        first_key = period_key(start_date, period)
+        last_key = period_key(end_date, period)
+        for key in sorted(keys):
+            if key < first_key or key > last_key:
+                continue
+            period_start, period_end = period_bounds(key, period)
+            if start_date <= period_start and period_end <= end_date:
+                values = keys[key]
+            else:
+                values = self._sum_days(max(start_date, period_start), min(end_date, period_end))
+            if values[-1]:
+                result.append(dict(self._totals_dict(values), period=key))
+        return result
+
+    def _range_sum(self, start_date, end_date):
+        """Сумма за диапазон: целые годы и месяцы - из итогов, края - по дням"""
+        total = [0] * (len(DAY_COUNTERS) + 1)
+        current = date_key_to_date(start_date)
+        last = date_key_to_date(end_date)
+
+        while current <= last:
+            current_key = date_to_key(current)
+            values, period_end = None, None
+            for period in ('year', 'month'):
+                key = period_key(current_key, period)
+                period_start, period_end = period_bounds(key, period)
+                if period_start == current_key and period_end <= end_date:
+                    values = self.periods[period].get(key)
+                    break
+            else:
+                # Неполный месяц: дни до конца месяца или до конца диапазона
+                period_end = min(period_end, end_date)
+                values = self._sum_days(current_key, period_end)
+
+            if values:
+                total = [a + b for a, b in zip(total, values)]
+            current = date_key_to_date(period_end) + timedelta(days=1)
+        return total
+
+    @staticmethod
+    def _totals_dict(values):
+        totals = dict(zip(DAY_COUNTERS, values))
+        totals['active_days'] = values[-1]
+        return totals
+
+
+# ==================== ХРАНЕНИЕ ====================
+
+def get_rollups_path(email):
+    return os.path.join(get_history_folder(email), ROLLUPS_NAME)
+
+
+def _load_rollups_file(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return HistoryRollups.from_doc(json.load(f))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f'❌ [HISTORY_ROLLUPS] Ошибка чтения {path}: {e}')
+        return None
+
+
+def _build_from_months(email, history_folder):
+    """Итоги по документам месяцев на диске (без несвернутых событий)
+
+    log_generation - последний журнал, уже свернутый в документы месяцев:
+    события журналов не новее него при чтении не накладываются повторно.
+    """
+    rollups = HistoryRollups()
+    for filename in sorted(os.listdir(history_folder)):
+        if filename.startswith('h_') and filename.endswith('.json'):
+            month = filename[len('h_'):-len('.json')]
+            raw = load_month_file(os.path.join(history_folder, filename))
+            if raw is not None:
+                indexed = index_month(raw, email, month)
+                rollups.replace_month(month, indexed['days'].values())
+                rollups.log_generation = max(rollups.log_generation, indexed.get('log_generation', 0))
+    return rollups
+
+
+def update_rollups(email, history_folder, months, generation):
+    """Вызывается компактором под его блокировкой после записи документов месяцев"""
+    path = os.path.join(history_folder, ROLLUPS_NAME)
+    rollups = _load_rollups_file(path)
+    if rollups is None:
+        rollups = _build_from_months(email, history_folder)
+    else:
+        for month in months:
+            raw = load_month_file(os.path.join(history_folder, f'h_{month}.json'))
+            days = index_month(raw, email, month)['days'].values() if raw is not None else []
+            rollups.replace_month(month, days)
+
+    rollups.log_generation = max(rollups.log_generation, generation)
+    write_json_atomic(path, rollups.to_doc())
+
+
+def drop_rollups(history_folder):
+    """Удаляет rollups.json: отчеты строятся по колонкам, файл больше не обновляется"""
+    try:
+        os.remove(os.path.join(history_folder, ROLLUPS_NAME))
+    except FileNotFoundError:
+        pass
+
+
+def ensure_rollups(email):
+    """Создает rollups.json для пользователя, у которого его еще нет
+
+    Строится по документам месяцев без сворачивания журнала: несвернутые
+    события накладываются при чтении.
+    """
+    history_folder = get_history_folder(email)
+    path = os.path.join(history_folder, ROLLUPS_NAME)
+    if not os.path.isdir(history_folder) or os.path.exists(path):
+        return
+
+    with file_lock(os.path.join(history_folder, COMPACT_LOCK_NAME), exclusive=True):
+        if not os.path.exists(path):
+            write_json_atomic(path, _build_from_months(email, history_folder).to_doc())
+
+
+def read_rollups(email):
+    """Итоги пользователя с учетом несвернутых событий журнала"""
+    history_folder = get_history_folder(email)
+    ensure_rollups(email)
+
+    rollups = _load_rollups_file(os.path.join(history_folder, ROLLUPS_NAME))
+    if rollups is None:
+        rollups = HistoryRollups()
+        if os.path.isdir(history_folder):
+            rollups = _build_from_months(email, history_folder)
+
+    for generation, event in pending_events(history_folder):
+        if generation is not None and generation <= rollups.log_generation:
+            continue
+        rollups.apply_event(event)
+    return rollups
@@ -0,0 +1,238 @@
+"""
+Общий конвейер обработки загружаемых изображений (аватары, обложки диктантов)
+
+Память на одну загрузку ограничена:
+- загрузка читается потоком с проверкой размера (большие файлы уходят на диск);
+- число пикселей проверяется по заголовку до декодирования;
+- JPEG декодируется в draft-режиме сразу в уменьшенном масштабе;
+- одно декодирование используется для всех выходных размеров и форматов.
+"""
+import os
+import shutil
+import tempfile
+
+from PIL import Image, ImageOps, features
+
+
+# Максимальный размер загружаемого файла (байт)
+MAX_UPLOAD_BYTES = 5 * 1024 * 1024
+
+# Максимальное число пикселей исходного изображения (~50 Мп)
+MAX_IMAGE_PIXELS = 50_000_000
+
+# Данные до этого размера держим в памяти, остальное - во временном файле
+SPOOL_MAX_MEMORY = 1024 * 1024
+
+READ_CHUNK_SIZE = 64 * 1024
+
+# Варианты аватара: (имя файла без расширения, размер, режим вписывания)
+AVATAR_VARIANTS = [
+    {'name': 'avatar', 'size': (100, 100), 'fit': 'contain'},
+    {'name': 'avatar@2x', 'size': (200, 200), 'fit': 'contain'},
+    {'name': 'avatar_min', 'size': (40, 40), 'fit': 'contain'},
+    {'name': 'avatar_min@2x', 'size': (80, 80), 'fit': 'contain'},
+]
+
+# Варианты обложки диктанта (200x120 - как в карточках)
+COVER_VARIANTS = [
+    {'name': 'cover', 'size': (200, 120), 'fit': 'exact'},
+    {'name': 'cover@2x', 'size': (400, 240), 'fit': 'exact'},
+]
+
+# Форматы вывода. AVIF не включен: закрепленный Pillow 10.4 не умеет его
+# сохранять (нужен Pillow 11.2+ или плагин pillow-avif-plugin)
+OUTPUT_FORMATS = [
+    {'format': 'WEBP', 'ext': 'webp', 'quality': 85},
+]
+
+
+class ImagePipelineError(ValueError):
+    """Загрузка не может быть обработана (слишком большая или не изображение)"""
+
+
+def is_format_supported(format_name):
+    """Проверяет, умеет ли установленный Pillow сохранять формат"""
+    Image.init()
+    if format_name.upper() not in Image.SAVE:
+        return False
+
+    # WEBP - отдельный модуль, который может быть собран без библиотеки
+    module = format_name.lower()
+    if module in features.modules:
+        try:
+            return bool(features.check_module(module))
+        except ValueError:
+            return False
+    return True
+
+
+def get_output_formats(formats=None):
+    """Список доступных форматов вывода"""
+    formats = OUTPUT_FORMATS if formats is None else formats
+    return [fmt for fmt in formats if is_format_supported(fmt['format'])]
+
+
+def read_upload_limited(stream, max_bytes=MAX_UPLOAD_BYTES):
+    """Читает поток загрузки блоками, прерываясь при превышении max_bytes
+
+    Возвращает файловый объект (в памяти или во временном файле),
+    установленный на начало.
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    total = 0
+    try:
+        while True:
+            chunk = stream.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > max_bytes:
+                raise ImagePipelineError(f'File size must be less than {max_bytes // (1024 * 1024)}MB')
+            spooled.write(chunk)
+    except Exception:
+        spooled.close()
+        raise
+
+    spooled.seek(0)
+    return spooled
+
+
+def open_image_limited(source, max_pixels=MAX_IMAGE_PIXELS):
+    """Открывает изображение (только заголовок) и проверяет число пикселей"""
+    try:
+        image = Image.open(source)
+    except (Image.UnidentifiedImageError, Image.DecompressionBombError) as e:
+        raise ImagePipelineError(f'Cannot read image: {e}')
+
+    width, height = image.size
+    if width * height > max_pixels:
+        image.close()
+        raise ImagePipelineError(f'Image is too large: {width}x{height}')
+
+    return image
+
+
+def _largest_size(variants):
+    """Наибольший требуемый размер среди вариантов (для draft-декодирования)"""
+    return (
+        max(variant['size'][0] for variant in variants),
+        max(variant['size'][1] for variant in variants)
+    )
+
+
+def _contain_size(source_size, box_size):
+    """Размер с сохранением пропорций внутри box_size (без увеличения, как thumbnail)"""
+    src_w, src_h = source_size
+    box_w, box_h = box_size
+    scale = min(box_w / src_w, box_h / src_h, 1.0)
+    return max(1, round(src_w * scale)), max(1, round(src_h * scale))
+
+
+def decode_for_variants(image, variants):
+    """Одно декодирование изображения, достаточное для всех вариантов
+
+    Для JPEG используется draft-режим: декодер сразу уменьшает изображение
+    в 2/4/8 раз, но не меньше наибольшего требуемого размера.
+    """
+    if image.format == 'JPEG':
+        image.draft('RGB', _largest_size(variants))
+
+    # Заголовок мог прочитаться, а данные - оказаться обрезанными или поврежденными
+    try:
+        image.load()
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise ImagePipelineError(f'Cannot decode image: {e}')
+
+    if image.mode not in ('RGB', 'RGBA'):
+        has_alpha = image.mode in ('LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    return image
+
+
+def render_variant(base_image, variant):
+    """Уменьшает декодированное изображение под один вариант"""
+    fit = variant.get('fit')
+    if fit == 'cover':
+        # Заполнить весь размер с обрезкой по центру, без искажения пропорций
+        return ImageOps.fit(base_image, variant['size'], Image.Resampling.LANCZOS)
+    if fit == 'exact':
+        target_size = variant['size']
+    else:
+        target_size = _contain_size(base_image.size, variant['size'])
+
+    if target_size == base_image.size:
+        return base_image
+
+    return base_image.resize(target_size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+def get_format_by_ext(ext, formats=None):
+    """Описание формата вывода по расширению (только поддерживаемые)"""
+    for fmt in get_output_formats(formats):
+        if fmt['ext'] == ext:
+            return fmt
+    return None
+
+
+def save_variant(image, path, fmt):
+    """Сохраняет изображение в формате fmt (элемент OUTPUT_FORMATS)"""
+    if fmt['format'] == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.save(path, fmt['format'], quality=fmt['quality'])
+
+
+def process_image(source, output_dir, variants, formats=None, max_pixels=MAX_IMAGE_PIXELS):
+    """Сохраняет все варианты изображения во всех доступных форматах
+
+    source - путь или файловый объект. Возвращает словарь
+    {имя варианта: {расширение: путь к файлу}}.
+    """
+    output_formats = get_output_formats(formats)
+    os.makedirs(output_dir, exist_ok=True)
+
+    image = open_image_limited(source, max_pixels)
+    try:
+        base_image = decode_for_variants(image, variants)
+        saved = {}
+
+        for variant in variants:
+            rendered = render_variant(base_image, variant)
+            saved[variant['name']] = {}
+
+            for fmt in output_formats:
+                path = os.path.join(output_dir, f"{variant['name']}.{fmt['ext']}")
+                tmp_path = f'{path}.tmp'
+                save_variant(rendered, tmp_path, fmt)
+                os.replace(tmp_path, path)
+                saved[variant['name']][fmt['ext']] = path
+
+            if rendered is not base_image:
+                rendered.close()
+
+        return saved
+    finally:
+        image.close()
+
+
+def process_upload(file_storage, output_dir, variants, formats=None, max_bytes=MAX_UPLOAD_BYTES):
+    """Полный путь обработки загрузки: потоковое чтение -> проверка -> варианты"""
+    with read_upload_limited(file_storage.stream, max_bytes) as upload:
+        return process_image(upload, output_dir, variants, formats)
+
+
+def copy_image_variants(source_dir, target_dir, prefix):
+    """Копирует все файлы вариантов (prefix.*, prefix@2x.* ...) между папками"""
+    if not os.path.isdir(source_dir):
+        return []
+
+    copied = []
+    os.makedirs(target_dir, exist_ok=True)
+    for filename in os.listdir(source_dir):
+        name, ext = os.path.splitext(filename)
+        if ext.lower() not in ('.webp', '.png', '.jpg', '.jpeg'):
+            continue
+        if name == prefix or name.startswith(f'{prefix}@'):
+            shutil.copy2(os.path.join(source_dir, filename), os.path.join(target_dir, filename))
+            copied.append(filename)
+    return copied
@@ -0,0 +1,242 @@
+"""
+Фоновые задания для долгих операций (обработка аудио в редакторе)
+
+Задание выполняется в пуле процессов, а не в веб-воркере: запрос сразу
+получает id задания, а статус и результат запрашиваются через /api/jobs/<id>.
+Таблица заданий - SQLite (instance/jobs.sqlite3): ее видят все воркеры,
+а процесс пула сам пишет в нее прогресс и результат.
+
+Функция задания - обычная функция модуля (ее можно передать в другой
+процесс): func(params, progress) -> dict результата; progress(доля 0..1).
+Ошибка задания - JobError(сообщение, данные ответа, HTTP-статус).
+
+Веб-воркер, поставивший задание, раз в JOB_HEARTBEAT_SECONDS обновляет
+updated_at своих незавершенных заданий. Если воркер перезапущен (деплой,
+таймаут), отметки прекращаются, и задание через JOB_STALE_SECONDS
+считается проваленным - клиент не ждет его вечно.
+"""
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+
+# Завершенные задания хранятся сутки
+JOB_TTL_SECONDS = 24 * 60 * 60
+
+# Прогресс пишется в таблицу не чаще, чем раз в столько секунд
+PROGRESS_MIN_INTERVAL = 0.5
+
+# Отметка живости незавершенных заданий и срок, после которого задание без отметок провалено
+JOB_HEARTBEAT_SECONDS = 10
+JOB_STALE_SECONDS = 6 * JOB_HEARTBEAT_SECONDS
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+
+class JobError(Exception):
+    """Ожидаемая ошибка задания: response - тело ответа, status - HTTP-статус синхронного режима"""
+
+    def __init__(self, message, response=None, status=500):
+        super().__init__(message)
+        self.response = response or {'success': False, 'error': message}
+        self.status = status
+
+
+# ==================== ТАБЛИЦА ЗАДАНИЙ ====================
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+'''
+
+
+def _connect(db_path):
+    connection = sqlite3.connect(db_path, timeout=10)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+def init_job_table(db_path):
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    with _connect(db_path) as connection:
+        # WAL: чтение статуса не ждет записи прогресса другим процессом
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(_SCHEMA)
+    # Задания воркеров, остановленных до завершения
+    fail_stale_jobs(db_path)
+
+
+def _update_job(db_path, job_id, **fields):
+    fields['updated_at'] = time.time()
+    assignments = ', '.join(f'{name} = ?' for name in fields)
+    with _connect(db_path) as connection:
+        connection.execute(f'UPDATE jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+
+
+def get_job(db_path, job_id):
+    """Задание как dict (result - разобранный JSON) или None"""
+    with _connect(db_path) as connection:
+        row = connection.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+
+def fail_stale_jobs(db_path):
+    """queued/running без отметок живости дольше JOB_STALE_SECONDS -> failed"""
+    now = time.time()
+    with _connect(db_path) as connection:
+        connection.execute(
+            'UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE status IN (?, ?) AND updated_at < ?',
+            (JOB_FAILED, 'Задание прервано: процесс обработки был остановлен', now,
+             JOB_QUEUED, JOB_RUNNING, now - JOB_STALE_SECONDS)
+        )
+
+
+def _touch_jobs(db_path, job_ids):
+    placeholders = ', '.join('?' for _ in job_ids)
+    with _connect(db_path) as connection:
+        connection.execute(
+            f'UPDATE jobs SET updated_at = ? WHERE status IN (?, ?) AND id IN ({placeholders})',
+            (time.time(), JOB_QUEUED, JOB_RUNNING, *job_ids)
+        )
+
+
+def _delete_expired(db_path):
+    with _connect(db_path) as connection:
+        connection.execute(
+            'DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?',
+            (JOB_DONE, JOB_FAILED, time.time() - JOB_TTL_SECONDS)
+        )
+
+
+# ==================== ВЫПОЛНЕНИЕ (процесс пула) ====================
+
+def _run_job(db_path, job_id, func, params):
+    """Выполняется в процессе пула: статус, прогресс и результат - прямо в таблицу"""
+    _update_job(db_path, job_id, status=JOB_RUNNING)
+    last_write = [0.0]
+
+    def progress(fraction):
+        now = time.monotonic()
+        if now - last_write[0] >= PROGRESS_MIN_INTERVAL:
+            last_write[0] = now
+            _update_job(db_path, job_id, progress=round(max(0.0, min(1.0, float(fraction))), 3))
+
+    try:
+        result = func(params, progress)
+    except JobError as e:
+        _update_job(db_path, job_id, status=JOB_FAILED, error=str(e), result=json.dumps(e.response, ensure_ascii=False))
+        return
+    except Exception as e:
+        print(f'❌ [JOBS] Ошибка задания {job_id}: {e}')
+        _update_job(db_path, job_id, status=JOB_FAILED, error=str(e))
+        return
+    _update_job(db_path, job_id, status=JOB_DONE, progress=1.0, result=json.dumps(result, ensure_ascii=False))
+
+
+# ==================== ЗАПУСК (веб-воркер) ====================
+
+class JobRunner:
+    """Пул процессов + таблица заданий"""
+
+    def __init__(self, db_path, workers=JOB_WORKERS):
+        self.db_path = db_path
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._active = set()
+        self._heartbeat = None
+        init_job_table(db_path)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: дочерние процессы не наследуют потоки и блокировки веб-воркера
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def submit(self, kind, func, params):
+        """Ставит задание в очередь; возвращает его id"""
+        _delete_expired(self.db_path)
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with _connect(self.db_path) as connection:
+            connection.execute(
+                'INSERT INTO jobs (id, kind, status, progress, created_at, updated_at) VALUES (?, ?, ?, 0, ?, ?)',
+                (job_id, kind, JOB_QUEUED, now, now)
+            )
+
+        with self._lock:
+            self._active.add(job_id)
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._run_heartbeat, name='job-heartbeat', daemon=True)
+                self._heartbeat.start()
+
+        future = self._get_executor().submit(_run_job, self.db_path, job_id, func, params)
+        future.add_done_callback(lambda done: self._on_done(job_id, done))
+        return job_id
+
+    def _run_heartbeat(self):
+        while True:
+            time.sleep(JOB_HEARTBEAT_SECONDS)
+            with self._lock:
+                job_ids = list(self._active)
+            if not job_ids:
+                continue
+            try:
+                _touch_jobs(self.db_path, job_ids)
+            except Exception as e:
+                print(f'❌ [JOBS] Ошибка отметки живости заданий: {e}')
+
+    def _on_done(self, job_id, future):
+        with self._lock:
+            self._active.discard(job_id)
+        # Процесс пула упал, не записав результат (например, нехватка памяти)
+        error = future.exception()
+        if error is not None:
+            print(f'❌ [JOBS] Процесс задания {job_id} завершился с ошибкой: {error}')
+            _update_job(self.db_path, job_id, status=JOB_FAILED, error=str(error))
+            with self._lock:
+                self._executor = None
+
+    def get(self, job_id):
+        fail_stale_jobs(self.db_path)
+        return get_job(self.db_path, job_id)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+def run_inline(func, params):
+    """Синхронный режим: то же задание прямо в запросе -> (тело ответа, HTTP-статус)"""
+    try:
+        return func(params, lambda fraction: None), 200
+    except JobError as e:
+        return e.response, e.status
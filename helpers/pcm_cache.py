@@ -0,0 +1,130 @@
+"""
+Кеш декодированного аудио (PCM) для операций редактора
+
+Декодирование MP3/WebM (librosa.load) - самый медленный шаг разрезания и
+склейки, а редактор много раз за сессию обрабатывает один и тот же
+исходник. Декодированный сигнал (float32, моно) сохраняется в .npy в общем
+DiskLRUCache (квота по размеру, вытеснение давно неиспользованных) и
+читается через numpy.load(mmap_mode='r') - без декодирования и без
+копирования всего файла в память.
+
+Ключ: (путь, mtime, размер, частота дискретизации). Измененный исходник
+просто перестает находиться, старая запись вытесняется по LRU.
+Задания выполняются в процессах пула без контекста Flask, поэтому папку
+и квоту кеша (instance/cache/pcm приложения) передает маршрут в params.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import librosa
+import numpy
+
+from helpers.audio_meta import get_sample_rate
+from helpers.disk_cache import DiskLRUCache
+
+
+logger = logging.getLogger(__name__)
+
+PCM_CACHE_MAX_BYTES = int(os.getenv('PCM_CACHE_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))
+
+# Формат записи: при смене декодирования старые записи просто перестанут находиться
+PCM_CACHE_KEY_VERSION = 1
+
+PEAK_CACHE_SIZE = 4096
+PEAK_BLOCK_FRAMES = 1 << 20
+
+
+def peak_of(samples):
+    """Максимум |сигнала| по блокам: отображенный в память файл не читается целиком"""
+    peak = 0.0
+    for start in range(0, len(samples), PEAK_BLOCK_FRAMES):
+        block = samples[start:start + PEAK_BLOCK_FRAMES]
+        if len(block):
+            peak = max(peak, float(numpy.max(numpy.abs(block))))
+    return peak
+
+
+def _write_npy(tmp_path, samples):
+    # numpy.save с именем файла дописал бы .npy к временному имени
+    with open(tmp_path, 'wb') as f:
+        numpy.save(f, samples)
+
+
+class PCMCache:
+    """Декодированные сигналы в дисковом кеше"""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._peaks = OrderedDict()
+        self._peaks_lock = threading.Lock()
+
+    def make_key(self, path, sample_rate):
+        stat = os.stat(path)
+        return DiskLRUCache.make_key(
+            'pcm', PCM_CACHE_KEY_VERSION, os.path.abspath(path), stat.st_mtime_ns, stat.st_size, sample_rate
+        )
+
+    def load(self, path, sr=None):
+        """Как librosa.load(path, sr=sr): (сигнал float32 моно, частота)
+
+        sr=None - исходная частота файла (из заголовка). Сигнал из кеша
+        отображен в память и доступен только для чтения.
+        """
+        if sr is None:
+            try:
+                sr = get_sample_rate(path)
+            except ValueError:
+                # Частоту не узнать без декодирования - ключ не построить
+                return librosa.load(path, sr=None)
+
+        key = self.make_key(path, sr)
+        entry_path = self.cache.get(key, 'npy')
+        if entry_path is not None:
+            try:
+                return numpy.load(entry_path, mmap_mode='r'), sr
+            except (FileNotFoundError, ValueError):
+                # Запись вытеснена другим воркером или недописана
+                pass
+
+        samples, sr = librosa.load(path, sr=sr)
+        samples = numpy.ascontiguousarray(samples, dtype=numpy.float32)
+        try:
+            entry_path = self.cache.store(key, 'npy', lambda tmp_path: _write_npy(tmp_path, samples))
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить PCM в кеш для {path}: {e}")
+            return samples, sr
+        # Дальше - отображение записи: декодированный массив не держится в памяти
+        return numpy.load(entry_path, mmap_mode='r'), sr
+
+    def peak(self, path, sr):
+        """Максимум |сигнала| в частоте sr (кешируется в процессе по ключу записи)"""
+        key = self.make_key(path, sr)
+        with self._peaks_lock:
+            if key in self._peaks:
+                self._peaks.move_to_end(key)
+                return self._peaks[key]
+
+        samples, _ = self.load(path, sr)
+        value = peak_of(samples)
+        with self._peaks_lock:
+            self._peaks[key] = value
+            while len(self._peaks) > PEAK_CACHE_SIZE:
+                self._peaks.popitem(last=False)
+        return value
+
+
+# Кеши процесса по (папка, квота): один на процесс пула
+_pcm_caches = {}
+_pcm_caches_lock = threading.Lock()
+
+
+def get_pcm_cache(cache_dir, max_bytes=PCM_CACHE_MAX_BYTES):
+    """Общий для воркеров и процессов пула кеш PCM в папке cache_dir"""
+    with _pcm_caches_lock:
+        pcm_cache = _pcm_caches.get((cache_dir, max_bytes))
+        if pcm_cache is None:
+            pcm_cache = PCMCache(DiskLRUCache(cache_dir, max_bytes))
+            _pcm_caches[(cache_dir, max_bytes)] = pcm_cache
+        return pcm_cache
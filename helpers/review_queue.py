@@ -0,0 +1,285 @@
+"""
+Очередь повторения предложений (интервальное повторение в стиле SM-2)
+
+Карточка - предложение диктанта, которое пользователь хотя бы раз написал
+с ошибкой. Результаты по предложениям приходят с автосохранением черновика
+(per_sentence) и из режима повторения. Хранение - review_queue.json в папке
+пользователя:
+
+    {"format": 1, "cards": {"<dictation_id>|<key>": {"ef", "reps", "interval", "due", "lapses"}}}
+
+В памяти процесса очередь держит отсортированный индекс (due, карточка):
+обновление карточки - перестановка в индексе бинарным поиском, выборка k
+ближайших к повторению - срез начала индекса, без чтения истории.
+
+Ответы записываются через буфер отложенной записи (helpers.write_behind):
+при сбросе все ответы пользователя применяются одной записью файла, а
+чтение очереди подмешивает еще не записанные ответы.
+"""
+import json
+import os
+import threading
+from contextlib import ExitStack
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+
+from helpers.history_log import file_lock
+from helpers.user_helpers import get_user_folder
+
+
+REVIEW_QUEUE_NAME = 'review_queue.json'
+REVIEW_LOCK_NAME = '.review.lock'
+REVIEW_FORMAT_VERSION = 1
+
+# Параметры SM-2
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+PASSING_QUALITY = 3
+
+# Оценки ответов по результатам предложения в диктанте
+QUALITY_PERFECT = 5
+QUALITY_CORRECTED = 2
+
+# Больше любого ключа карточки: верхняя граница поиска по дате в индексе
+MAX_KEY = '\uffff'
+
+# Счетчики per_sentence черновика: с первого раза / исправлено
+PERFECT_COUNTERS = ('number_of_perfect', 'circle_number_of_perfect')
+CORRECTED_COUNTERS = ('number_of_corrected', 'circle_number_of_corrected')
+
+
+def today_key(today=None):
+    today = today or datetime.now().date()
+    return today.year * 10000 + today.month * 100 + today.day
+
+
+def _add_days(date_key, days):
+    value = datetime.strptime(str(date_key), '%Y%m%d').date() + timedelta(days=days)
+    return value.year * 10000 + value.month * 100 + value.day
+
+
+def card_key(dictation_id, sentence_key):
+    return f'{dictation_id}|{sentence_key}'
+
+
+def split_card_key(key):
+    dictation_id, _, sentence_key = key.rpartition('|')
+    return dictation_id, sentence_key
+
+
+# ==================== SM-2 ====================
+
+def new_card():
+    return {'ef': DEFAULT_EASE, 'reps': 0, 'interval': 0, 'due': 0, 'lapses': 0}
+
+
+def schedule(card, quality, today):
+    """Новое состояние карточки после ответа с оценкой quality (0..5)"""
+    card = dict(card)
+    if quality < PASSING_QUALITY:
+        card['reps'] = 0
+        card['interval'] = 1
+        card['lapses'] += 1
+    else:
+        card['reps'] += 1
+        if card['reps'] == 1:
+            card['interval'] = 1
+        elif card['reps'] == 2:
+            card['interval'] = 6
+        else:
+            card['interval'] = round(card['interval'] * card['ef'])
+
+    card['ef'] = round(max(MIN_EASE, card['ef'] + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)), 3)
+    card['due'] = _add_days(today, card['interval'])
+    return card
+
+
+# ==================== ОЧЕРЕДЬ ====================
+
+class ReviewQueue:
+    """Карточки пользователя + индекс, отсортированный по дате повторения"""
+
+    def __init__(self, cards=None):
+        self.cards = dict(cards or {})
+        self.index = sorted((card['due'], key) for key, card in self.cards.items())
+
+    @classmethod
+    def from_doc(cls, doc):
+        if not isinstance(doc, dict) or doc.get('format') != REVIEW_FORMAT_VERSION:
+            return cls()
+        return cls(doc.get('cards'))
+
+    def copy(self):
+        """Копия без пересортировки индекса"""
+        queue = ReviewQueue()
+        queue.cards = dict(self.cards)
+        queue.index = list(self.index)
+        return queue
+
+    def to_doc(self):
+        return {'format': REVIEW_FORMAT_VERSION, 'cards': self.cards}
+
+    def review(self, key, quality, today):
+        """Учитывает ответ; карточка создается только при ошибке"""
+        card = self.cards.get(key)
+        if card is None:
+            if quality >= PASSING_QUALITY:
+                return False
+            card = new_card()
+        else:
+            position = bisect_left(self.index, (card['due'], key))
+            del self.index[position]
+
+        card = schedule(card, quality, today)
+        self.cards[key] = card
+        insort(self.index, (card['due'], key))
+        return True
+
+    def due(self, today, limit):
+        """До limit карточек, срок которых наступил (самые просроченные первыми)"""
+        end = bisect_right(self.index, (today, MAX_KEY))
+        return [
+            dict(self.cards[key], key=key)
+            for _, key in self.index[:min(end, limit)]
+        ]
+
+    def due_count(self, today):
+        return bisect_right(self.index, (today, MAX_KEY))
+
+
+# ==================== ХРАНЕНИЕ ====================
+
+_cache = {}   # путь -> (подпись файла, ReviewQueue)
+_cache_lock = threading.Lock()
+
+
+def get_review_path(email):
+    return os.path.join(get_user_folder(email), REVIEW_QUEUE_NAME)
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _load(path):
+    """Очередь из кэша процесса; файл перечитывается, только если изменился"""
+    signature = _signature(path)
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+    queue = ReviewQueue()
+    if signature is not None:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                queue = ReviewQueue.from_doc(json.load(f))
+        except Exception as e:
+            print(f'❌ [REVIEW] Ошибка чтения {path}: {e}')
+
+    with _cache_lock:
+        _cache[path] = (signature, queue)
+    return queue
+
+
+def _write_queue(path, queue):
+    """Атомарная запись очереди компактным JSON"""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(queue.to_doc(), f, ensure_ascii=False, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+_pending_sources = []
+
+
+def register_pending_answers(source, lock):
+    """Источник ответов, еще не записанных в очередь: source(email) -> [(dictation_id, ответы, дата)]
+
+    lock держится источником на время записи ответов в файл: под ним
+    чтение не увидит ответ ни дважды, ни ни разу.
+    """
+    _pending_sources.append((source, lock))
+
+
+def read_queue(email):
+    """Очередь с учетом ответов, еще не записанных буфером отложенной записи"""
+    with ExitStack() as stack:
+        for _, lock in _pending_sources:
+            stack.enter_context(lock)
+        queue = _load(get_review_path(email))
+        pending = [batch for source, _ in _pending_sources for batch in source(email)]
+
+    if pending:
+        # Кэш процесса не меняется: подмешивание - в копии
+        queue = queue.copy()
+        apply_answer_batches(queue, pending)
+    return queue
+
+
+def update_queue(email, change):
+    """change(queue) -> изменилась ли очередь; запись на диск - под межпроцессной блокировкой"""
+    path = get_review_path(email)
+    folder = os.path.dirname(path)
+    if not os.path.isdir(folder):
+        return False
+
+    with file_lock(os.path.join(folder, REVIEW_LOCK_NAME), exclusive=True):
+        queue = _load(path)
+        # Изменяется копия: читатели кэша не видят недописанное состояние
+        queue = queue.copy()
+        if not change(queue):
+            return False
+        _write_queue(path, queue)
+        with _cache_lock:
+            _cache[path] = (_signature(path), queue)
+    return True
+
+
+def apply_answer_batches(queue, batches):
+    """Применяет пачки ответов [(dictation_id, {sentence_key: оценка 0..5}, дата)] по порядку"""
+    changed = False
+    for dictation_id, answers, today in batches:
+        for sentence_key, quality in answers.items():
+            changed = queue.review(card_key(dictation_id, sentence_key), quality, today) or changed
+    return changed
+
+
+def record_answer_batches(email, batches):
+    """Все пачки ответов пользователя - одной записью очереди"""
+    if not batches:
+        return False
+    return update_queue(email, lambda queue: apply_answer_batches(queue, batches))
+
+
+# ==================== РЕЗУЛЬТАТЫ ЧЕРНОВИКА ====================
+
+def _counter_sum(progress, counters):
+    total = 0
+    for counter in counters:
+        try:
+            total += int(progress.get(counter, 0) or 0)
+        except (TypeError, ValueError):
+            pass
+    return total
+
+
+def draft_answers(previous_state, state):
+    """Оценки предложений, по которым с прошлого сохранения черновика появился результат"""
+    previous = (previous_state or {}).get('per_sentence') or {}
+    answers = {}
+    for sentence_key, progress in ((state or {}).get('per_sentence') or {}).items():
+        if not isinstance(progress, dict):
+            continue
+        before = previous.get(sentence_key) if isinstance(previous.get(sentence_key), dict) else {}
+        if _counter_sum(progress, CORRECTED_COUNTERS) > _counter_sum(before, CORRECTED_COUNTERS):
+            answers[sentence_key] = QUALITY_CORRECTED
+        elif _counter_sum(progress, PERFECT_COUNTERS) > _counter_sum(before, PERFECT_COUNTERS):
+            answers[sentence_key] = QUALITY_PERFECT
+    return answers
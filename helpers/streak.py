@@ -0,0 +1,141 @@
+"""
+Streak пользователя (дни активности подряд)
+
+Состояние хранится в info.json пользователя:
+    "streak": {"last_active_date": YYYYMMDD, "current": N, "longest": M}
+и обновляется за O(1) при появлении новой даты активности - без чтения
+истории. У пользователей, сохраненных до появления "streak", состояние
+один раз строится по всей истории при первом обновлении - иначе
+инкрементальный пересчет начался бы с нуля и затер настоящую серию.
+Полный пересчет (recompute_streak) иначе нужен только для ремонта данных.
+"""
+from datetime import datetime, timedelta
+
+from helpers.history_log import list_months, read_month
+from helpers.user_helpers import load_user_info, save_user_info
+
+
+def date_key_to_date(date_key):
+    """20251105 -> date(2025, 11, 5); None для некорректных значений"""
+    try:
+        return datetime.strptime(str(int(date_key)), '%Y%m%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def date_to_key(value):
+    return int(value.strftime('%Y%m%d'))
+
+
+def empty_streak():
+    return {'last_active_date': 0, 'current': 0, 'longest': 0}
+
+
+def get_streak_state(user_data):
+    """Состояние streak из данных пользователя (с значениями по умолчанию)"""
+    state = empty_streak()
+    stored = user_data.get('streak')
+    if isinstance(stored, dict):
+        state.update({key: stored.get(key, value) for key, value in state.items()})
+    return state
+
+
+def advance_streak(state, date_key):
+    """Учитывает день активности date_key; возвращает (новое состояние, изменилось ли)"""
+    active_date = date_key_to_date(date_key)
+    if active_date is None:
+        return state, False
+
+    last_date = date_key_to_date(state.get('last_active_date'))
+    new_state = dict(state)
+
+    if last_date is None:
+        new_state['current'] = 1
+    elif active_date == last_date:
+        return state, False
+    elif active_date < last_date:
+        # Запоздавшие данные за прошлый день не двигают текущую серию
+        return state, False
+    elif active_date - last_date == timedelta(days=1):
+        new_state['current'] = int(state.get('current', 0)) + 1
+    else:
+        new_state['current'] = 1
+
+    new_state['last_active_date'] = date_to_key(active_date)
+    new_state['longest'] = max(int(state.get('longest', 0)), new_state['current'])
+    return new_state, True
+
+
+def effective_streak(state, today=None):
+    """Серия на сегодня: прерывается, если не было активности ни сегодня, ни вчера"""
+    today = today or datetime.now().date()
+    last_date = date_key_to_date(state.get('last_active_date'))
+    if last_date is None or (today - last_date).days > 1:
+        return 0
+    return int(state.get('current', 0))
+
+
+def register_active_date(email, date_key):
+    """O(1)-обновление streak при сохранении активности за день date_key"""
+    return register_active_dates(email, [date_key])
+
+
+def register_active_dates(email, date_keys):
+    """Обновление streak сразу для нескольких дней (пакет сохранений) - одна запись info.json"""
+    user_data = load_user_info(email)
+    if not user_data:
+        return None
+
+    if isinstance(user_data.get('streak'), dict):
+        state = get_streak_state(user_data)
+        changed = False
+    else:
+        # Состояния еще нет: однократный проход по истории (новые дни уже в журнале)
+        state = scan_streak(email)
+        changed = True
+    for date_key in sorted({int(key) for key in date_keys if date_key_to_date(key)}):
+        state, advanced = advance_streak(state, date_key)
+        changed = changed or advanced
+    if not changed:
+        return state
+
+    user_data['streak'] = state
+    user_data['streak_days'] = effective_streak(state)
+    save_user_info(email, user_data)
+    return state
+
+
+def compute_streak_from_dates(active_dates):
+    """Состояние streak по полному набору дат активности (YYYYMMDD)"""
+    state = empty_streak()
+    for date_key in sorted(active_dates):
+        state, _ = advance_streak(state, date_key)
+    return state
+
+
+def scan_streak(email):
+    """Состояние streak по всей истории пользователя (без записи)"""
+    active_dates = set()
+    for month in list_months(email):
+        month_data = read_month(email, month)
+        if month_data is None:
+            continue
+        for stat in month_data.get('statistics', []):
+            date_key = stat.get('date', 0)
+            if date_key and date_key > 0:
+                active_dates.add(date_key)
+
+    return compute_streak_from_dates(active_dates)
+
+
+def recompute_streak(email):
+    """Полный пересчет streak по всей истории пользователя (ремонт данных)"""
+    user_data = load_user_info(email)
+    if not user_data:
+        return None
+
+    state = scan_streak(email)
+    user_data['streak'] = state
+    user_data['streak_days'] = effective_streak(state)
+    save_user_info(email, user_data)
+    return state
@@ -0,0 +1,200 @@
+"""
+Кеш синтеза речи (TTS) с адресацией по содержимому
+
+Ключ записи - хеш (движок, его параметры, язык, нормализованный текст),
+поэтому одно и то же предложение синтезируется один раз для всех
+диктантов. Записи лежат в общем DiskLRUCache (ограничение по размеру,
+вытеснение давно неиспользованных), а в папку диктанта
+(static/data/temp/<id>/<lang>/) копируются - без повторного синтеза.
+
+Движок подключаемый: TTS_BACKEND = 'gtts' (по умолчанию, сеть) или
+'local' (локальная заглушка без сети - для тестов и замеров).
+"""
+import os
+import shutil
+import threading
+import unicodedata
+import uuid
+import wave
+from contextlib import contextmanager
+
+import numpy
+
+from helpers.disk_cache import DiskLRUCache
+
+
+TTS_BACKEND = os.getenv('TTS_BACKEND', 'gtts')
+
+# Формат ключа кеша: при смене нормализации старые записи просто перестанут находиться
+TTS_CACHE_KEY_VERSION = 1
+
+
+def normalize_text(text):
+    """Текст для ключа кеша: NFC, без лишних пробелов по краям и внутри"""
+    return ' '.join(unicodedata.normalize('NFC', str(text or '')).split())
+
+
+# ==================== ДВИЖКИ ====================
+
+class TTSBackend:
+    """Интерфейс движка синтеза речи"""
+
+    name = ''
+    # Расширение файлов, которые пишет движок
+    ext = 'mp3'
+
+    def options(self):
+        """Параметры, влияющие на результат (входят в ключ кеша)"""
+        return {}
+
+    def synthesize(self, text, lang, path):
+        """Синтезирует text на языке lang в файл path"""
+        raise NotImplementedError
+
+
+class GTTSBackend(TTSBackend):
+    """Google Text-to-Speech (gTTS) - запрос по сети на каждое предложение"""
+
+    name = 'gtts'
+    ext = 'mp3'
+
+    def __init__(self, slow=False, tld='com'):
+        self.slow = slow
+        self.tld = tld
+
+    def options(self):
+        return {'slow': self.slow, 'tld': self.tld}
+
+    def synthesize(self, text, lang, path):
+        from gtts import gTTS
+        gTTS(text=text, lang=lang, slow=self.slow, tld=self.tld).save(path)
+
+
+class LocalTTSBackend(TTSBackend):
+    """Локальная заглушка без сети: тон, длительность которого зависит от длины текста
+
+    Пишет WAV - для тестов и замеров кеша и пакетной генерации, не для диктантов.
+    """
+
+    name = 'local'
+    ext = 'wav'
+
+    def __init__(self, sample_rate=16000, seconds_per_char=0.06, delay=0.0):
+        self.sample_rate = sample_rate
+        self.seconds_per_char = seconds_per_char
+        # Имитация задержки сетевого движка (секунды на вызов)
+        self.delay = delay
+
+    def options(self):
+        return {'sample_rate': self.sample_rate, 'seconds_per_char': self.seconds_per_char}
+
+    def synthesize(self, text, lang, path):
+        if self.delay:
+            threading.Event().wait(self.delay)
+        frames = max(1, int(len(text) * self.seconds_per_char * self.sample_rate))
+        # Высота тона зависит от языка, чтобы записи разных языков различались
+        frequency = 220 + sum(map(ord, lang)) % 220
+        samples = 8000 * numpy.sin(2 * numpy.pi * frequency * numpy.arange(frames) / self.sample_rate)
+        with wave.open(path, 'wb') as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(self.sample_rate)
+            f.writeframes(samples.astype('<i2').tobytes())
+
+
+TTS_BACKENDS = {
+    GTTSBackend.name: GTTSBackend,
+    LocalTTSBackend.name: LocalTTSBackend,
+}
+
+
+def register_tts_backend(backend_class):
+    """Подключает свой движок (класс-наследник TTSBackend)"""
+    TTS_BACKENDS[backend_class.name] = backend_class
+
+
+def create_tts_backend(name=None, **options):
+    name = name or TTS_BACKEND
+    if name not in TTS_BACKENDS:
+        raise ValueError(f'Неизвестный движок TTS: {name}')
+    return TTS_BACKENDS[name](**options)
+
+
+# ==================== КЕШ ====================
+
+def copy_entry(source_path, target_path):
+    """Копия записи кеша в target_path (через временный файл и os.replace)
+
+    Именно копия, а не жесткая ссылка: файлы диктанта перезаписываются
+    на месте (копирование в temp, загрузка, обрезка), и через общую ссылку
+    это испортило бы запись кеша для всех диктантов.
+    """
+    os.makedirs(os.path.dirname(target_path) or '.', exist_ok=True)
+    tmp_path = f'{target_path}.{uuid.uuid4().hex}.tmp'
+    try:
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, target_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class TTSCache:
+    """Синтез речи через общий дисковый кеш"""
+
+    def __init__(self, cache, backend):
+        self.cache = cache
+        self.backend = backend
+        # ключ -> [блокировка, сколько потоков ее ждут или держат]
+        self._key_locks = {}
+        self._key_locks_guard = threading.Lock()
+
+    def make_key(self, text, lang):
+        options = sorted(self.backend.options().items())
+        return DiskLRUCache.make_key(
+            'tts', TTS_CACHE_KEY_VERSION, self.backend.name, options, lang, normalize_text(text)
+        )
+
+    @contextmanager
+    def _key_lock(self, key):
+        """Блокировка ключа; удаляется из таблицы, только когда ее никто не ждет и не держит"""
+        with self._key_locks_guard:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._key_locks_guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._key_locks[key]
+
+    def get_or_synthesize(self, text, lang):
+        """Путь к записи кеша и был ли это промах: (путь, синтезировано ли сейчас)"""
+        key = self.make_key(text, lang)
+        path = self.cache.get(key, self.backend.ext)
+        if path is not None:
+            return path, False
+
+        # Одинаковые предложения одновременно (пакет, несколько вкладок) синтезируются один раз
+        with self._key_lock(key):
+            path = self.cache.get(key, self.backend.ext)
+            if path is not None:
+                return path, False
+            text = normalize_text(text)
+            path = self.cache.store(
+                key, self.backend.ext, lambda tmp_path: self.backend.synthesize(text, lang, tmp_path)
+            )
+            return path, True
+
+    def synthesize_to(self, text, lang, target_path):
+        """Аудио для (text, lang) в target_path; возвращает True, если был синтез (промах кеша)"""
+        path, synthesized = self.get_or_synthesize(text, lang)
+        try:
+            copy_entry(path, target_path)
+        except FileNotFoundError:
+            # Запись вытеснена другим воркером между поиском и копированием
+            path, synthesized = self.get_or_synthesize(text, lang)
+            copy_entry(path, target_path)
+        return synthesized
@@ -0,0 +1,305 @@
+"""
+Буфер отложенной записи (write-behind) для истории, черновиков диктантов
+и очереди повторения
+
+Сохранение в запросе - добавление в память процесса; фоновый поток
+записывает буфер на диск раз в WRITE_BEHIND_FLUSH_INTERVAL секунд или
+сразу после WRITE_BEHIND_MAX_EVENTS изменений. Чтения того же процесса
+видят еще не записанные данные (read-your-writes): события истории
+подмешиваются к несвернутым событиям журнала, черновики читаются из
+буфера раньше файла, ответы повторения применяются к копии очереди.
+
+Режим задается WRITE_BEHIND_DURABILITY:
+    'buffered' - отложенная запись; при сбое процесса теряется не больше
+                 интервала сброса / WRITE_BEHIND_MAX_EVENTS изменений;
+    'sync'     - запись на диск в запросе (как без буфера).
+
+При остановке воркера буфер сбрасывается (worker_exit в gunicorn.conf.py
+и atexit для dev-сервера). Буфер живет в памяти одного процесса, поэтому
+read-your-writes гарантирован в пределах воркера.
+"""
+import atexit
+import copy
+import os
+import threading
+import time
+
+from helpers.drafts import (
+    append_draft_patches, delete_draft_files, manifest_entry, read_draft, read_manifest,
+    update_manifest, write_draft
+)
+from helpers.history_log import (
+    append_events, coalesce_events, flush_pending_fsync,
+    get_history_folder, register_pending_source
+)
+from helpers.review_queue import record_answer_batches, register_pending_answers, today_key
+from helpers.streak import register_active_dates
+
+
+WRITE_BEHIND_DURABILITY = os.getenv('WRITE_BEHIND_DURABILITY', 'buffered')
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv('WRITE_BEHIND_FLUSH_INTERVAL', '2.0'))
+WRITE_BEHIND_MAX_EVENTS = int(os.getenv('WRITE_BEHIND_MAX_EVENTS', '200'))
+
+# Отметка удаленного черновика в буфере
+DELETED = object()
+
+
+class WriteBehindBuffer:
+    """Буфер изменений одного процесса с фоновым сбросом на диск"""
+
+    def __init__(self, interval, max_events):
+        self.interval = interval
+        self.max_events = max_events
+        self._history = {}   # email -> [события]
+        self._drafts = {}    # (папка, id) -> {'state': состояние или DELETED, 'ops': [операции записи]}
+        self._reviews = {}   # email -> [(dictation_id, {key: оценка}, дата)]
+        self._count = 0
+        self._lock = threading.Lock()
+        # Держится на время записи: чтение не видит данные одновременно в буфере и на диске
+        self.flush_lock = threading.RLock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    # ---------- добавление ----------
+
+    def add_history_events(self, email, events):
+        now = time.time()
+        with self._lock:
+            pending = self._history.setdefault(email, [])
+            for event in events:
+                event = dict(event)
+                event.setdefault('ts', now)
+                pending.append(event)
+            self._touch(len(events))
+
+    def add_draft_op(self, key, state, op):
+        """Запоминает итоговое состояние черновика и операцию записи на диск
+
+        op: ('base', состояние) | ('patch', {"version": N, "ops": [...]}) | ('delete',)
+        """
+        with self._lock:
+            entry = self._drafts.setdefault(key, {'ops': []})
+            entry['state'] = state if state is DELETED else copy.deepcopy(state)
+            entry['ops'].append(op)
+            self._touch(1)
+
+    def add_review_answers(self, email, dictation_id, answers, today):
+        with self._lock:
+            self._reviews.setdefault(email, []).append((dictation_id, dict(answers), today))
+            self._touch(len(answers))
+
+    def _touch(self, added):
+        """Учитывает изменения и при необходимости будит фоновый поток (под self._lock)"""
+        self._count += added
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+        if self._count >= self.max_events:
+            self._wakeup.set()
+
+    # ---------- чтение ----------
+
+    def history_events(self, history_folder):
+        """Еще не записанные события истории для папки history пользователя"""
+        with self.flush_lock, self._lock:
+            for email, events in self._history.items():
+                if get_history_folder(email) == history_folder:
+                    return [dict(event) for event in events]
+        return []
+
+    def get_draft(self, key):
+        """(есть ли в буфере, состояние или DELETED)"""
+        with self.flush_lock, self._lock:
+            if key not in self._drafts:
+                return False, None
+            state = self._drafts[key]['state']
+            return True, state if state is DELETED else copy.deepcopy(state)
+
+    def drafts_in_folder(self, folder):
+        """{id: состояние или DELETED} для черновиков папки, еще не записанных на диск"""
+        with self.flush_lock, self._lock:
+            return {
+                dictation_id: entry['state'] if entry['state'] is DELETED else copy.deepcopy(entry['state'])
+                for (draft_folder, dictation_id), entry in self._drafts.items()
+                if draft_folder == folder
+            }
+
+    def review_answers(self, email):
+        """Еще не записанные ответы повторения пользователя (вызывается под flush_lock)"""
+        with self._lock:
+            return list(self._reviews.get(email, ()))
+
+    # ---------- сброс ----------
+
+    def flush(self):
+        """Записывает весь буфер на диск; возвращает число записанных изменений"""
+        with self.flush_lock:
+            with self._lock:
+                history, self._history = self._history, {}
+                drafts, self._drafts = self._drafts, {}
+                reviews, self._reviews = self._reviews, {}
+                count, self._count = self._count, 0
+
+            for email, events in history.items():
+                try:
+                    events = coalesce_events(events)
+                    append_events(email, events)
+                    register_active_dates(email, [
+                        event['stats'].get('date') for event in events if event.get('type') == 'day_stats'
+                    ])
+                except Exception as e:
+                    print(f'❌ [WRITE_BEHIND] Ошибка записи истории {email}: {e}')
+
+            manifest_changes = {}
+            for (folder, dictation_id), entry in drafts.items():
+                try:
+                    write_draft_ops(folder, dictation_id, entry['ops'])
+                    state = entry['state']
+                    manifest_changes.setdefault(folder, {})[dictation_id] = None if state is DELETED else state
+                except Exception as e:
+                    print(f'❌ [WRITE_BEHIND] Ошибка записи черновика {dictation_id}: {e}')
+
+            # Очередь повторения - одна запись на пользователя за сброс
+            for email, batches in reviews.items():
+                try:
+                    record_answer_batches(email, batches)
+                except Exception as e:
+                    print(f'❌ [WRITE_BEHIND] Ошибка записи очереди повторения {email}: {e}')
+
+            # Манифест черновиков - одна запись на папку за сброс
+            for folder, changes in manifest_changes.items():
+                try:
+                    update_manifest(folder, changes)
+                except Exception as e:
+                    print(f'❌ [WRITE_BEHIND] Ошибка обновления манифеста {folder}: {e}')
+
+        return count
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f'❌ [WRITE_BEHIND] Ошибка фонового сброса: {e}')
+
+
+_buffer = WriteBehindBuffer(WRITE_BEHIND_FLUSH_INTERVAL, WRITE_BEHIND_MAX_EVENTS)
+
+register_pending_source(_buffer.history_events, _buffer.flush_lock)
+register_pending_answers(_buffer.review_answers, _buffer.flush_lock)
+
+
+def is_buffered():
+    return WRITE_BEHIND_DURABILITY == 'buffered'
+
+
+# ==================== ИСТОРИЯ ====================
+
+def submit_history_events(email, events):
+    """Сохраняет события истории и обновляет streak (сразу или через буфер)"""
+    if is_buffered():
+        _buffer.add_history_events(email, events)
+        return
+
+    events = coalesce_events(events)
+    append_events(email, events)
+    register_active_dates(email, [
+        event['stats'].get('date') for event in events if event.get('type') == 'day_stats'
+    ])
+
+
+# ==================== ОЧЕРЕДЬ ПОВТОРЕНИЯ ====================
+
+def submit_review_answers(email, dictation_id, answers):
+    """Ответы {sentence_key: оценка 0..5} в очередь повторения (сразу или через буфер)"""
+    if not answers:
+        return
+    if is_buffered():
+        _buffer.add_review_answers(email, dictation_id, answers, today_key())
+        return
+    record_answer_batches(email, [(dictation_id, answers, today_key())])
+
+
+# ==================== ЧЕРНОВИКИ ====================
+
+def write_draft_ops(folder, dictation_id, ops):
+    """Выполняет накопленные операции записи черновика
+
+    Все, что было до последней полной записи или удаления, пропускается;
+    дельты после нее дописываются в журнал одной записью.
+    """
+    start = 0
+    for index, op in enumerate(ops):
+        if op[0] in ('base', 'delete'):
+            start = index
+
+    patches = []
+    for op in ops[start:]:
+        if op[0] == 'delete':
+            delete_draft_files(folder, dictation_id)
+        elif op[0] == 'base':
+            write_draft(folder, dictation_id, op[1])
+        else:
+            patches.append(op[1])
+
+    if patches:
+        append_draft_patches(folder, dictation_id, patches)
+
+
+def _submit_draft_op(folder, dictation_id, state, op):
+    if is_buffered():
+        _buffer.add_draft_op((folder, dictation_id), state, op)
+    else:
+        write_draft_ops(folder, dictation_id, [op])
+        update_manifest(folder, {dictation_id: None if state is DELETED else state})
+
+
+def save_draft(folder, dictation_id, state):
+    """Полное сохранение черновика"""
+    _submit_draft_op(folder, dictation_id, state, ('base', state))
+
+
+def patch_draft(folder, dictation_id, state, patch_entry):
+    """Сохранение дельты; state - черновик после ее применения"""
+    _submit_draft_op(folder, dictation_id, state, ('patch', patch_entry))
+
+
+def delete_draft(folder, dictation_id):
+    _submit_draft_op(folder, dictation_id, DELETED, ('delete',))
+
+
+def load_draft(folder, dictation_id):
+    """Состояние черновика (с учетом буфера) или None"""
+    buffered, state = _buffer.get_draft((folder, dictation_id))
+    if buffered:
+        return None if state is DELETED else state
+    return read_draft(folder, dictation_id)
+
+
+def list_drafts(folder):
+    """{dictation_id: запись манифеста} всех черновиков папки (с учетом буфера)"""
+    drafts = dict(read_manifest(folder))
+
+    for dictation_id, state in _buffer.drafts_in_folder(folder).items():
+        if state is DELETED:
+            drafts.pop(dictation_id, None)
+        else:
+            # Размер на диске станет известен после сброса буфера
+            previous = drafts.get(dictation_id) or {}
+            drafts[dictation_id] = manifest_entry(state, previous.get('size', 0))
+    return drafts
+
+
+# ==================== ОСТАНОВКА ====================
+
+def drain():
+    """Сбрасывает буфер и fsync журналов (остановка воркера)"""
+    written = _buffer.flush()
+    flush_pending_fsync()
+    if written:
+        print(f'✅ [WRITE_BEHIND] При остановке записано изменений: {written}')
+
+
+atexit.register(drain)
@@ -1,9 +1,10 @@
 import json
 import os
 from flask import Blueprint, abort, current_app, render_template, url_for
+from helpers.dictation_difficulty import get_dictation_difficulty
 from helpers.language_data import load_language_data
 from helpers.user_helpers import get_current_user, login_required, get_safe_email
-from routes.index import get_cover_url_for_id
+from routes.index import get_cover_sized_url, resolve_cover
 
 dictation_bp = Blueprint('dictation', __name__)
 
@@ -30,6 +31,43 @@ def show_dictation(dictation_id, lang_orig, lang_tr):
     is_dialog = info.get("is_dialog", False)
     speakers = info.get("speakers", {})
 
+    title, sentences = load_dictation_sentences(dictation_id, lang_orig, lang_tr)
+    
+    # Получаем текущего пользователя
+    current_user = get_current_user()
+    
+
+    cover = resolve_cover(dictation_id, lang_orig)
+    cover_url = cover[1]
+    # Шапка тренировки показывает обложку высотой до 52px
+    cover_thumb_url = get_cover_sized_url(dictation_id, lang_orig, height=52, cover=cover)
+    cover_thumb_url_2x = get_cover_sized_url(dictation_id, lang_orig, height=104, cover=cover)
+
+    # Рендерим страницу
+    return render_template(
+        "dictation.html",
+        dictation_id=dictation_id,
+        title_orig=title,
+        level=level,
+        language_original=lang_orig,
+        language_translation=lang_tr,
+        sentences=sentences,
+        current_user=current_user,
+        is_dialog=is_dialog,
+        speakers=speakers,
+        cover_url=cover_url,
+        cover_thumb_url=cover_thumb_url,
+        cover_thumb_url_2x=cover_thumb_url_2x,
+        difficulty=get_dictation_difficulty(dictation_id),
+        dikt_numer=info.get("Dikt_numer") or info.get("dikt_numer") or dictation_id,
+        language_data=load_language_data()
+    )
+
+
+def load_dictation_sentences(dictation_id, lang_orig, lang_tr):
+    """Заголовок и предложения диктанта (текст, перевод, аудио) для пары языков"""
+    base_path = os.path.join('static', 'data', 'dictations', dictation_id)
+
     # Пути к JSON-файлам 
     path_sentences_orig = os.path.join(base_path, lang_orig,  "sentences.json")
     path_sentences_tr = os.path.join(base_path, lang_tr, "sentences.json")
@@ -85,27 +123,26 @@ def show_dictation(dictation_id, lang_orig, lang_tr):
         }
 
         sentences.append(sentence)
-    
-    # Получаем текущего пользователя
-    current_user = get_current_user()
-    
 
-    cover_url = get_cover_url_for_id(dictation_id, lang_orig)
+    return title, sentences
 
-    # Рендерим страницу
-    return render_template(
-        "dictation.html",
-        dictation_id=dictation_id,
-        title_orig=title,
-        level=level,
-        language_original=lang_orig,
-        language_translation=lang_tr,
-        sentences=sentences,
-        current_user=current_user,
-        is_dialog=is_dialog,
-        speakers=speakers,
-        cover_url=cover_url,
-        dikt_numer=info.get("Dikt_numer") or info.get("dikt_numer") or dictation_id,
-        language_data=load_language_data()
-    )
 
+def get_dictation_languages(dictation_id):
+    """(язык оригинала, язык перевода) диктанта по info.json или папкам с sentences.json"""
+    base_path = os.path.join('static', 'data', 'dictations', dictation_id)
+    info = {}
+    try:
+        with open(os.path.join(base_path, "info.json"), "r", encoding="utf-8") as f:
+            info = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+
+    language_dirs = sorted(
+        sub for sub in (os.listdir(base_path) if os.path.isdir(base_path) else [])
+        if os.path.isfile(os.path.join(base_path, sub, "sentences.json"))
+    )
+    lang_orig = info.get("language_original") or (language_dirs[0] if language_dirs else "")
+    lang_tr = info.get("language_translation") or next(
+        (lang for lang in language_dirs if lang != lang_orig), ""
+    )
+    return lang_orig, lang_tr
@@ -8,22 +8,28 @@ import pathlib
 from flask import Blueprint, Flask,jsonify, logging, render_template, request, send_file, url_for
 from flask_jwt_extended import jwt_required
 from googletrans import Translator
-from gtts import gTTS
 from flask import current_app
 import shortuuid
 from datetime import datetime
 import logging
 import requests
 import time
-import librosa
-import soundfile as sf
-import numpy
-from PIL import Image
 
 # from helpers.user_helpers import get_safe_email
 from helpers.language_data import load_language_data
 from helpers.user_helpers import get_safe_email_from_token, get_current_user 
 from routes.index import get_cover_url_for_id
+from helpers.image_pipeline import process_upload, copy_image_variants, ImagePipelineError, COVER_VARIANTS
+from helpers.disk_cache import DiskLRUCache
+from helpers.tts_cache import TTSCache, create_tts_backend
+from helpers.jobs import JobRunner, JOB_WORKERS, run_inline
+from helpers.audio_meta import get_duration
+from helpers.audio_tasks import (
+    split_into_parts_task, cut_audio_task, split_sentences_task, combined_audio_task, segment_task,
+    tts_batch_task, generate_tts_batch, SPLIT_MODE_ENCODE, SPLIT_MODE_COPY
+)
+from helpers.audio_segmentation import DEFAULT_SEGMENT_PARAMS
+from helpers.pcm_cache import PCM_CACHE_MAX_BYTES
 
 
 # Настройка логгера
@@ -55,9 +61,46 @@ def translate_text():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# ==============================================================
+# Кеш синтеза речи: одинаковые (текст, язык) синтезируются один раз
+TTS_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+_tts_cache = None
+
+
+def get_tts_cache():
+    """Общий для всех диктантов кеш TTS (дисковый LRU, общий для воркеров)"""
+    global _tts_cache
+    if _tts_cache is None:
+        cache_dir = current_app.config.get(
+            "TTS_CACHE_DIR",
+            os.path.join(current_app.instance_path, "cache", "tts")
+        )
+        max_bytes = current_app.config.get("TTS_CACHE_MAX_BYTES", TTS_CACHE_MAX_BYTES)
+        _tts_cache = TTSCache(DiskLRUCache(cache_dir, max_bytes), create_tts_backend())
+    return _tts_cache
+
+
+def validate_tts_item(item):
+    """Ошибка в элементе синтеза (text, language, filename_audio) или None"""
+    if not isinstance(item, dict) or not all(
+        isinstance(item.get(field), str) and item.get(field).strip()
+        for field in ('text', 'language', 'filename_audio')
+    ):
+        return "Каждый элемент: text, language, filename_audio"
+    # Имена файлов и языков - только внутри папки диктанта
+    if os.path.basename(item['filename_audio']) != item['filename_audio'] or os.path.basename(item['language']) != item['language']:
+        return f"Некорректное имя файла или языка: {item['language']}/{item['filename_audio']}"
+    return None
+
+
+def is_valid_dictation_id(dictation_id):
+    return bool(dictation_id) and isinstance(dictation_id, str) and os.path.basename(dictation_id) == dictation_id
+
+
 @editor_bp.route('/generate_audio', methods=['POST'])
 def generate_audio():
-    data = request.json
+    data = request.get_json(silent=True) or {}
     logging.info("Начало генерации аудио")
 
     try:
@@ -66,9 +109,13 @@ def generate_audio():
         if not safe_email:
             logging.error("Отсутствует safe_email")
             return jsonify({"success": False, "error": "Отсутствует safe_email"}), 400
-        if not dictation_id:
+        if not is_valid_dictation_id(dictation_id):
             return jsonify({"success": False, "error": "Отсутствует ID диктанта"}), 400
 
+        error = validate_tts_item(data)
+        if error:
+            return jsonify({"success": False, "error": error}), 400
+
         text = data.get('text')
         tipe_audio  = data.get('tipe_audio') or 'avto'
         filename_audio  = data.get('filename_audio')
@@ -91,11 +138,10 @@ def generate_audio():
         # Генерируем имя файла
         filepath = os.path.join(audio_dir, filename_audio)
         
-        # Генерируем аудио с обработкой ошибок
+        # Генерируем аудио с обработкой ошибок (повторный текст берется из кеша TTS)
         try:
-            tts = gTTS(text=text, lang=lang)
-            tts.save(filepath)
-            logging.info(f"Аудиофайл успешно сохранен: {filepath}")
+            synthesized = get_tts_cache().synthesize_to(text, lang, filepath)
+            logging.info(f"Аудиофайл успешно сохранен: {filepath} ({'синтез' if synthesized else 'из кеша'})")
             
             # Формируем URL для доступа к файлу
             # Возвращаем относительный URL до сгенерированного файла
@@ -119,6 +165,109 @@ def generate_audio():
             "error": f"Внутренняя ошибка сервера: {e}"
         }), 500
 
+# ==============================================================
+# Пакетная генерация аудио
+TTS_BATCH_MAX_ITEMS = 500
+# Больше - фоновым заданием: синхронный запрос не должен упираться в таймаут воркера
+TTS_BATCH_SYNC_MAX_ITEMS = int(os.getenv('TTS_BATCH_SYNC_MAX_ITEMS', '24'))
+
+
+@editor_bp.route('/generate_audio/batch', methods=['POST'])
+def generate_audio_batch():
+    """Аудио для списка предложений за один запрос
+
+    {"dictation_id", "safe_email", "items": [{"key", "text", "language", "filename_audio"}]}
+    -> {"success", "results": [...в порядке items]}. Элементы синтезируются
+    параллельно. Пакет больше TTS_BATCH_SYNC_MAX_ITEMS (или async=true)
+    выполняется фоновым заданием: 202 + job_id, результат - в статусе задания.
+    """
+    data = request.get_json(silent=True) or {}
+    dictation_id = data.get('dictation_id')
+    items = data.get('items')
+
+    if not data.get('safe_email'):
+        return jsonify({"success": False, "error": "Отсутствует safe_email"}), 400
+    if not is_valid_dictation_id(dictation_id):
+        return jsonify({"success": False, "error": "Отсутствует ID диктанта"}), 400
+    if not isinstance(items, list) or not items:
+        return jsonify({"success": False, "error": "Нет элементов для генерации"}), 400
+    if len(items) > TTS_BATCH_MAX_ITEMS:
+        return jsonify({"success": False, "error": f"Не больше {TTS_BATCH_MAX_ITEMS} элементов за запрос"}), 413
+
+    for item in items:
+        error = validate_tts_item(item)
+        if error:
+            return jsonify({"success": False, "error": error}), 400
+
+    if len(items) <= TTS_BATCH_SYNC_MAX_ITEMS and not is_async_request(data):
+        return jsonify(generate_tts_batch(get_tts_cache(), dictation_id, items, lambda fraction: None))
+
+    tts_cache = get_tts_cache()
+    params = {
+        'cache_dir': tts_cache.cache.base_dir,
+        'cache_max_bytes': tts_cache.cache.max_bytes,
+        'backend': tts_cache.backend.name,
+        'dictation_id': dictation_id,
+        'items': items
+    }
+    return submit_audio_job('generate_audio_batch', tts_batch_task, params)
+
+
+# ==============================================================
+# Фоновые задания обработки аудио (пул процессов, статус - /api/jobs/<id>)
+_job_runner = None
+
+
+def get_job_runner():
+    """Общий пул заданий; таблица заданий - SQLite в instance/"""
+    global _job_runner
+    if _job_runner is None:
+        db_path = current_app.config.get(
+            "JOBS_DB_PATH",
+            os.getenv("JOBS_DB_PATH", os.path.join(current_app.instance_path, "jobs.sqlite3"))
+        )
+        _job_runner = JobRunner(db_path, current_app.config.get("JOB_WORKERS", JOB_WORKERS))
+    return _job_runner
+
+
+def is_async_request(data):
+    """async=true в строке запроса или в теле"""
+    value = request.args.get('async', (data or {}).get('async', False))
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def get_pcm_cache_params():
+    """Папка и квота кеша PCM для заданий - в instance/, как у кеша TTS и таблицы заданий"""
+    return {
+        'cache_dir': current_app.config.get(
+            "PCM_CACHE_DIR",
+            os.getenv("PCM_CACHE_DIR") or os.path.join(current_app.instance_path, "cache", "pcm")
+        ),
+        'max_bytes': current_app.config.get("PCM_CACHE_MAX_BYTES", PCM_CACHE_MAX_BYTES)
+    }
+
+
+def run_audio_task(kind, func, data, params):
+    """Задание сразу (ответ как раньше) или в фоне: 202 + job_id"""
+    params = dict(params, pcm_cache=get_pcm_cache_params())
+    if not is_async_request(data):
+        body, status = run_inline(func, params)
+        return jsonify(body), status
+
+    return submit_audio_job(kind, func, params)
+
+
+def submit_audio_job(kind, func, params):
+    """Задание в пул процессов -> 202 + job_id и адрес статуса"""
+    job_id = get_job_runner().submit(kind, func, params)
+    logger.info(f"Задание {kind} поставлено в очередь: {job_id}")
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status_url": url_for('jobs.get_job_status', job_id=job_id)
+    }), 202
+
+
 # ==============================================================
 # Генерирует ID в формате dicta_ + timestamp (как в старых диктантах)
 def generate_dictation_id():
@@ -306,61 +455,25 @@ def split_audio_into_parts():
         if not os.path.exists(source_path):
             return jsonify({'error': 'Source audio file not found'}), 404
 
-        # Создаем папку для частей
-        parts_dir = os.path.join("static", "data", "temp", dictation_id, language, "mp3_1")
-        os.makedirs(parts_dir, exist_ok=True)
-
         # Получаем длительность аудио файла из параметров start/end
         start_time = data.get('start_time', 0)
         end_time = data.get('end_time')
         
         if end_time is None:
-            return jsonify({'error': 'End time is required'}), 400
-            
-        audio_duration = end_time - start_time
-        part_duration = audio_duration / num_parts
-
-        # Загружаем исходный аудио файл
-        try:
-            y, sr = librosa.load(source_path, sr=None)
-            logger.info(f"Загружен аудио файл: {len(y)} samples, sample rate: {sr}")
-        except Exception as e:
-            logger.error(f"Ошибка загрузки аудио файла: {e}")
-            return jsonify({'error': f'Cannot load audio file: {str(e)}'}), 400
-
-        created_files = []
-        for i in range(num_parts):
-            # Учитываем время старта диктанта, которое установил пользователь
-            part_start_time = start_time + (i * part_duration)
-            part_end_time = start_time + ((i + 1) * part_duration)
-            
-            # Имя файла в формате 001_en_mp3_1.mp3
-            part_filename = f"{i:03d}_{language}_mp3_1.mp3"
-            part_path = os.path.join(parts_dir, part_filename)
-            
-            # Отрезаем нужный кусок аудио (в сэмплах)
-            start_sample = int(part_start_time * sr)
-            end_sample = int(part_end_time * sr)
-            
-            # Извлекаем отрезок аудио
-            audio_segment = y[start_sample:end_sample]
-            
-            # Сохраняем отрезок как отдельный файл
-            sf.write(part_path, audio_segment, sr)
-            
-            created_files.append({
-                'filename': part_filename,
-                'start_time': part_start_time,
-                'end_time': part_end_time,
-                'url': f"/static/data/temp/{dictation_id}/{language}/mp3_1/{part_filename}"
-            })
-
-        logger.info(f"✅ Создано {len(created_files)} частей аудио")
-        
-        return jsonify({
-            "success": True,
-            "message": f"Аудио разделено на {num_parts} частей",
-            "parts": created_files
+            # Без end_time - до конца файла (длительность из заголовка, без декодирования)
+            try:
+                end_time = get_duration(source_path)
+            except ValueError:
+                return jsonify({'error': 'End time is required'}), 400
+
+        return run_audio_task('split_audio_into_parts', split_into_parts_task, data, {
+            'dictation_id': dictation_id,
+            'language': language,
+            'source_path': source_path,
+            'parts_dir': os.path.join("static", "data", "temp", dictation_id, language, "mp3_1"),
+            'num_parts': num_parts,
+            'start_time': start_time,
+            'end_time': end_time
         })
         
     except Exception as e:
@@ -368,9 +481,6 @@ def split_audio_into_parts():
         return jsonify({'error': str(e)}), 500
 
 
-    
-
-
 @editor_bp.route('/api/cover', methods=['POST'])
 def api_upload_cover():
     """Загрузка cover для диктанта"""
@@ -392,29 +502,20 @@ def api_upload_cover():
         if not cover_file.content_type.startswith('image/'):
             return jsonify({'error': 'File must be an image'}), 400
         
-        # Проверяем размер файла (максимум 5MB)
-        if len(cover_file.read()) > 5 * 1024 * 1024:
-            return jsonify({'error': 'File size must be less than 5MB'}), 400
-        
-        # Сбрасываем позицию файла
-        cover_file.seek(0)
-        
         # Создаем папку диктанта если её нет (в temp папке)
         dictation_path = os.path.join('static', 'data', 'temp', dictation_id)
         os.makedirs(dictation_path, exist_ok=True)
         
-        # Сохраняем cover
-        cover_path = os.path.join(dictation_path, 'cover.webp')
-        
-        # Открываем изображение и конвертируем в WEBP
-        image = Image.open(cover_file.stream)
-        
-        # Изменяем размер до 200x120 (как в карточках)
-        image = image.resize((200, 120), Image.Resampling.LANCZOS)
-        
-        # Сохраняем в формате WEBP
-        image.save(cover_path, 'WEBP', quality=85)
-        
+        # Размер проверяется при потоковом чтении (максимум 5MB), затем одно
+        # декодирование -> cover.webp 200x120 (как в карточках) + @2x
+        try:
+            process_upload(
+                cover_file,
+                dictation_path,
+                current_app.config.get('COVER_VARIANTS', COVER_VARIANTS)
+            )
+        except ImagePipelineError as e:
+            return jsonify({'error': str(e)}), 400
         
         return jsonify({
             'success': True,
@@ -567,14 +668,9 @@ def copy_dictation_to_temp():
         else:
             logger.warning(f"⚠️ Файл {source_info_path} не найден")
         
-        # Копируем cover.webp
-        source_cover_path = os.path.join(source_dictation_path, 'cover.webp')
-        temp_cover_path = os.path.join(temp_dictation_path, 'cover.webp')
-        
-        if os.path.exists(source_cover_path):
-            shutil.copy2(source_cover_path, temp_cover_path)
-        else:
-            logger.warning(f"⚠️ Файл {source_cover_path} не найден")
+        # Копируем cover.webp (и его варианты cover@2x.*)
+        if not copy_image_variants(source_dictation_path, temp_dictation_path, 'cover'):
+            logger.warning(f"⚠️ Обложка в {source_dictation_path} не найдена")
         
         # Копируем папки языков
         for lang in [language_original, language_translation]:
@@ -710,11 +806,8 @@ def save_dictation_final():
                         shutil.copy2(src_file, dst_file)
                         logger.info(f"Скопирован аудиофайл: {rel_path}")
             
-            # Копируем аватар если есть
-            avatar_src = os.path.join(temp_path, 'cover.webp')
-            if os.path.exists(avatar_src):
-                avatar_dst = os.path.join(final_path, 'cover.webp')
-                shutil.copy2(avatar_src, avatar_dst)
+            # Копируем обложку и её варианты если есть
+            copy_image_variants(temp_path, final_path, 'cover')
             
             # Не удаляем temp папку при обычном сохранении — пользователь может продолжать редактирование
             logger.info(f"Пропускаем очистку temp папки при сохранении: {temp_path}")
@@ -1003,12 +1096,10 @@ def cut_audio_file():
         data = request.get_json()
         logger.info(f"Получены данные для обрезки аудио: {data}")
         
-        dictation_id = data.get('dictation_id')
         filename = data.get('filename')
         filepath = data.get('filepath')
         start_time = float(data.get('start_time', 0))  # изменено на snake_case и преобразование в float
         end_time = float(data.get('end_time', 0))      # изменено на snake_case и преобразование в float
-        language = data.get('language', 'en')
         
         if not filename or not filepath:
             logger.error("Отсутствуют filename или filepath")
@@ -1024,44 +1115,12 @@ def cut_audio_file():
         
         # Обрезание аудио: единый путь через ffmpeg (без перекодирования)
         logger.info(f"Обрезание аудио: {filename} с {start_time} по {end_time}")
-
-        try:
-            import subprocess, tempfile
-            ext = os.path.splitext(physical_path)[1].lower()
-
-            with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp_out:
-                tmp_out_path = tmp_out.name
-
-            # Команда ffmpeg: копирование дорожек без перекодирования (-c copy)
-            cmd = [
-                'ffmpeg', '-y',
-                '-i', physical_path,
-                '-ss', str(max(0.0, float(start_time))),
-                '-to', str(max(0.0, float(end_time))),
-                '-c', 'copy',
-                tmp_out_path
-            ]
-            logger.info(f"Запуск ffmpeg: {' '.join(cmd)}")
-            proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            if proc.returncode != 0:
-                logger.error(f"ffmpeg error: {proc.stderr.decode(errors='ignore')}")
-                return jsonify({'success': False, 'error': 'ffmpeg не смог обрезать файл'}), 500
-
-            # Заменяем исходный файл обрезанной версией
-            os.replace(tmp_out_path, physical_path)
-            logger.info(f"Аудиофайл успешно обрезан и перезаписан (ffmpeg): {filename}")
-
-        except Exception as e:
-            logger.error(f"Ошибка при обрезании аудио (ffmpeg): {e}", exc_info=True)
-            return jsonify({'success': False, 'error': f'Ошибка обрезания аудио: {str(e)}'}), 500
-        
-        return jsonify({
-            'success': True,
+        return run_audio_task('cut_audio', cut_audio_task, data, {
             'filename': filename,
             'filepath': filepath,
+            'physical_path': physical_path,
             'start_time': start_time,
-            'end_time': end_time,
-            'message': 'Аудиофайл успешно обрезан'
+            'end_time': end_time
         })
         
     except Exception as e:
@@ -1078,7 +1137,6 @@ def split_audio_file():
         filename = data.get('filename')
         filepath = data.get('filepath')
         sentences = data.get('sentences', [])
-        dictation_id = data.get('dictation_id')
         
         if not filename or not filepath or not sentences:
             return jsonify({'success': False, 'error': 'Не указаны необходимые параметры'}), 400
@@ -1090,80 +1148,70 @@ def split_audio_file():
             return jsonify({'success': False, 'error': 'Исходный файл не найден'}), 404
         
         logger.info(f"Разрезание аудио: {filename} на {len(sentences)} предложений")
-        
-        try:
-            import librosa
-            import soundfile as sf
-            
-            # Загружаем аудиофайл
-            y, sr = librosa.load(physical_path, sr=None)
-            
-            # Создаем директорию для обрезанных файлов
-            output_dir = os.path.dirname(physical_path)
-            
-            # Разрезаем аудио на предложения
-            created_files = []  # Список созданных файлов для ответа
-            
-            for sentence in sentences:
-                key = sentence.get('key')
-                start_time = sentence.get('start_time', 0)
-                end_time = sentence.get('end_time', 0)
-                language = sentence.get('language', 'en')
-                
-                if not key or start_time >= end_time:
-                    continue
-                
-                # Вычисляем индексы для обрезки
-                start_sample = int(start_time * sr)
-                end_sample = int(end_time * sr)
-                
-                # Обрезаем аудио
-                y_segment = y[start_sample:end_sample]
-                
-                # Создаем имя файла для предложения
-                segment_filename = f"{key}_{language}_user.mp3"
-                segment_path = os.path.join(output_dir, segment_filename)
-                
-                # Сохраняем обрезанный файл
-                sf.write(segment_path, y_segment, sr)
-                
-                # Добавляем информацию о созданном файле
-                created_files.append({
-                    'key': key,
-                    'filename': segment_filename,
-                    'start_time': start_time,
-                    'end_time': end_time
-                })
-                
-                logger.info(f"Создан файл: {segment_filename} ({start_time:.2f}s - {end_time:.2f}s)")
-            
-            logger.info(f"Аудиофайл успешно разрезан на {len(sentences)} предложений")
-            
-        except ImportError:
-            logger.error("Библиотека librosa не установлена")
-            return jsonify({'success': False, 'error': 'Библиотека librosa не установлена'}), 500
-        except Exception as e:
-            logger.error(f"Ошибка при разрезании аудио: {e}")
-            return jsonify({'success': False, 'error': f'Ошибка разрезания аудио: {str(e)}'}), 500
-        
-        return jsonify({
-            'success': True,
-            'message': f'Аудиофайл успешно разрезан на {len(created_files)} предложений',
-            'sentences_count': len(created_files),
-            'files': created_files  # Возвращаем информацию о созданных файлах
+        # mode: 'encode' (по умолчанию) или 'copy' - копирование потока ffmpeg без перекодирования
+        mode = data.get('mode', SPLIT_MODE_ENCODE)
+        if mode not in (SPLIT_MODE_ENCODE, SPLIT_MODE_COPY):
+            return jsonify({'success': False, 'error': f'Неизвестный режим разрезания: {mode}'}), 400
+
+        return run_audio_task('split_audio', split_sentences_task, data, {
+            'physical_path': physical_path,
+            'sentences': sentences,
+            'mode': mode
         })
         
     except Exception as e:
         logger.error(f"Ошибка при разрезании аудиофайла: {e}")
         return jsonify({'success': False, 'error': f'Ошибка разрезания: {str(e)}'}), 500
 
+@editor_bp.route('/api/audio/segment', methods=['POST'])
+def segment_audio_file():
+    """Разметка записи на предложения по паузам: ответ подходит для sentences в /split-audio
+
+    Параметры (необязательные): threshold_db, min_gap, min_sentence, padding (секунды), frame_ms.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        filepath = data.get('filepath')
+        language = data.get('language', 'en')
+
+        if not filepath:
+            return jsonify({'success': False, 'error': 'Не указан файл'}), 400
+
+        # Получаем физический путь к файлу (только внутри папки временных диктантов)
+        physical_path = filepath.replace('/static/', 'static/')
+        temp_root = os.path.abspath(os.path.join('static', 'data', 'temp'))
+        if not os.path.abspath(physical_path).startswith(temp_root + os.sep):
+            return jsonify({'success': False, 'error': 'Недопустимый путь к файлу'}), 400
+
+        if not os.path.exists(physical_path):
+            return jsonify({'success': False, 'error': 'Исходный файл не найден'}), 404
+
+        segment_params = {}
+        for name, default in DEFAULT_SEGMENT_PARAMS.items():
+            try:
+                segment_params[name] = float(data.get(name, default))
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'error': f'{name} должен быть числом'}), 400
+        if segment_params['frame_ms'] <= 0 or min(segment_params['min_gap'], segment_params['min_sentence'], segment_params['padding']) < 0:
+            return jsonify({'success': False, 'error': 'frame_ms должен быть больше 0, длительности - не меньше 0'}), 400
+
+        return run_audio_task('segment_audio', segment_task, data, {
+            'physical_path': physical_path,
+            'language': language,
+            'segment_params': segment_params
+        })
+
+    except Exception as e:
+        logger.error(f"Ошибка при разметке аудиофайла: {e}")
+        return jsonify({'success': False, 'error': f'Ошибка разметки: {str(e)}'}), 500
+
+
 @editor_bp.route('/create-combined-audio', methods=['POST'])
 def create_combined_audio():
     """Создание комбинированного аудио файла из последовательности файлов и пауз"""
     try:
         data = request.get_json()
         dictation_id = data.get('dictation_id')
-        safe_email = data.get('safe_email')
         file_sequence = data.get('file_sequence', [])
         pattern = data.get('pattern', '')
         
@@ -1187,146 +1235,12 @@ def create_combined_audio():
         else:
             # Генерируем имя файла: audio_<комбинация>
             output_filename = f"audio_{pattern}.mp3"
-        output_path = os.path.join(temp_dir, output_filename)
-        
-        # Загружаем и склеиваем аудио
-        # Сначала проходим по всем файлам, чтобы определить оптимальный sample_rate
-        sample_rates = []
-        audio_segments = []
-        sample_rate = None
-        
-        # Первый проход: определяем sample_rate из всех файлов
-        for item in file_sequence:
-            item_type = item.get('type')
-            
-            if item_type == 'file':
-                filename = item.get('filename')
-                language = item.get('language', 'en')
-                
-                if filename:
-                    file_path = os.path.join(temp_dir, language, filename)
-                    if os.path.exists(file_path):
-                        try:
-                            # Загружаем только метаданные для определения sample_rate
-                            y_test, sr_test = librosa.load(file_path, sr=None, duration=0.1)
-                            sample_rates.append(sr_test)
-                            logger.info(f"Файл {filename}: sample_rate={sr_test}, формат={os.path.splitext(filename)[1]}")
-                        except Exception as e:
-                            logger.warning(f"Не удалось определить sample_rate для {filename}: {e}")
-        
-        # Выбираем sample_rate (используем самый высокий или дефолтный)
-        if sample_rates:
-            sample_rate = max(sample_rates)  # Используем самый высокий sample_rate для лучшего качества
-        else:
-            sample_rate = 22050  # Дефолтная частота дискретизации
-        
-        logger.info(f"Используемый sample_rate для склейки: {sample_rate} Hz")
-        
-        # Второй проход: загружаем и обрабатываем все файлы
-        for item in file_sequence:
-            item_type = item.get('type')
-            
-            if item_type == 'pause':
-                # Создаем тишину
-                duration = item.get('duration', 1.0)
-                silence = numpy.zeros(int(duration * sample_rate))
-                audio_segments.append(silence)
-                
-            elif item_type == 'pause_file':
-                # Пауза длиной в файл
-                duration_file = item.get('duration_file')
-                language = item.get('language', 'en')
-                
-                if duration_file:
-                    file_path = os.path.join(temp_dir, language, duration_file)
-                    if os.path.exists(file_path):
-                        try:
-                            # Загружаем файл полностью для определения длительности
-                            y_ref, sr_ref = librosa.load(file_path, sr=None)
-                            # Вычисляем длительность в секундах
-                            duration_sec = len(y_ref) / sr_ref
-                            # Создаем тишину нужной длительности с target sample_rate
-                            silence = numpy.zeros(int(duration_sec * sample_rate))
-                            audio_segments.append(silence)
-                            logger.info(f"Пауза длиной в файл {duration_file}: {duration_sec:.2f}s")
-                        except Exception as e:
-                            logger.warning(f"Не удалось загрузить файл для паузы {duration_file}: {e}")
-                            # Fallback на 1 секунду
-                            silence = numpy.zeros(int(sample_rate))
-                            audio_segments.append(silence)
-                    else:
-                        # Fallback на 1 секунду
-                        fallback_duration = item.get('fallback_duration', 1.0)
-                        silence = numpy.zeros(int(fallback_duration * sample_rate))
-                        audio_segments.append(silence)
-                else:
-                    # Fallback на 1 секунду
-                    fallback_duration = item.get('fallback_duration', 1.0)
-                    silence = numpy.zeros(int(fallback_duration * sample_rate))
-                    audio_segments.append(silence)
-                    
-            elif item_type == 'file':
-                # Загружаем аудио файл
-                filename = item.get('filename')
-                language = item.get('language', 'en')
-                
-                if filename:
-                    file_path = os.path.join(temp_dir, language, filename)
-                    if os.path.exists(file_path):
-                        try:
-                            # librosa.load автоматически:
-                            # 1. Поддерживает разные форматы (mp3, wav, webm, ogg, m4a, flac и т.д.)
-                            # 2. Конвертирует стерео в моно
-                            # 3. Нормализует данные в диапазон [-1, 1]
-                            y, sr = librosa.load(file_path, sr=None)
-                            
-                            # Ресемплируем если нужно
-                            if sr != sample_rate:
-                                y = librosa.resample(y, orig_sr=sr, target_sr=sample_rate)
-                                logger.debug(f"Ресемплирование {filename}: {sr} -> {sample_rate} Hz")
-                            
-                            # Убеждаемся, что данные нормализованы (librosa это делает автоматически, но проверим)
-                            max_val = numpy.max(numpy.abs(y))
-                            if max_val > 1.0:
-                                y = y / max_val
-                                logger.warning(f"Нормализация {filename}: max_val={max_val}")
-                            
-                            audio_segments.append(y)
-                            logger.debug(f"Загружен файл {filename}: {len(y)} samples, длительность {len(y)/sample_rate:.2f}s")
-                            
-                        except Exception as e:
-                            logger.error(f"Ошибка загрузки файла {file_path}: {e}", exc_info=True)
-                            # Пропускаем файл, если не удалось загрузить
-                            continue
-                    else:
-                        logger.warning(f"Файл не найден: {file_path}")
-                        # Пропускаем файл, если не найден
-                        continue
-        
-        if not audio_segments:
-            return jsonify({'success': False, 'error': 'Не удалось загрузить ни одного аудио сегмента'}), 400
-        
-        # Склеиваем все сегменты
-        logger.info(f"Склеивание {len(audio_segments)} сегментов...")
-        combined_audio = numpy.concatenate(audio_segments)
-        
-        # Финальная нормализация для предотвращения клиппинга
-        max_val = numpy.max(numpy.abs(combined_audio))
-        if max_val > 0.95:  # Если есть риск клиппинга, немного уменьшаем громкость
-            combined_audio = combined_audio * (0.95 / max_val)
-            logger.info(f"Применена финальная нормализация: коэффициент {0.95 / max_val:.3f}")
-        
-        # Сохраняем результат (soundfile автоматически определяет формат по расширению)
-        sf.write(output_path, combined_audio, sample_rate)
-        logger.info(f"Файл сохранен: {output_path}, длительность: {len(combined_audio)/sample_rate:.2f}s")
-        
-        logger.info(f"✅ Создан комбинированный аудио файл: {output_filename}")
-        
-        return jsonify({
-            'success': True,
-            'filename': output_filename,
-            'filepath': f"/static/data/temp/{dictation_id}/{output_filename}",
-            'message': 'Комбинированный аудио файл успешно создан'
+
+        return run_audio_task('create_combined_audio', combined_audio_task, data, {
+            'dictation_id': dictation_id,
+            'temp_dir': temp_dir,
+            'file_sequence': file_sequence,
+            'output_filename': output_filename
         })
         
     except Exception as e:
@@ -5,13 +5,24 @@ import os
 import shutil
 import tempfile
 import zipfile
-from flask import Blueprint, jsonify, render_template, request, current_app, send_file
+from flask import Blueprint, jsonify, redirect, render_template, request, current_app, send_file, url_for
 from helpers.language_data import load_language_data, get_language_name
+from helpers.dictation_difficulty import load_difficulty_table
+from helpers.disk_cache import DiskLRUCache
+from helpers.image_pipeline import (
+    OUTPUT_FORMATS, ImagePipelineError, decode_for_variants, get_format_by_ext, open_image_limited, render_variant, save_variant
+)
 
 index_bp = Blueprint('index', __name__)
 
 DATA_DIR = os.path.join("static", "data") 
 
+# Форматы, в которых можно запросить обложку
+COVER_OUTPUT_FORMATS = OUTPUT_FORMATS + [
+    {"format": "PNG", "ext": "png", "quality": 0},
+    {"format": "JPEG", "ext": "jpeg", "quality": 85},
+]
+
 
 # Вспомогательная функция для получения читабельного названия языка
 def get_language_title(lang_code: str) -> str:
@@ -604,6 +615,7 @@ def dictations_list():
     # print(f"❌❌❌ base_path: {base_path}")
     result = []
     categories_data = load_categories()
+    difficulty_table = load_difficulty_table()
 
     for folder in os.listdir(base_path):
         folder_path = os.path.join(base_path, folder)
@@ -614,7 +626,11 @@ def dictations_list():
                 with open(info_path, "r", encoding="utf-8") as f:
                     info = json.load(f)
                     dictation_id = info.get("id")
-                    cover_url = get_cover_url_for_id(dictation_id, info.get("language_original"))
+                    # Обложка ищется один раз на карточку
+                    cover = resolve_cover(dictation_id, info.get("language_original"))
+                    cover_url = cover[1]
+                    cover_thumb_url = get_cover_sized_url(dictation_id, info.get("language_original"), 200, 120, cover=cover)
+                    cover_thumb_url_2x = get_cover_sized_url(dictation_id, info.get("language_original"), 400, 240, cover=cover)
 
                     # Определяем языковую пару
                     language_original = info.get("language_original") or ""
@@ -670,7 +686,10 @@ def dictations_list():
                         "languages": info.get("languages"),
                         "level": info.get("level"),
                         "cover_url": cover_url,
-                        "sentences_count": sentences_count
+                        "cover_thumb_url": cover_thumb_url,
+                        "cover_thumb_url_2x": cover_thumb_url_2x,
+                        "sentences_count": sentences_count,
+                        "difficulty": difficulty_table.get(dictation_id)
                     })
             except Exception as e:
                     print(f"⚠️ Ошибка при чтении {info_path}: {e}")
@@ -679,16 +698,30 @@ def dictations_list():
 
 
 
-def get_cover_url_for_id(dictation_id, language=None):
+# Допустимые расширения для обложек
+COVER_EXTENSIONS = ["webp", "png", "jpg", "jpeg"]
+
+# Ограничения на размеры обложек, которые можно запросить через /covers/<id>
+COVER_MIN_SIDE = 16
+COVER_MAX_SIDE = 1600
+COVER_MIME_TYPES = {"webp": "image/webp", "png": "image/png", "jpeg": "image/jpeg"}
+
+# Кеш уменьшенных обложек: версионированные URL кешируются браузером на год
+COVER_CACHE_MAX_BYTES = 200 * 1024 * 1024
+COVER_IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+_cover_cache = None
+
+
+def resolve_cover(dictation_id, language=None):
     """
-    1) Сначала ищем индивидуальную обложку в папке диктанта:
+    Находит обложку диктанта. Возвращает (путь в файловой системе, URL):
+    1) индивидуальная обложка в папке диктанта:
        static/data/dictations/{dictation_id}/cover.(webp|png|jpg|jpeg)
-    2) Если нет — смотрим стандартные обложки по языку:
+    2) стандартная обложка по языку:
        static/data/covers/cover_<lang>.(webp|png|...)
-    3) Если и их нет — пробуем global fallback:
-       static/data/covers/cover.webp
-    4) Если и этого нет — возвращаем окончательный плейсхолдер:
-       /static/images/cover_en.webp
+    3) global fallback: static/data/covers/cover.webp
+    4) окончательный плейсхолдер /static/images/cover_en.webp (файла может не быть)
     """
 
     # абсолютные пути к папкам в файловой системе
@@ -696,14 +729,12 @@ def get_cover_url_for_id(dictation_id, language=None):
     dictation_path = os.path.join(static_base, "data", "dictations", dictation_id or "")
     covers_folder = os.path.join(static_base, "data", "covers")
 
-    # допустимые расширения для обложек
-    cover_names = ["cover.webp", "cover.png", "cover.jpg", "cover.jpeg"]
-
     # --- 1) индивидуальная обложка в папке диктанта ---
-    for name in cover_names:
+    for ext in COVER_EXTENSIONS:
+        name = f"cover.{ext}"
         p = os.path.join(dictation_path, name)
-        if os.path.exists(p):
-            return f"/static/data/dictations/{dictation_id}/{name}"
+        if dictation_id and os.path.exists(p):
+            return p, f"/static/data/dictations/{dictation_id}/{name}"
 
     # --- 2) языковая обложка в /static/data/covers/ ---
     if language:
@@ -712,19 +743,166 @@ def get_cover_url_for_id(dictation_id, language=None):
         lang_map = {"ua": "uk"}  # пример, расширяй по необходимости
         lang = lang_map.get(lang, lang)
 
-        lang_cover_names = [f"cover_{lang}.webp", f"cover_{lang}.png",
-                            f"cover_{lang}.jpg", f"cover_{lang}.jpeg"]
-        for name in lang_cover_names:
+        for ext in COVER_EXTENSIONS:
+            name = f"cover_{lang}.{ext}"
             p = os.path.join(covers_folder, name)
             if os.path.exists(p):
-                return f"/static/data/covers/{name}"
+                return p, f"/static/data/covers/{name}"
 
     # --- 3) глобальная заглушка в /static/data/covers/ ---
     fallback_global = os.path.join(covers_folder, "cover.webp")
-    print(f"Проверяем глобальную заглушку: {fallback_global}")
     if os.path.exists(fallback_global):
-        return "/static/data/covers/cover.webp"
+        return fallback_global, "/static/data/covers/cover.webp"
 
     # --- 4) последний-resort плейсхолдер в /static/images/ ---
     print(f"Ничего не найдено для dictation_id={dictation_id} language={language}; возвращаем /static/images/cover_en.webp")
-    return "/static/images/cover_en.webp"
\ No newline at end of file
+    return None, "/static/images/cover_en.webp"
+
+
+def resolve_cover_master(dictation_id, language=None, cover=None):
+    """Исходник для ресайза: самый крупный сохраненный вариант (cover@2x.*), иначе сама обложка
+
+    cover - уже найденный resolve_cover результат (чтобы не искать обложку повторно).
+    """
+    cover_path, _ = cover or resolve_cover(dictation_id, language)
+    if not cover_path:
+        return None
+
+    base, _ = os.path.splitext(cover_path)
+    for ext in COVER_EXTENSIONS:
+        candidate = f"{base}@2x.{ext}"
+        if os.path.exists(candidate):
+            return candidate
+    return cover_path
+
+
+def get_cover_url_for_id(dictation_id, language=None):
+    """URL исходной обложки диктанта (см. resolve_cover)"""
+    _, url = resolve_cover(dictation_id, language)
+    return url
+
+
+def get_cover_sized_url(dictation_id, language=None, width=None, height=None, fmt="webp", cover=None):
+    """
+    URL обложки нужного размера через /covers/<id>.
+    Параметр v (mtime исходника) делает URL неизменяемым - его можно кешировать навсегда.
+    cover - уже найденный resolve_cover результат.
+    """
+    cover = cover or resolve_cover(dictation_id, language)
+    master_path = resolve_cover_master(dictation_id, language, cover)
+    if not master_path:
+        return cover[1]
+
+    params = {"lang": language or "", "fmt": fmt, "v": get_cover_version(master_path)}
+    if width:
+        params["w"] = width
+    if height:
+        params["h"] = height
+    query = "&".join(f"{key}={value}" for key, value in params.items())
+    return f"/covers/{dictation_id or '_'}?{query}"
+
+
+def get_cover_version(master_path, master_mtime_ns=None):
+    """Версия обложки для параметра v: mtime исходника в секундах"""
+    if master_mtime_ns is None:
+        master_mtime_ns = os.stat(master_path).st_mtime_ns
+    return master_mtime_ns // 1_000_000_000
+
+
+def get_cover_cache():
+    """Дисковый LRU-кеш уменьшенных обложек (общий для всех воркеров)"""
+    global _cover_cache
+    if _cover_cache is None:
+        cache_dir = current_app.config.get(
+            "COVER_CACHE_DIR",
+            os.path.join(current_app.instance_path, "cache", "covers")
+        )
+        max_bytes = current_app.config.get("COVER_CACHE_MAX_BYTES", COVER_CACHE_MAX_BYTES)
+        _cover_cache = DiskLRUCache(cache_dir, max_bytes)
+    return _cover_cache
+
+
+def _parse_cover_side(value):
+    if value in (None, ""):
+        return None
+    side = int(value)
+    return max(COVER_MIN_SIDE, min(COVER_MAX_SIDE, side))
+
+
+@index_bp.route("/covers/<string:dictation_id>")
+def get_cover_resized(dictation_id):
+    """Обложка диктанта нужного размера и формата (?w=&h=&fmt=&lang=&v=)"""
+    try:
+        width = _parse_cover_side(request.args.get("w"))
+        height = _parse_cover_side(request.args.get("h"))
+    except ValueError:
+        return jsonify({"success": False, "error": "w and h must be integers"}), 400
+
+    fmt_ext = (request.args.get("fmt") or "webp").lower()
+    if fmt_ext == "jpg":
+        fmt_ext = "jpeg"
+    fmt = get_format_by_ext(fmt_ext, COVER_OUTPUT_FORMATS)
+    if not fmt:
+        return jsonify({"success": False, "error": f"Unsupported format: {fmt_ext}"}), 400
+
+    language = request.args.get("lang") or None
+    dictation_key = None if dictation_id == "_" else dictation_id
+    master_path = resolve_cover_master(dictation_key, language)
+    if not master_path:
+        return jsonify({"success": False, "error": "Cover not found"}), 404
+
+    try:
+        master_mtime = os.stat(master_path).st_mtime_ns
+    except FileNotFoundError:
+        return jsonify({"success": False, "error": "Cover not found"}), 404
+    # Устаревший ?v= - на URL текущей версии: иначе браузер навсегда закрепит
+    # под старой версией новые байты (ответ с v кешируется как immutable)
+    version = request.args.get("v")
+    current_version = str(get_cover_version(master_path, master_mtime))
+    if version and version != current_version:
+        args = request.args.to_dict()
+        args["v"] = current_version
+        response = redirect(url_for("index.get_cover_resized", dictation_id=dictation_id, **args))
+        response.cache_control.no_store = True
+        return response
+
+    cache = get_cover_cache()
+    key = cache.make_key(master_path, master_mtime, width, height, fmt_ext)
+    cached_path = cache.get(key, fmt_ext)
+
+    if not cached_path:
+        def render(tmp_path):
+            image = open_image_limited(master_path)
+            try:
+                if width and height:
+                    variant = {"size": (width, height), "fit": "cover"}
+                else:
+                    # Задана одна сторона - вторая по пропорциям исходника
+                    variant = {"size": (width or COVER_MAX_SIDE, height or COVER_MAX_SIDE), "fit": "contain"}
+                base_image = decode_for_variants(image, [variant])
+                save_variant(render_variant(base_image, variant), tmp_path, fmt)
+            finally:
+                image.close()
+
+        try:
+            cached_path = cache.store(key, fmt_ext, render)
+        except (ImagePipelineError, OSError) as e:
+            # Поврежденный или неподдерживаемый исходник - ошибка данных, а не сервера
+            print(f"❌ [COVERS] Не удалось подготовить обложку {master_path}: {e}")
+            return jsonify({"success": False, "error": "Cover image cannot be processed"}), 422
+
+    if version:
+        response = send_file(cached_path, mimetype=COVER_MIME_TYPES[fmt_ext], max_age=COVER_IMMUTABLE_MAX_AGE)
+        response.cache_control.immutable = True
+    else:
+        # mtime файла в кеше меняется при каждом обращении (LRU), поэтому ETag и
+        # Last-Modified берем от ключа кеша и исходника
+        response = send_file(
+            cached_path,
+            mimetype=COVER_MIME_TYPES[fmt_ext],
+            conditional=True,
+            etag=key,
+            last_modified=master_mtime / 1e9
+        )
+        response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,32 @@
+"""
+Blueprint статуса фоновых заданий (см. helpers.jobs)
+"""
+from flask import Blueprint, jsonify
+from routes.dictation_editor import get_job_runner
+
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/api/jobs')
+
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Статус задания: queued / running / done / failed, прогресс и результат"""
+    try:
+        job = get_job_runner().get(job_id)
+        if job is None:
+            return jsonify({'error': 'Задание не найдено'}), 404
+
+        return jsonify({
+            'job_id': job['id'],
+            'kind': job['kind'],
+            'status': job['status'],
+            'progress': job['progress'],
+            # Для done - тот же ответ, что и в синхронном режиме
+            'result': job['result'],
+            'error': job['error'],
+            'created_at': job['created_at'],
+            'updated_at': job['updated_at']
+        })
+
+    except Exception as e:
+        print(f'❌ [JOBS] Ошибка получения статуса задания {job_id}: {e}')
+        return jsonify({'error': 'Ошибка получения статуса задания'}), 500
@@ -0,0 +1,83 @@
+"""
+Blueprint для режима повторения: предложения, написанные с ошибкой,
+возвращаются по расписанию SM-2 (см. helpers.review_queue)
+"""
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from helpers.review_queue import read_queue, split_card_key, today_key
+from helpers.write_behind import submit_review_answers
+from routes.dictation import get_dictation_languages, load_dictation_sentences
+
+review_bp = Blueprint('review', __name__, url_prefix='/api/review')
+
+DEFAULT_REVIEW_LIMIT = 20
+MAX_REVIEW_LIMIT = 100
+
+
+@review_bp.route('/next', methods=['GET'])
+@jwt_required()
+def get_next_reviews():
+    """Ближайшие к повторению предложения по всем диктантам: ?limit=20"""
+    try:
+        current_email = get_jwt_identity()
+        try:
+            limit = min(max(int(request.args.get('limit', DEFAULT_REVIEW_LIMIT)), 1), MAX_REVIEW_LIMIT)
+        except ValueError:
+            return jsonify({'error': 'limit должен быть числом'}), 400
+
+        today = today_key()
+        queue = read_queue(current_email)
+        cards = queue.due(today, limit)
+
+        # Текст и аудио - из тех же файлов, что и страница тренировки (по диктанту один раз)
+        dictations = {}
+        items = []
+        for card in cards:
+            dictation_id, sentence_key = split_card_key(card['key'])
+            if dictation_id not in dictations:
+                lang_orig, lang_tr = get_dictation_languages(dictation_id)
+                _, sentences = load_dictation_sentences(dictation_id, lang_orig, lang_tr) if lang_orig else (None, [])
+                dictations[dictation_id] = (lang_orig, lang_tr, {s['key']: s for s in sentences})
+
+            lang_orig, lang_tr, sentences = dictations[dictation_id]
+            sentence = sentences.get(sentence_key)
+            if sentence is None:
+                # Диктант или предложение удалены
+                continue
+            items.append({
+                'dictation_id': dictation_id,
+                'language_original': lang_orig,
+                'language_translation': lang_tr,
+                'due': card['due'],
+                'interval': card['interval'],
+                'lapses': card['lapses'],
+                'sentence': sentence
+            })
+
+        return jsonify({'items': items, 'due_total': queue.due_count(today)})
+
+    except Exception as e:
+        print(f'❌ [REVIEW] Ошибка получения очереди повторения: {e}')
+        return jsonify({'error': 'Ошибка получения очереди повторения'}), 500
+
+
+@review_bp.route('/answer', methods=['POST'])
+@jwt_required()
+def answer_review():
+    """Результат повторения: {"dictation_id", "key", "quality": 0..5}"""
+    try:
+        current_email = get_jwt_identity()
+        data = request.get_json(silent=True) or {}
+        dictation_id = data.get('dictation_id')
+        sentence_key = data.get('key')
+        quality = data.get('quality')
+
+        if not dictation_id or not sentence_key or type(quality) is not int or not 0 <= quality <= 5:
+            return jsonify({'error': 'Нужны dictation_id, key и quality от 0 до 5'}), 400
+
+        submit_review_answers(current_email, dictation_id, {sentence_key: quality})
+        return jsonify({'success': True})
+
+    except Exception as e:
+        print(f'❌ [REVIEW] Ошибка сохранения результата повторения: {e}')
+        return jsonify({'error': 'Ошибка сохранения результата'}), 500
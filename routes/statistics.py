@@ -2,12 +2,26 @@
 Blueprint для API статистики активности пользователей
 Доступен из любого места приложения
 """
+import csv
+import io
 import json
 import os
-from datetime import datetime, timedelta
-from flask import Blueprint, request, jsonify
+import threading
+from datetime import datetime
+from flask import Blueprint, Response, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from helpers.user_helpers import get_user_folder, load_user_info, save_user_info
+from helpers.user_helpers import get_user_folder
+from helpers.history_log import (
+    coalesce_events, day_stats_event, list_months, month_merge_event, read_month
+)
+from helpers.history_columns import read_history_analytics
+from helpers.history_rollups import ROLLUP_PERIODS, date_key_to_date
+from helpers.review_queue import draft_answers
+from helpers.drafts import DraftPatchError, apply_patch, get_version, new_version
+from helpers.write_behind import (
+    delete_draft, list_drafts, load_draft, patch_draft, save_draft, submit_history_events,
+    submit_review_answers
+)
 
 statistics_bp = Blueprint('statistics', __name__, url_prefix='/api/statistics')
 
@@ -18,31 +32,16 @@ def get_history():
     """Получить историю активности пользователя"""
     try:
         current_email = get_jwt_identity()
-        user_folder = get_user_folder(current_email)
-        history_folder = os.path.join(user_folder, 'history')
         
-        if not os.path.exists(history_folder):
-            os.makedirs(history_folder, exist_ok=True)
-            return jsonify({'history': []})
-        
-        # Читаем все файлы истории
-        history_files = [f for f in os.listdir(history_folder) if f.startswith('h_') and f.endswith('.json')]
+        # Читаем все месяцы (документы месяцев + несвернутые события журнала)
         history = []
-        
-        for filename in history_files:
-            file_path = os.path.join(history_folder, filename)
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    # Извлекаем месяц из имени файла (h_202511.json -> 202511)
-                    month = filename.replace('h_', '').replace('.json', '')
-                    history.append({
-                        'month': month,
-                        'data': data
-                    })
-            except Exception as e:
-                print(f'Ошибка чтения файла {filename}: {e}')
-                continue
+        for month in list_months(current_email):
+            data = read_month(current_email, month)
+            if data is not None:
+                history.append({
+                    'month': month,
+                    'data': data
+                })
         
         return jsonify({'history': history})
         
@@ -51,6 +50,95 @@ def get_history():
         return jsonify({'error': 'Ошибка получения истории'}), 500
 
 
+# Столбцы CSV-выгрузки истории
+EXPORT_DAILY_COLUMNS = ('date', 'perfect', 'corrected', 'audio')
+EXPORT_SENTENSES_COLUMNS = ('month', 'date', 'dictation_id', 'perfect', 'corrected', 'audio', 'total_time_ms')
+# Последняя строка прерванной выгрузки
+EXPORT_ERROR_MARKER = '#ERROR: выгрузка прервана, файл неполный'
+
+
+def iter_history_months(email):
+    """(месяц, данные месяца) по одному - для потоковых ответов"""
+    for month in list_months(email):
+        data = read_month(email, month)
+        if data is not None:
+            yield month, data
+
+
+def iter_csv_rows(rows):
+    """Строки CSV (header + данные) по одной"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+
+def streaming_response(generator, mimetype, filename=None):
+    """Ответ-генератор: первые байты уходят сразу, память не зависит от объема истории"""
+    response = Response(generator, mimetype=mimetype)
+    response.headers['Cache-Control'] = 'no-store'
+    # Отключаем буферизацию ответа в nginx
+    response.headers['X-Accel-Buffering'] = 'no'
+    if filename:
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@statistics_bp.route('/history/stream', methods=['GET'])
+@jwt_required()
+def stream_history():
+    """История активности в формате NDJSON: одна строка {"month", "data"} на месяц"""
+    current_email = get_jwt_identity()
+
+    def generate():
+        try:
+            for month, data in iter_history_months(current_email):
+                yield json.dumps({'month': month, 'data': data}, ensure_ascii=False) + '\n'
+        except Exception as e:
+            # Последняя строка - ошибка, а ответ обрывается: неполная история не выглядит полной
+            print(f'❌ Ошибка потоковой выдачи истории: {e}')
+            yield json.dumps({'error': 'Ошибка выдачи истории'}, ensure_ascii=False) + '\n'
+            raise
+
+    return streaming_response(generate(), 'application/x-ndjson')
+
+
+@statistics_bp.route('/history/export.csv', methods=['GET'])
+@jwt_required()
+def export_history_csv():
+    """Выгрузка истории в CSV: ?rows=daily (по дням, по умолчанию) или ?rows=sentenses"""
+    current_email = get_jwt_identity()
+    rows_kind = request.args.get('rows', 'daily')
+    if rows_kind not in ('daily', 'sentenses'):
+        return jsonify({'error': 'Некорректный тип строк'}), 400
+
+    def generate_rows():
+        if rows_kind == 'daily':
+            yield EXPORT_DAILY_COLUMNS
+            for _, data in iter_history_months(current_email):
+                for stat in data.get('statistics', []):
+                    yield [stat.get(column, 0) for column in EXPORT_DAILY_COLUMNS]
+        else:
+            yield EXPORT_SENTENSES_COLUMNS
+            for month, data in iter_history_months(current_email):
+                for entry in data.get('statistics_sentenses', []):
+                    yield [month] + [entry.get(column, '') for column in EXPORT_SENTENSES_COLUMNS[1:]]
+
+    def generate():
+        try:
+            yield from iter_csv_rows(generate_rows())
+        except Exception as e:
+            # Строка-маркер ошибки, и ответ обрывается без завершающего блока
+            print(f'❌ Ошибка выгрузки истории в CSV: {e}')
+            yield from iter_csv_rows([[EXPORT_ERROR_MARKER]])
+            raise
+
+    return streaming_response(generate(), 'text/csv', f'history_{rows_kind}.csv')
+
+
 @statistics_bp.route('/history/save', methods=['POST'])
 @jwt_required()
 def save_history():
@@ -73,112 +161,15 @@ def save_history():
             print(f'❌ [SAVE_HISTORY] Некорректный формат статистики: ожидается объект, получено {type(statistics)}')
             return jsonify({'error': 'Некорректный формат статистики'}), 400
         
-        # Преобразуем месяц в строку для имени файла
-        month_str = str(month)
+        # Сохранение - одна строка в журнале событий пользователя.
+        # Правила слияния за день (применяются при чтении и компактором):
+        # - запись в "statistics" ищется только по дате (YYYYMMDD)
+        # - perfect/corrected/audio суммируются
+        # - end/id_diktation/number/total в "statistics" не хранятся
+        # Запись в журнал и обновление streak - через буфер отложенной записи
+        submit_history_events(current_email, [day_stats_event(int(str(month)), statistics)])
         
-        user_folder = get_user_folder(current_email)
-        history_folder = os.path.join(user_folder, 'history')
-        os.makedirs(history_folder, exist_ok=True)
-        
-        filename = f'h_{month_str}.json'
-        file_path = os.path.join(history_folder, filename)
-        
-        # Загружаем существующие данные или создаем новые
-        if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                history_data = json.load(f)
-        else:
-            history_data = None
-
-        # Поддержка старого формата, когда history_data мог быть списком статистик
-        if isinstance(history_data, list):
-            history_data = {
-                'id_user': current_email,
-                'month': int(month_str),
-                'statistics': history_data
-            }
-        elif not isinstance(history_data, dict) or 'statistics' not in history_data:
-            history_data = {
-                'id_user': current_email,
-                'month': int(month_str),
-                'statistics': []
-            }
-        
-        # Обновляем или добавляем статистику ПО ДНЮ
-        # Правила:
-        # - Ищем запись того же диктанта и той же даты (YYYYMMDD)
-        # - perfect/corrected/audio суммируем
-        # - total берём max (или последнее разумное значение)
-        # - end - счетчик завершений: суммируем если входящая запись завершена (end > 0), иначе берем существующее
-
-        stats_list = history_data.get('statistics', [])
-        incoming_date = statistics.get('date')
-        
-        print(f'📊 [SAVE_HISTORY] Ищем запись: date={incoming_date}')
-        print(f'📊 [SAVE_HISTORY] Текущее количество записей в истории: {len(stats_list)}')
-        print(f'📊 [SAVE_HISTORY] Входящая статистика: perfect={statistics.get("perfect")}, corrected={statistics.get("corrected")}, audio={statistics.get("audio")}')
-        
-        # В "statistics" ищем запись только по дате (наработки суммируются по дате, независимо от диктанта)
-        idx_same_day = None
-        for i, stat in enumerate(stats_list):
-            if stat.get('date') == incoming_date:
-                idx_same_day = i
-                print(f'📊 [SAVE_HISTORY] Найдена существующая запись с индексом {i}: {stat}')
-                break
-
-        if idx_same_day is None:
-            # Первая запись за день — добавляем как есть
-            print(f'📊 [SAVE_HISTORY] Новая запись за день - добавляем')
-            new_stat = statistics.copy()
-            # Убираем поля, которые не должны быть в "statistics" (оставляем только date, perfect, corrected, audio)
-            # Эти поля остаются только в "statistics_sentenses"
-            new_stat.pop('end', None)
-            new_stat.pop('id_diktation', None)
-            new_stat.pop('number', None)
-            new_stat.pop('total', None)  # total - это просто число предложений, не нужно в истории
-            stats_list.append(new_stat)
-            print(f'📊 [SAVE_HISTORY] Добавлена новая запись: {new_stat}')
-        else:
-            existing = stats_list[idx_same_day]
-            print(f'📊 [SAVE_HISTORY] Обновляем существующую запись: {existing}')
-            merged = existing.copy()
-
-            # Суммируем показатели
-            old_perfect = int(existing.get('perfect', 0))
-            old_corrected = int(existing.get('corrected', 0))
-            old_audio = int(existing.get('audio', 0))
-            new_perfect = int(statistics.get('perfect', 0))
-            new_corrected = int(statistics.get('corrected', 0))
-            new_audio = int(statistics.get('audio', 0))
-            
-            merged['perfect'] = old_perfect + new_perfect
-            merged['corrected'] = old_corrected + new_corrected
-            merged['audio'] = old_audio + new_audio
-            # total не сохраняем - это просто число предложений, не нужно в истории
-
-            # Убираем поля, которые не должны быть в "statistics" (оставляем только date, perfect, corrected, audio)
-            # Эти поля остаются только в "statistics_sentenses"
-            merged.pop('end', None)
-            merged.pop('id_diktation', None)
-            merged.pop('number', None)
-            merged.pop('total', None)  # total - это просто число предложений, не нужно в истории
-
-            stats_list[idx_same_day] = merged
-            print(f'📊 [SAVE_HISTORY] Обновленная запись: {merged}')
-
-        history_data['statistics'] = stats_list
-        
-        print(f'📊 [SAVE_HISTORY] Сохраняем в файл: {file_path}')
-        print(f'📊 [SAVE_HISTORY] Всего записей после обновления: {len(stats_list)}')
-        
-        # Сохраняем
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(history_data, f, ensure_ascii=False, indent=2)
-        
-        print(f'✅ [SAVE_HISTORY] Файл успешно сохранен: {file_path}')
-        
-        # Обновляем streak пользователя
-        update_user_streak(current_email)
+        print(f'✅ [SAVE_HISTORY] Событие принято: date={statistics.get("date")}')
         
         return jsonify({'success': True})
     except Exception as e:
@@ -188,6 +179,81 @@ def save_history():
         return jsonify({'error': 'Ошибка сохранения истории'}), 500
 
 
+# Максимум элементов в одном пакете /history/batch
+MAX_BATCH_ITEMS = 500
+
+
+def batch_item_to_event(item):
+    """Элемент пакета -> событие журнала истории (ValueError, если элемент некорректен)
+
+    Типы элементов:
+    - {"type": "day_stats", "month": YYYYMM, "statistics": {"date": ..., "perfect": ...}}
+    - {"type": "sentense", "month": YYYYMM, "entry": {запись statistics_sentenses}}
+    - {"type": "month_merge", "month": YYYYMM, "statistics": [...], "statistics_sentenses": [...]}
+    """
+    if not isinstance(item, dict):
+        raise ValueError('элемент должен быть объектом')
+
+    month = item.get('month')
+    try:
+        month = int(str(month))
+    except (TypeError, ValueError):
+        raise ValueError('не указан месяц')
+
+    item_type = item.get('type', 'day_stats')
+    if item_type == 'day_stats':
+        statistics = item.get('statistics')
+        if not isinstance(statistics, dict) or not statistics.get('date'):
+            raise ValueError('некорректная статистика')
+        return day_stats_event(month, statistics)
+    if item_type == 'sentense':
+        entry = item.get('entry')
+        if not isinstance(entry, dict):
+            raise ValueError('некорректная запись')
+        return month_merge_event(month, {'statistics_sentenses': [entry]})
+    if item_type == 'month_merge':
+        return month_merge_event(month, item)
+    raise ValueError(f'неизвестный тип {item_type}')
+
+
+@statistics_bp.route('/history/batch', methods=['POST'])
+@jwt_required()
+def save_history_batch():
+    """Сохранить пакет изменений истории (несколько дней, месяцев и диктантов)
+
+    Пакет схлопывается и дописывается в журнал одной записью; streak
+    обновляется один раз на пакет (см. submit_history_events).
+    """
+    try:
+        current_email = get_jwt_identity()
+        data = request.get_json(silent=True) or {}
+        items = data.get('items')
+
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'Не указаны элементы пакета'}), 400
+        if len(items) > MAX_BATCH_ITEMS:
+            return jsonify({'error': f'Слишком много элементов (максимум {MAX_BATCH_ITEMS})'}), 400
+
+        events = []
+        for index, item in enumerate(items):
+            try:
+                events.append(batch_item_to_event(item))
+            except ValueError as e:
+                return jsonify({'error': f'Элемент {index}: {e}'}), 400
+
+        events = coalesce_events(events)
+        submit_history_events(current_email, events)
+
+        print(f'✅ [SAVE_HISTORY] Пакет принят: {len(items)} элементов -> {len(events)} событий')
+
+        return jsonify({'success': True, 'items': len(items), 'events': len(events)})
+    except Exception as e:
+        import traceback
+        print(f'❌ [SAVE_HISTORY] Ошибка сохранения пакета: {e}')
+        print(f'❌ [SAVE_HISTORY] Трассировка: {traceback.format_exc()}')
+        return jsonify({'error': 'Ошибка сохранения истории'}), 500
+
+
 @statistics_bp.route('/history/report', methods=['POST'])
 @jwt_required()
 def get_history_report():
@@ -202,148 +268,63 @@ def get_history_report():
         if not start_date or not end_date:
             return jsonify({'error': 'Не указаны даты периода'}), 400
         
-        user_folder = get_user_folder(current_email)
-        history_folder = os.path.join(user_folder, 'history')
-        
-        if not os.path.exists(history_folder):
-            return jsonify({'statistics': []})
-        
-        # Определяем месяцы для поиска
-        start_year = int(start_date[:4])
-        start_month = int(start_date[4:6])
-        end_year = int(end_date[:4])
-        end_month = int(end_date[4:6])
-        
-        result_statistics = []
-        
-        # Читаем файлы за нужные месяцы
-        for year in range(start_year, end_year + 1):
-            month_start = start_month if year == start_year else 1
-            month_end = end_month if year == end_year else 12
-            
-            for month in range(month_start, month_end + 1):
-                month_str = f'{year}{month:02d}'
-                filename = f'h_{month_str}.json'
-                file_path = os.path.join(history_folder, filename)
-                
-                if os.path.exists(file_path):
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            month_data = json.load(f)
-                            statistics = month_data.get('statistics', [])
-                            
-                            # Фильтруем по датам
-                            for stat in statistics:
-                                stat_date = stat.get('date', 0)
-                                if start_date <= stat_date <= end_date:
-                                    result_statistics.append(stat)
-                    except Exception as e:
-                        print(f'Ошибка чтения файла {filename}: {e}')
-                        continue
-        
-        # Сортируем по дате
-        result_statistics.sort(key=lambda x: x.get('date', 0))
-        
-        return jsonify({'statistics': result_statistics})
-        
-    except Exception as e:
-        print(f'Ошибка получения отчета: {e}')
-        return jsonify({'error': 'Ошибка получения отчета'}), 500
+        try:
+            start_date = int(start_date)
+            end_date = int(end_date)
+            date_key_to_date(start_date)
+            date_key_to_date(end_date)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Некорректные даты периода'}), 400
 
+        group_by = data.get('group_by')  # week / month / year (необязательно)
+        if group_by is not None and group_by not in ROLLUP_PERIODS:
+            return jsonify({'error': 'Некорректная группировка'}), 400
 
-def update_user_streak(email):
-    """Обновляет streak пользователя на основе истории активности"""
-    try:
-        user_data = load_user_info(email)
-        if not user_data:
-            return
-        
-        user_folder = get_user_folder(email)
-        history_folder = os.path.join(user_folder, 'history')
-        
-        if not os.path.exists(history_folder):
-            return
-        
-        # Получаем все даты с активностью
-        active_dates = set()
-        history_files = [f for f in os.listdir(history_folder) if f.startswith('h_') and f.endswith('.json')]
-        
-        for filename in history_files:
-            file_path = os.path.join(history_folder, filename)
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    month_data = json.load(f)
-                    statistics = month_data.get('statistics', [])
-                    for stat in statistics:
-                        date_key = stat.get('date', 0)
-                        if date_key > 0:
-                            active_dates.add(date_key)
-            except Exception as e:
-                print(f'Ошибка чтения файла {filename} для streak: {e}')
-                continue
-        
-        if not active_dates:
-            user_data['streak_days'] = 0
-            save_user_info(email, user_data)
-            return
-        
-        # Сортируем даты
-        sorted_dates = sorted(active_dates, reverse=True)
-        
-        # Подсчитываем streak (последовательные дни с активностью)
-        streak = 0
-        today = datetime.now().date()
-        current_date = today
-        
-        # Проверяем, есть ли активность сегодня
-        today_key = int(today.strftime('%Y%m%d'))
-        if today_key not in active_dates:
-            # Если сегодня нет активности, начинаем с вчера
-            current_date = today - timedelta(days=1)
-        
-        # Подсчитываем последовательные дни
-        while True:
-            date_key = int(current_date.strftime('%Y%m%d'))
-            if date_key in active_dates:
-                streak += 1
-                current_date = current_date - timedelta(days=1)
-            else:
-                break
-        
-        # Обновляем streak пользователя
-        user_data['streak_days'] = streak
-        save_user_info(email, user_data)
+        # Дни и итоги периода - из rollups.json или колоночного хранилища
+        # (HISTORY_ANALYTICS_STORE), без чтения документов месяцев
+        store = read_history_analytics(current_email)
+        response = {
+            'statistics': store.days(start_date, end_date),
+            'totals': store.totals(start_date, end_date)
+        }
+        if group_by:
+            response['periods'] = store.totals(start_date, end_date, group_by)
+
+        return jsonify(response)
         
     except Exception as e:
-        print(f'Ошибка обновления streak: {e}')
+        print(f'Ошибка получения отчета: {e}')
+        return jsonify({'error': 'Ошибка получения отчета'}), 500
 
 
 # ==============================================================
 # API для работы с черновиками диктантов (resume state)
 # ==============================================================
 
+def get_drafts_folder(email):
+    """Папка черновиков диктантов пользователя"""
+    return os.path.join(get_user_folder(email), 'history_dictations')
+
+
+# Чтение-изменение-запись черновика (проверка версии дельты) - под блокировкой
+_draft_lock = threading.Lock()
+
+
 @statistics_bp.route('/dictation_state/<dictation_id>', methods=['GET'])
 @jwt_required()
 def get_dictation_state(dictation_id):
-    """Получить состояние черновика диктанта"""
+    """Получить состояние черновика диктанта (условный GET по версии: ETag / 304)"""
     try:
         current_email = get_jwt_identity()
-        user_folder = get_user_folder(current_email)
-        drafts_folder = os.path.join(user_folder, 'history_dictations')
-        
-        if not os.path.exists(drafts_folder):
-            return jsonify({'state': None})
-        
-        filename = f'{dictation_id}.json'
-        file_path = os.path.join(drafts_folder, filename)
-        
-        if not os.path.exists(file_path):
+        state = load_draft(get_drafts_folder(current_email), dictation_id)
+        if state is None:
             return jsonify({'state': None})
-        
-        with open(file_path, 'r', encoding='utf-8') as f:
-            state = json.load(f)
-        
-        return jsonify({'state': state})
+
+        version = get_version(state)
+        response = jsonify({'state': state, 'version': version})
+        response.set_etag(f'{dictation_id}-{version}')
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
         
     except Exception as e:
         print(f'Ошибка получения состояния диктанта: {e}')
@@ -353,31 +334,64 @@ def get_dictation_state(dictation_id):
 @statistics_bp.route('/dictation_state/save', methods=['POST'])
 @jwt_required()
 def save_dictation_state():
-    """Сохранить состояние черновика диктанта"""
+    """Сохранить состояние черновика диктанта
+
+    Полное сохранение: {"dictation_id", "state"}.
+    Дельта: {"dictation_id", "base_version", "patch": [операции JSON Patch]} -
+    применяется, только если версия черновика на сервере равна base_version
+    (иначе 409 и клиент присылает состояние целиком).
+    """
     try:
         current_email = get_jwt_identity()
         data = request.get_json()
         
         dictation_id = data.get('dictation_id')
         state = data.get('state')
+        patch = data.get('patch')
         
-        if not dictation_id or not state:
+        if not dictation_id or (not state and patch is None):
             return jsonify({'error': 'Не указаны dictation_id или state'}), 400
         
-        user_folder = get_user_folder(current_email)
-        drafts_folder = os.path.join(user_folder, 'history_dictations')
-        os.makedirs(drafts_folder, exist_ok=True)
-        
-        filename = f'{dictation_id}.json'
-        file_path = os.path.join(drafts_folder, filename)
-        
+        drafts_folder = get_drafts_folder(current_email)
         # Добавляем дату сохранения
-        state['date_saved'] = int(datetime.now().strftime('%Y%m%d'))
+        date_saved = int(datetime.now().strftime('%Y%m%d'))
         
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(state, f, ensure_ascii=False, indent=2)
+        with _draft_lock:
+            current = load_draft(drafts_folder, dictation_id)
+            
+            if patch is None:
+                version = get_version(current) + 1 if current else new_version()
+                state['version'] = version
+                state['date_saved'] = date_saved
+                # Запись на диск - через буфер отложенной записи (см. helpers.write_behind)
+                save_draft(drafts_folder, dictation_id, state)
+                new_state = state
+            else:
+                if current is None or get_version(current) != data.get('base_version'):
+                    return jsonify({
+                        'error': 'Версия черновика изменилась',
+                        'version': get_version(current) if current else None
+                    }), 409
+                
+                version = get_version(current) + 1
+                ops = list(patch) + [
+                    {'op': 'replace', 'path': '/version', 'value': version},
+                    {'op': 'replace', 'path': '/date_saved', 'value': date_saved}
+                ]
+                try:
+                    new_state = apply_patch(current, ops)
+                except DraftPatchError as e:
+                    return jsonify({'error': str(e)}), 400
+                
+                patch_draft(drafts_folder, dictation_id, new_state, {'version': version, 'ops': ops})
         
-        return jsonify({'success': True})
+        # Новые результаты по предложениям - в очередь повторения (через буфер отложенной записи)
+        try:
+            submit_review_answers(current_email, dictation_id, draft_answers(current, new_state))
+        except Exception as e:
+            print(f'❌ [REVIEW] Ошибка обновления очереди повторения: {e}')
+        
+        return jsonify({'success': True, 'version': version})
         
     except Exception as e:
         print(f'Ошибка сохранения состояния диктанта: {e}')
@@ -390,18 +404,8 @@ def delete_dictation_state(dictation_id):
     """Удалить черновик диктанта (после успешного продолжения)"""
     try:
         current_email = get_jwt_identity()
-        user_folder = get_user_folder(current_email)
-        drafts_folder = os.path.join(user_folder, 'history_dictations')
-        
-        if not os.path.exists(drafts_folder):
-            return jsonify({'success': True})
-        
-        filename = f'{dictation_id}.json'
-        file_path = os.path.join(drafts_folder, filename)
-        
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        
+        with _draft_lock:
+            delete_draft(get_drafts_folder(current_email), dictation_id)
         return jsonify({'success': True})
         
     except Exception as e:
@@ -412,34 +416,21 @@ def delete_dictation_state(dictation_id):
 @statistics_bp.route('/dictation_state/list', methods=['GET'])
 @jwt_required()
 def list_dictation_states():
-    """Получить список всех черновиков (для подсветки в индексе)"""
+    """Получить список всех черновиков (для подсветки и прогресса в индексе)
+
+    Отдается из манифеста черновиков (без чтения самих черновиков), с ETag.
+    """
     try:
         current_email = get_jwt_identity()
-        user_folder = get_user_folder(current_email)
-        drafts_folder = os.path.join(user_folder, 'history_dictations')
-        
-        if not os.path.exists(drafts_folder):
-            return jsonify({'drafts': []})
-        
-        drafts = []
-        for filename in os.listdir(drafts_folder):
-            if filename.endswith('.json'):
-                dictation_id = filename.replace('.json', '')
-                file_path = os.path.join(drafts_folder, filename)
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        state = json.load(f)
-                        drafts.append({
-                            'dictation_id': dictation_id,
-                            'date_saved': state.get('date_saved', 0)
-                        })
-                except Exception as e:
-                    print(f'Ошибка чтения черновика {filename}: {e}')
-                    continue
-        
-        return jsonify({'drafts': drafts})
+        drafts = [
+            dict(entry, dictation_id=dictation_id)
+            for dictation_id, entry in sorted(list_drafts(get_drafts_folder(current_email)).items())
+        ]
+        response = jsonify({'drafts': drafts})
+        response.add_etag()
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
         
     except Exception as e:
         print(f'Ошибка получения списка черновиков: {e}')
         return jsonify({'error': 'Ошибка получения списка'}), 500
-
@@ -1,5 +1,4 @@
 # routes/user_routes.py
-from PIL import Image
 import io
 import base64
 import os
@@ -7,15 +6,30 @@ import json
 import shutil
 from datetime import datetime
 import uuid
-from flask import Blueprint, request, jsonify, render_template, send_file
+from functools import lru_cache
+from flask import Blueprint, request, jsonify, render_template, send_file, current_app
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 
 # Импортируем из helpers
 from helpers.language_data import load_language_data
 from helpers.user_helpers import load_user_info, save_user_info, get_user_folder
+from helpers.image_pipeline import process_upload, ImagePipelineError, AVATAR_VARIANTS
+from helpers.history_log import read_month, list_months, empty_month, month_merge_event
+from helpers.history_columns import read_history_analytics
+from helpers.streak import effective_streak, get_streak_state
+from helpers.write_behind import submit_history_events
 
 user_bp = Blueprint('user', __name__, url_prefix='/user')
 
+# Файлы аватаров в папке пользователя по размеру
+AVATAR_FILES = {
+    'large': 'avatar.webp',
+    'small': 'avatar_min.webp'
+}
+
+# Версионированные URL аватаров кешируются браузером "навсегда" (1 год)
+AVATAR_IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
 # ==================== ФУНКЦИИ ДЛЯ ГЕНЕРАЦИИ ID ====================
 
 def generate_user_id():
@@ -26,6 +40,60 @@ def generate_simple_user_id():
     """Альтернативная простая генерация ID на основе времени"""
     return f"user_{datetime.now().strftime('%Y%m%d%H%M%S')}_{os.urandom(4).hex()}"
 
+# ==================== URL АВАТАРОВ ====================
+
+def get_avatar_version(avatar_info):
+    """Версия аватара из метки времени загрузки (avatar['uploaded'])"""
+    uploaded = (avatar_info or {}).get('uploaded')
+    if not uploaded:
+        return None
+    try:
+        return str(int(datetime.fromisoformat(uploaded).timestamp()))
+    except (TypeError, ValueError):
+        return None
+
+def build_avatar_urls(email, avatar_info):
+    """Строит URL аватаров; при известной версии добавляет v=<uploaded>"""
+    version = get_avatar_version(avatar_info)
+    urls = {}
+    for size in AVATAR_FILES:
+        url = f'/user/api/avatar?email={email}&size={size}'
+        if version:
+            url += f'&v={version}'
+        urls[size] = url
+    return urls
+
+def make_user_response(user_data):
+    """Копия данных пользователя для ответа: без пароля, с актуальным streak и версионированными URL аватара"""
+    user_response = user_data.copy()
+    user_response.pop('password', None)
+
+    # streak_days на сегодня: серия прерывается, если вчера активности не было
+    if isinstance(user_response.get('streak'), dict):
+        user_response['streak_days'] = effective_streak(get_streak_state(user_response))
+
+    avatar_info = user_response.get('avatar')
+    if isinstance(avatar_info, dict) and avatar_info.get('uploaded'):
+        avatar_info = avatar_info.copy()
+        avatar_info.update(build_avatar_urls(user_response.get('email'), avatar_info))
+        user_response['avatar'] = avatar_info
+
+    return user_response
+
+@lru_cache(maxsize=None)
+def resolve_default_avatar(size):
+    """Путь и MIME type аватара по умолчанию (вычисляется один раз на размер)"""
+    default_path = os.path.join('static', 'icons', f'default-avatar-{size}.svg')
+    if os.path.exists(default_path):
+        return default_path, 'image/svg+xml'
+
+    # Если файлов по умолчанию нет, возвращаем логотип как запасной вариант
+    default_path = os.path.join('static', 'icons', 'logo.svg')
+    if os.path.exists(default_path):
+        return default_path, 'image/svg+xml'
+
+    return None, None
+
 # ==================== НОВЫЕ API ЭНДПОЙНТЫ (JWT) ====================
 
 @user_bp.route('/api/register', methods=['POST'])
@@ -134,8 +202,7 @@ def api_login():
         print("❌ ❌ ❌ email"+email)
         print("❌ ❌ ❌ access_token"+access_token)
         # Убираем пароль из ответа
-        user_response = user_data.copy()
-        user_response.pop('password', None)
+        user_response = make_user_response(user_data)
         
         print("✅✅✅✅✅✅✅✅✅✅✅✅✅✅✅✅✅✅✅✅✅✅ Логин успешен")
         
@@ -161,9 +228,7 @@ def api_get_current_user():
         return jsonify({'error': 'User not found'}), 404
         
     # Убираем пароль
-    user_response = user_data.copy()
-    user_response.pop('password', None)
-    return jsonify(user_response)
+    return jsonify(make_user_response(user_data))
 
 @user_bp.route('/api/logout', methods=['POST'])
 @jwt_required()
@@ -237,8 +302,7 @@ def api_update_profile():
         save_user_info(current_email, user_data)
         
         # Убираем пароль из ответа
-        user_response = user_data.copy()
-        user_response.pop('password', None)
+        user_response = make_user_response(user_data)
         
         return jsonify({
             'message': 'Profile updated successfully',
@@ -276,38 +340,27 @@ def api_upload_avatar():
         user_folder = get_user_folder(current_email)
         os.makedirs(user_folder, exist_ok=True)
         
-        # Открываем изображение
-        image = Image.open(avatar_file.stream)
-        
-        # Размеры для аватаров
-        LARGE_SIZE = (100, 100)
-        SMALL_SIZE = (40, 40)
-        
-        # Создаем большую версию (100x100)
-        avatar_large = image.copy()
-        avatar_large.thumbnail(LARGE_SIZE, Image.Resampling.LANCZOS)
-        
-        # Создаем маленькую версию (40x40)
-        avatar_small = image.copy()
-        avatar_small.thumbnail(SMALL_SIZE, Image.Resampling.LANCZOS)
-        
-        # Сохраняем аватары
-        avatar_large_path = os.path.join(user_folder, 'avatar.webp')
-        avatar_small_path = os.path.join(user_folder, 'avatar_min.webp')
-        
-        # Сохраняем в формате WEBP (лучшее качество/размер)
-        avatar_large.save(avatar_large_path, 'WEBP', quality=85)
-        avatar_small.save(avatar_small_path, 'WEBP', quality=85)
-        
-        # Генерируем URL для аватаров
-        avatar_large_url = f'/user/api/avatar?email={current_email}&size=large'
-        avatar_small_url = f'/user/api/avatar?email={current_email}&size=small'
+        # Одно декодирование (draft для JPEG) -> все размеры и форматы (100/40 + @2x, WEBP)
+        try:
+            process_upload(
+                avatar_file,
+                user_folder,
+                current_app.config.get('AVATAR_VARIANTS', AVATAR_VARIANTS)
+            )
+        except ImagePipelineError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # Генерируем версионированные URL для аватаров (v = время загрузки)
+        avatar_info = {'uploaded': datetime.now().isoformat()}
+        avatar_urls = build_avatar_urls(current_email, avatar_info)
+        avatar_large_url = avatar_urls['large']
+        avatar_small_url = avatar_urls['small']
         
         # Сохраняем информацию об аватаре в данные пользователя
         user_data['avatar'] = {
             'large': avatar_large_url,
             'small': avatar_small_url,
-            'uploaded': datetime.now().isoformat()
+            'uploaded': avatar_info['uploaded']
         }
         
         save_user_info(current_email, user_data)
@@ -326,63 +379,49 @@ def api_upload_avatar():
 
 @user_bp.route('/api/avatar')
 def api_get_avatar():
-    """Получение аватара пользователя"""
+    """Получение аватара пользователя
+
+    Запросы с параметром v (версия = время загрузки) кешируются как immutable,
+    остальные проходят ревалидацию по ETag/Last-Modified (ответ 304 без тела).
+    """
     try:
         email = request.args.get('email')
-        size = request.args.get('size', 'large')
+        size = 'large' if request.args.get('size', 'large') == 'large' else 'small'
+        version = request.args.get('v')
         
         if not email:
             return jsonify({'error': 'Email parameter required'}), 400
         
         user_folder = get_user_folder(email)
-        avatar_filename = 'avatar.webp' if size == 'large' else 'avatar_min.webp'
-        avatar_path = os.path.join(user_folder, avatar_filename)
-        
-        print(f"🔍 Ищем аватар по пути: {avatar_path}")
-        
-        if not os.path.exists(avatar_path):
-            # Используем правильный путь к аватарам по умолчанию
-            default_path = os.path.join('static', 'icons', f'default-avatar-{size}.svg')
-            print(f"🔍 Аватар не найден, пробуем: {default_path}")
-            
-            if not os.path.exists(default_path):
-                # Если файлов по умолчанию нет, возвращаем логотип как запасной вариант
-                default_path = os.path.join('static', 'icons', 'logo.svg')
-                if not os.path.exists(default_path):
-                    return jsonify({'error': 'Avatar not found'}), 404
-            
-            avatar_path = default_path
-        
-        # Определяем MIME type в зависимости от расширения файла
-        if avatar_path.endswith('.webp'):
-            mimetype = 'image/webp'
-        elif avatar_path.endswith('.png'):
-            mimetype = 'image/png'
-        elif avatar_path.endswith('.svg'):
-            mimetype = 'image/svg+xml'
-        else:
-            mimetype = 'image/jpeg'
-        
-        # Возвращаем файл аватара
-        return send_file(avatar_path, mimetype=mimetype)
+        avatar_path = os.path.join(user_folder, AVATAR_FILES[size])
+        
+        if os.path.exists(avatar_path):
+            if version:
+                # URL меняется при каждой загрузке аватара, поэтому содержимое по нему неизменно
+                response = send_file(avatar_path, mimetype='image/webp', max_age=AVATAR_IMMUTABLE_MAX_AGE)
+                response.cache_control.immutable = True
+            else:
+                response = send_file(avatar_path, mimetype='image/webp', conditional=True, etag=True)
+                response.cache_control.no_cache = True
+            return response
+        
+        # Аватар не загружен - отдаем аватар по умолчанию
+        default_path, mimetype = resolve_default_avatar(size)
+        if not default_path:
+            return jsonify({'error': 'Avatar not found'}), 404
+        
+        response = send_file(default_path, mimetype=mimetype, conditional=True, etag=True)
+        # По этому же URL позже может появиться загруженный аватар - только ревалидация
+        response.cache_control.no_cache = True
+        return response
         
     except Exception as e:
         print(f"Error getting avatar: {e}")
         return jsonify({'error': str(e)}), 500
 
 # ==================== ИСТОРИЯ АКТИВНОСТИ ПОЛЬЗОВАТЕЛЯ ====================
-
-def get_history_folder(email):
-    """Получает путь к папке history пользователя"""
-    user_folder = get_user_folder(email)
-    history_folder = os.path.join(user_folder, 'history')
-    os.makedirs(history_folder, exist_ok=True)
-    return history_folder
-
-def get_history_filename(month_identifier):
-    """Получает имя файла истории для месяца"""
-    # month_identifier в формате 202511 (год и месяц в обратном порядке)
-    return f'h_{month_identifier}.json'
+# Хранение: append-only журнал событий + документы месяцев h_YYYYMM.json
+# (см. helpers/history_log.py)
 
 @user_bp.route('/api/history/<month_identifier>', methods=['GET'])
 @jwt_required()
@@ -390,53 +429,12 @@ def api_get_history(month_identifier):
     """Получить историю за определенный месяц"""
     try:
         current_email = get_jwt_identity()
-        history_folder = get_history_folder(current_email)
-        filename = get_history_filename(month_identifier)
-        filepath = os.path.join(history_folder, filename)
         
-        if not os.path.exists(filepath):
+        # Документ месяца + еще не свернутые события журнала
+        data = read_month(current_email, month_identifier)
+        if data is None:
             # Возвращаем пустую структуру
-            return jsonify({
-                'id_user': current_email,
-                'month': int(month_identifier),
-                'statistics': [],
-                'statistics_sentenses': []
-            })
-        
-        # Читаем файл с обработкой ошибок JSON
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        except json.JSONDecodeError as e:
-            print(f'❌ [API_GET_HISTORY] Ошибка парсинга JSON в файле {filepath}: {e}')
-            # Пытаемся восстановить структуру - читаем файл как текст и пытаемся исправить
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                # Ищем последнюю валидную закрывающую скобку
-                last_valid_brace = content.rfind('}')
-                if last_valid_brace > 0:
-                    # Пытаемся извлечь валидную часть
-                    valid_content = content[:last_valid_brace + 1]
-                    data = json.loads(valid_content)
-                    print(f'⚠️ [API_GET_HISTORY] Восстановлена структура из поврежденного файла')
-                else:
-                    raise
-            except:
-                # Если не удалось восстановить, возвращаем пустую структуру
-                print(f'❌ [API_GET_HISTORY] Не удалось восстановить файл, возвращаем пустую структуру')
-                data = {
-                    'id_user': current_email,
-                    'month': int(month_identifier),
-                    'statistics': [],
-                    'statistics_sentenses': []
-                }
-        
-        # Убеждаемся, что все необходимые поля присутствуют
-        if 'statistics' not in data:
-            data['statistics'] = []
-        if 'statistics_sentenses' not in data:
-            data['statistics_sentenses'] = []
+            data = empty_month(current_email, month_identifier)
         
         return jsonify(data)
         
@@ -447,118 +445,25 @@ def api_get_history(month_identifier):
 @user_bp.route('/api/history/<month_identifier>', methods=['POST', 'PUT'])
 @jwt_required()
 def api_save_history(month_identifier):
-    """Сохранить/обновить историю за определенный месяц"""
+    """Сохранить/обновить историю за определенный месяц
+
+    Данные не сливаются с файлом месяца в запросе: сохранение - одна строка
+    в журнале событий (через буфер отложенной записи). Слияние (upsert statistics_sentenses по dictation_id и
+    date, замена statistics) выполняется при чтении и компактором.
+    """
     try:
         current_email = get_jwt_identity()
-        history_folder = get_history_folder(current_email)
-        filename = get_history_filename(month_identifier)
-        filepath = os.path.join(history_folder, filename)
-        
         incoming_data = request.get_json()
         
+        if not isinstance(incoming_data, dict):
+            return jsonify({'error': 'Invalid history data'}), 400
+        
         print(f'📊 [API_SAVE_HISTORY] Сохранение истории для месяца: {month_identifier}')
         print(f'📊 [API_SAVE_HISTORY] Входящие данные: statistics={len(incoming_data.get("statistics", []))} записей, statistics_sentenses={len(incoming_data.get("statistics_sentenses", []))} записей')
         
-        # Убеждаемся, что директория существует
-        os.makedirs(history_folder, exist_ok=True)
-        
-        # ЧИТАЕМ существующий файл (если есть)
-        if os.path.exists(filepath):
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    existing_data = json.load(f)
-                print(f'📊 [API_SAVE_HISTORY] Прочитан существующий файл: statistics={len(existing_data.get("statistics", []))} записей, statistics_sentenses={len(existing_data.get("statistics_sentenses", []))} записей')
-            except json.JSONDecodeError as e:
-                print(f'❌ [API_SAVE_HISTORY] Ошибка парсинга JSON в файле {filepath}: {e}')
-                # Пытаемся восстановить структуру - читаем файл как текст
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    # Ищем последнюю валидную закрывающую скобку
-                    last_valid_brace = content.rfind('}')
-                    if last_valid_brace > 0:
-                        # Пытаемся извлечь валидную часть
-                        valid_content = content[:last_valid_brace + 1]
-                        existing_data = json.loads(valid_content)
-                        print(f'⚠️ [API_SAVE_HISTORY] Восстановлена структура из поврежденного файла')
-                    else:
-                        raise
-                except:
-                    # Если не удалось восстановить, создаем новую структуру
-                    print(f'❌ [API_SAVE_HISTORY] Не удалось восстановить файл, создаем новую структуру')
-                    existing_data = {
-                        'id_user': current_email,
-                        'month': int(month_identifier),
-                        'statistics': [],
-                        'statistics_sentenses': []
-                    }
-            except Exception as e:
-                print(f'❌ [API_SAVE_HISTORY] Ошибка чтения файла: {e}')
-                existing_data = {
-                    'id_user': current_email,
-                    'month': int(month_identifier),
-                    'statistics': [],
-                    'statistics_sentenses': []
-                }
-        else:
-            # Файл не существует, создаем новую структуру
-            existing_data = {
-                'id_user': current_email,
-                'month': int(month_identifier),
-                'statistics': [],
-                'statistics_sentenses': []
-            }
-            print(f'📊 [API_SAVE_HISTORY] Файл не существует, создаем новую структуру')
-        
-        # Убеждаемся, что все необходимые поля присутствуют в существующих данных
-        if 'id_user' not in existing_data:
-            existing_data['id_user'] = current_email
-        if 'month' not in existing_data:
-            existing_data['month'] = int(month_identifier)
-        if 'statistics' not in existing_data or not isinstance(existing_data['statistics'], list):
-            existing_data['statistics'] = []
-        if 'statistics_sentenses' not in existing_data or not isinstance(existing_data['statistics_sentenses'], list):
-            existing_data['statistics_sentenses'] = []
-        
-        # ОБЪЕДИНЯЕМ данные: берем существующие данные и добавляем/обновляем из входящих
-        # Для statistics_sentenses: добавляем новые записи из входящих данных
-        if 'statistics_sentenses' in incoming_data and isinstance(incoming_data['statistics_sentenses'], list):
-            # Добавляем новые записи из входящих данных в существующий массив
-            for new_entry in incoming_data['statistics_sentenses']:
-                # Проверяем, нет ли уже такой записи (по dictation_id и date)
-                dictation_id = new_entry.get('dictation_id')
-                date = new_entry.get('date')
-                if dictation_id and date:
-                    # Ищем существующую запись с таким же dictation_id и date
-                    found = False
-                    for i, existing_entry in enumerate(existing_data['statistics_sentenses']):
-                        if existing_entry.get('dictation_id') == dictation_id and existing_entry.get('date') == date:
-                            # Обновляем существующую запись
-                            existing_data['statistics_sentenses'][i] = new_entry
-                            found = True
-                            print(f'📊 [API_SAVE_HISTORY] Обновлена существующая запись: dictation_id={dictation_id}, date={date}')
-                            break
-                    if not found:
-                        # Добавляем новую запись
-                        existing_data['statistics_sentenses'].append(new_entry)
-                        print(f'📊 [API_SAVE_HISTORY] Добавлена новая запись: dictation_id={dictation_id}, date={date}')
-                else:
-                    # Если нет dictation_id или date, просто добавляем
-                    existing_data['statistics_sentenses'].append(new_entry)
-        
-        # Для statistics: обновляем из входящих данных
-        if 'statistics' in incoming_data and isinstance(incoming_data['statistics'], list):
-            # Обновляем statistics из входящих данных
-            existing_data['statistics'] = incoming_data['statistics']
-        
-        # ЗАПИСЫВАЕМ обновленные данные обратно в файл
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(existing_data, f, ensure_ascii=False, indent=2)
-        
-        print(f'✅ [API_SAVE_HISTORY] Файл успешно сохранен: {filepath}')
-        print(f'✅ [API_SAVE_HISTORY] Финальная структура: statistics={len(existing_data.get("statistics", []))} записей, statistics_sentenses={len(existing_data.get("statistics_sentenses", []))} записей')
-        
-        return jsonify({'message': 'History saved successfully', 'data': existing_data})
+        submit_history_events(current_email, [month_merge_event(int(month_identifier), incoming_data)])
+        
+        return jsonify({'message': 'History saved successfully'})
         
     except Exception as e:
         import traceback
@@ -569,29 +474,34 @@ def api_save_history(month_identifier):
 @user_bp.route('/api/history/all', methods=['GET'])
 @jwt_required()
 def api_get_all_history():
-    """Получить всю историю пользователя"""
+    """Получить всю историю пользователя
+
+    ?fields=statistics - только статистика по дням (из хранилища для отчетов,
+    без чтения документов месяцев и statistics_sentenses)
+    """
     try:
         current_email = get_jwt_identity()
-        history_folder = get_history_folder(current_email)
+
+        if request.args.get('fields') == 'statistics':
+            all_history = {}
+            for stat in read_history_analytics(current_email).days(0, 99991231):
+                month_identifier = str(stat['date'] // 100)
+                month_data = all_history.setdefault(month_identifier, {
+                    'id_user': current_email,
+                    'month': int(month_identifier),
+                    'statistics': []
+                })
+                month_data['statistics'].append(stat)
+            return jsonify(all_history)
         
         all_history = {}
-        
-        # Читаем все файлы истории
-        if os.path.exists(history_folder):
-            for filename in os.listdir(history_folder):
-                if filename.startswith('h_') and filename.endswith('.json'):
-                    month_identifier = filename.replace('h_', '').replace('.json', '')
-                    filepath = os.path.join(history_folder, filename)
-                    
-                    try:
-                        with open(filepath, 'r', encoding='utf-8') as f:
-                            data = json.load(f)
-                            all_history[month_identifier] = data
-                    except Exception as e:
-                        print(f"Error reading {filename}: {e}")
+        for month_identifier in list_months(current_email):
+            data = read_month(current_email, month_identifier)
+            if data is not None:
+                all_history[month_identifier] = data
         
         return jsonify(all_history)
         
     except Exception as e:
         print(f"Error loading all history: {e}")
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
@@ -14,9 +14,14 @@ class DictationStatistics {
         this.lastSavedStats = { perfect: 0, corrected: 0, audio: 0 }; // Последние сохраненные значения для вычисления дельты
         this.listeners = [];
         this._lastSaveOk = true; // признак успешного последнего сохранения
+        this.draftSnapshots = new Map(); // Map<dictationId, {version, state}> - база для дельт черновика
         
         // Привязка методов
         this.updateUI = this.updateUI.bind(this);
+        this.flushOnPageHide = this.flushOnPageHide.bind(this);
+
+        // При уходе со страницы досылаем несохраненную дельту (одним пакетом)
+        window.addEventListener('pagehide', this.flushOnPageHide);
     }
 
     /**
@@ -333,6 +338,45 @@ class DictationStatistics {
         }
     }
 
+    /**
+     * Отправка несохраненной дельты при закрытии страницы
+     * fetch с keepalive переживает выгрузку страницы (в отличие от обычного запроса)
+     */
+    flushOnPageHide() {
+        if (!this.currentSession || !this.userManager || !this.userManager.token) return;
+
+        const delta = {
+            perfect: this.currentSession.perfect - this.lastSavedStats.perfect,
+            corrected: this.currentSession.corrected - this.lastSavedStats.corrected,
+            audio: this.currentSession.audio - this.lastSavedStats.audio
+        };
+        if (!delta.perfect && !delta.corrected && !delta.audio) return;
+
+        const now = new Date();
+        fetch('/api/statistics/history/batch', {
+            method: 'POST',
+            keepalive: true,
+            headers: {
+                'Authorization': `Bearer ${this.userManager.token}`,
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                items: [{
+                    type: 'day_stats',
+                    month: this.getMonthKey(now),
+                    statistics: { date: this.formatDate(now), ...delta }
+                }]
+            })
+        }).catch(() => {});
+
+        this.lastSavedStats = {
+            perfect: this.currentSession.perfect,
+            corrected: this.currentSession.corrected,
+            audio: this.currentSession.audio
+        };
+        this.saveCounter = 0;
+    }
+
     /**
      * Признак, что есть несохраненный прогресс (звездочка в виджете)
      */
@@ -494,6 +538,7 @@ class DictationStatistics {
 
             if (response.ok) {
                 const data = await response.json();
+                this.rememberDraft(dictationId, data.version, data.state);
                 return data.state; // null если нет черновика
             }
             return null;
@@ -503,8 +548,54 @@ class DictationStatistics {
         }
     }
 
+    /**
+     * Запоминаем версию и копию черновика - от нее считается следующая дельта
+     */
+    rememberDraft(dictationId, version, state) {
+        if (version && state) {
+            this.draftSnapshots.set(dictationId, { version, state: JSON.parse(JSON.stringify(state)) });
+        } else {
+            this.draftSnapshots.delete(dictationId);
+        }
+    }
+
+    /**
+     * Дельта между двумя состояниями черновика в формате JSON Patch (add/replace/remove)
+     * Поля version/date_saved проставляет сервер, в дельту они не входят
+     */
+    diffDraft(prev, next, path = '') {
+        const isObject = value => value !== null && typeof value === 'object' && !Array.isArray(value);
+        const escape = key => String(key).replace(/~/g, '~0').replace(/\//g, '~1');
+
+        if (!isObject(prev) || !isObject(next)) {
+            return JSON.stringify(prev) === JSON.stringify(next)
+                ? []
+                : [{ op: 'replace', path, value: next }];
+        }
+
+        const ops = [];
+        const serverFields = path === '' ? ['version', 'date_saved'] : [];
+        Object.keys(prev).forEach(key => {
+            if (!(key in next) && !serverFields.includes(key)) {
+                ops.push({ op: 'remove', path: `${path}/${escape(key)}` });
+            }
+        });
+        Object.keys(next).forEach(key => {
+            if (serverFields.includes(key)) return;
+            const keyPath = `${path}/${escape(key)}`;
+            if (!(key in prev)) {
+                ops.push({ op: 'add', path: keyPath, value: next[key] });
+            } else {
+                ops.push(...this.diffDraft(prev[key], next[key], keyPath));
+            }
+        });
+        return ops;
+    }
+
     /**
      * Сохранение черновика диктанта
+     * Если известна версия черновика на сервере - отправляется только дельта,
+     * при конфликте версий (409) - состояние целиком
      */
     async saveResumeState(dictationId, state) {
         try {
@@ -514,22 +605,47 @@ class DictationStatistics {
                 return false;
             }
 
-            const response = await fetch('/api/statistics/dictation_state/save', {
+            const post = body => fetch('/api/statistics/dictation_state/save', {
                 method: 'POST',
                 headers: {
                     'Authorization': `Bearer ${token}`,
                     'Content-Type': 'application/json'
                 },
-                body: JSON.stringify({
+                body: JSON.stringify(body)
+            });
+
+            let response = null;
+            const snapshot = this.draftSnapshots.get(dictationId);
+            if (snapshot) {
+                const patch = this.diffDraft(snapshot.state, state);
+                if (patch.length === 0) {
+                    return true;
+                }
+                response = await post({
+                    dictation_id: dictationId,
+                    base_version: snapshot.version,
+                    patch: patch
+                });
+                if (!response.ok) {
+                    console.warn('[DictationStatistics] saveResumeState: дельта не принята, отправляем целиком', response.status);
+                    response = null;
+                }
+            }
+
+            if (!response) {
+                response = await post({
                     dictation_id: dictationId,
                     state: state
-                })
-            });
+                });
+            }
 
             if (response.ok) {
+                const data = await response.json().catch(() => ({}));
+                this.rememberDraft(dictationId, data.version, state);
                 console.log('✅ Черновик сохранен');
                 return true;
             } else {
+                this.rememberDraft(dictationId, null, null);
                 console.error('Ошибка сохранения черновика:', response.status);
                 return false;
             }
@@ -559,6 +675,7 @@ class DictationStatistics {
             });
 
             if (response.ok) {
+                this.rememberDraft(dictationId, null, null);
                 console.log('✅ Черновик удален');
                 return true;
             } else {
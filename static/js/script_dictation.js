@@ -195,7 +195,8 @@ let currentDictation = {
     id: '', // ID поточного диктанту
     language_original: '',
     language_translation: '',
-    title_orig: ''
+    title_orig: '',
+    difficulty: null // сложность по истории всех пользователей (flask difficulty-update)
 }
 
 // Глобальные переменные модального окна начала диктанта
@@ -3270,6 +3271,7 @@ function loadDictationData() {
         currentDictation.language_original = dictationDataElement.dataset.languageOriginal || '';
         currentDictation.language_translation = dictationDataElement.dataset.languageTranslation || '';
         currentDictation.title_orig = dictationDataElement.dataset.titleOrig || '';
+        currentDictation.difficulty = JSON.parse(dictationDataElement.dataset.difficulty || 'null');
         
         // Логируем для отладки
         console.log('📝 Загружен язык из data-атрибутов:', {
@@ -4931,45 +4933,6 @@ async function registerCompletedDictation() {
             return;
         }
 
-        // Получаем email пользователя
-        let userEmail = '';
-        if (userManager && userManager.getCurrentUser) {
-            const user = userManager.getCurrentUser();
-            userEmail = user?.email || '';
-        } else if (userManager && userManager.email) {
-            userEmail = userManager.email;
-        }
-
-        // Загружаем текущую историю за месяц
-        const historyResponse = await fetch(`/user/api/history/${monthKey}`, {
-            method: 'GET',
-            headers: {
-                'Authorization': `Bearer ${token}`,
-                'Content-Type': 'application/json'
-            }
-        });
-
-        let historyData = { id_user: userEmail, month: monthKey, statistics: [], statistics_sentenses: [] };
-        if (historyResponse.ok) {
-            const loaded = await historyResponse.json();
-            // Сохраняем все поля из загруженных данных, включая statistics_sentenses
-            // Не проверяем loaded.statistics, так как может быть только statistics_sentenses
-            if (loaded) {
-                historyData = {
-                    id_user: loaded.id_user || userEmail,
-                    month: loaded.month || monthKey,
-                    statistics: Array.isArray(loaded.statistics) ? loaded.statistics : [],
-                    statistics_sentenses: Array.isArray(loaded.statistics_sentenses) ? loaded.statistics_sentenses : []
-                };
-            }
-        }
-
-        // Добавляем запись в statistics_sentenses (если такого поля нет, создаем)
-        // Убеждаемся, что statistics_sentenses всегда массив
-        if (!Array.isArray(historyData.statistics_sentenses)) {
-            historyData.statistics_sentenses = [];
-        }
-
         // Получаем статистику и время выполнения
         const sum = sumRez();
         const totalPerfect = number_of_perfect + sum.circle_number_of_perfect;
@@ -4993,24 +4956,17 @@ async function registerCompletedDictation() {
 
         console.log('[Register] Регистрируем завершенный диктант:', historyEntry);
 
-        // Добавляем новую запись (каждое выполнение - отдельная запись)
-        historyData.statistics_sentenses.push(historyEntry);
-
-        console.log('[Register] 📊 Данные для сохранения:', {
-            month: historyData.month,
-            statistics_count: historyData.statistics.length,
-            statistics_sentenses_count: historyData.statistics_sentenses.length,
-            last_entry: historyEntry
-        });
-
-        // Сохраняем обновленную историю
-        const saveResponse = await fetch(`/user/api/history/${monthKey}`, {
+        // Одна запись statistics_sentenses пакетом: сервер делает upsert
+        // по (dictation_id, date), читать и переотправлять весь месяц не нужно
+        const saveResponse = await fetch('/api/statistics/history/batch', {
             method: 'POST',
             headers: {
                 'Authorization': `Bearer ${token}`,
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify(historyData)
+            body: JSON.stringify({
+                items: [{ type: 'sentense', month: monthKey, entry: historyEntry }]
+            })
         });
 
         if (saveResponse.ok) {
@@ -1853,22 +1853,14 @@ async function createCombinedAudioFile(customFileName = null) {
     
     try {
         // Отправляем запрос на сервер для склейки
-        const response = await fetch('/create-combined-audio', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                dictation_id: currentDictation.id,
-                safe_email: currentDictation.safe_email,
-                file_sequence: fileSequence,
-                pattern: pattern,
-                filename: fileName
-            })
+        const result = await runAudioJob('/create-combined-audio', {
+            dictation_id: currentDictation.id,
+            safe_email: currentDictation.safe_email,
+            file_sequence: fileSequence,
+            pattern: pattern,
+            filename: fileName
         });
         
-        const result = await response.json();
-        
         if (result.success) {
             // Добавляем файл в список созданных
             const fileInfo = {
@@ -5171,31 +5163,19 @@ async function splitAudioIntoSentences() {
         }
 
         // Отправляем запрос на сервер для разрезания аудио
-        const response = await fetch('/split-audio', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                filename: currentAudioFileName,
-                filepath: filePath,
-                sentences: sentences.map(s => ({
-                    key: s.key,
-                    start_time: workingData.original.sentences.find(ws => ws.key === s.key)?.start || 0,
-                    end_time: workingData.original.sentences.find(ws => ws.key === s.key)?.end || 0,
-                    language: currentDictation.language_original
-                })),
-                dictation_id: currentDictation.id
-            })
+        const data = await runAudioJob('/split-audio', {
+            filename: currentAudioFileName,
+            filepath: filePath,
+            sentences: sentences.map(s => ({
+                key: s.key,
+                start_time: workingData.original.sentences.find(ws => ws.key === s.key)?.start || 0,
+                end_time: workingData.original.sentences.find(ws => ws.key === s.key)?.end || 0,
+                language: currentDictation.language_original
+            })),
+            dictation_id: currentDictation.id,
+            mode: 'copy' // без перекодирования, если исходник MP3 (иначе сервер перекодирует)
         });
 
-        if (!response.ok) {
-            const errorText = await response.text();
-            throw new Error(`HTTP ${response.status}: ${errorText}`);
-        }
-
-        const data = await response.json();
-
         if (data.success) {
             // Обновляем таблицу
             updateTableWithNewAudio();
@@ -6496,9 +6476,9 @@ async function autoTranslate(text, fromLanguage, toLanguage) {
 }
 
 /**
- * Генерировать аудио для одного предложения
+ * Текст и имя файла для TTS одного предложения (null, если озвучивать нечего)
  */
-async function generateAudioForSentence(sentence, language) {
+function prepareTtsItem(sentence, language) {
     if (!sentence.text.trim()) return null;
 
     // Очищаем текст от меток спикеров (1:, 2:) и комментариев (/* ... */)
@@ -6529,6 +6509,17 @@ async function generateAudioForSentence(sentence, language) {
         filename = `${key}_${language}_avto.mp3`;
     }
 
+    return { key: sentence.key, text: cleanText, language: language, filename_audio: filename };
+}
+
+/**
+ * Генерировать аудио для одного предложения
+ */
+async function generateAudioForSentence(sentence, language) {
+    const item = prepareTtsItem(sentence, language);
+    if (!item) return null;
+    const filename = item.filename_audio;
+
     try {
         const response = await fetch('/generate_audio', {
             method: 'POST',
@@ -6536,7 +6527,7 @@ async function generateAudioForSentence(sentence, language) {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({
-                text: cleanText,
+                text: item.text,
                 language: language,
                 filename: filename,
                 filename_audio: filename,
@@ -6560,6 +6551,110 @@ async function generateAudioForSentence(sentence, language) {
     }
 }
 
+/**
+ * Генерировать аудио для списка предложений одним запросом (сервер синтезирует параллельно)
+ * @param {Array<{sentence: Object, language: string}>} entries
+ */
+async function generateAudioBatch(entries) {
+    const items = [];
+    entries.forEach(({ sentence, language }) => {
+        const item = prepareTtsItem(sentence, language);
+        if (item) items.push(item);
+    });
+    if (items.length === 0) return;
+
+    try {
+        const response = await fetch('/generate_audio/batch', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                items: items,
+                dictation_id: currentDictation.id,
+                safe_email: currentDictation.safe_email
+            })
+        });
+        if (!response.ok) {
+            throw new Error(`${response.status} ${await response.text()}`);
+        }
+        let result = await response.json();
+        if (response.status === 202) {
+            // Большой пакет - фоновое задание на сервере
+            result = await waitForAudioJob(result.status_url);
+        }
+        (result.results || []).forEach(item => {
+            if (!item.success) {
+                console.error(`❌ Ошибка генерации аудио для ${item.key}: ${item.error}`);
+            }
+        });
+    } catch (error) {
+        // Сервер без пакетного API - по одному предложению
+        console.warn('⚠️ Пакетная генерация аудио недоступна, генерируем по одному:', error);
+        for (const { sentence, language } of entries) {
+            await generateAudioForSentence(sentence, language);
+        }
+    }
+}
+
+/**
+ * Обработка аудио на сервере фоновым заданием (async=true) с ожиданием результата
+ * @param {string} url - эндпоинт обработки (/split-audio, /create-combined-audio, ...)
+ * @param {Object} payload - тело запроса, как для синхронного вызова
+ * @returns {Promise<Object>} ответ эндпоинта (тот же, что в синхронном режиме)
+ */
+async function runAudioJob(url, payload) {
+    const response = await fetch(`${url}?async=true`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify(payload)
+    });
+    if (response.status !== 202) {
+        // Ошибка проверки запроса (или сервер без фоновых заданий) - ответ как обычно
+        if (!response.ok) {
+            const errorText = await response.text();
+            throw new Error(`HTTP ${response.status}: ${errorText}`);
+        }
+        return response.json();
+    }
+
+    const { status_url } = await response.json();
+    return waitForAudioJob(status_url);
+}
+
+// Дольше фоновое задание обработки аудио не ждем
+const AUDIO_JOB_TIMEOUT_MS = 30 * 60 * 1000;
+
+/**
+ * Ожидание фонового задания обработки аудио
+ * @param {string} status_url - адрес статуса из ответа 202
+ * @returns {Promise<Object>} результат задания (тело ответа эндпоинта)
+ */
+async function waitForAudioJob(status_url) {
+    const deadline = Date.now() + AUDIO_JOB_TIMEOUT_MS;
+    while (Date.now() < deadline) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const response = await fetch(status_url);
+        if (!response.ok) {
+            // 404 - задание удалено или неизвестно, 5xx - ошибка сервера
+            return { success: false, error: `Статус задания недоступен: HTTP ${response.status}` };
+        }
+        const job = await response.json();
+        if (job.status === 'done') {
+            return job.result;
+        }
+        if (job.status === 'failed') {
+            return job.result || { success: false, error: job.error };
+        }
+        if (job.status !== 'queued' && job.status !== 'running') {
+            return { success: false, error: `Неизвестный статус задания: ${job.status}` };
+        }
+    }
+    return { success: false, error: 'Превышено время ожидания обработки аудио' };
+}
+
 /**
  * Парсинг текста диктанта
  */
@@ -6580,6 +6675,7 @@ async function parseInputText(text, delimiter, isDialog, speakers) {
     let original_line = "";
     let translation_line = "";
     let translation_mistake = [];
+    const audioQueue = []; // предложения для пакетной генерации аудио
     for (let i = 0; i < lines.length; i++) {
         // !!! дивимось одночасно поточний рядок і наступний рядок
 
@@ -6614,8 +6710,8 @@ async function parseInputText(text, delimiter, isDialog, speakers) {
             chain: false,
             checked: false
         };
-        // Генерировать аудио для оригинала
-        await generateAudioForSentence(s_original, language_original);
+        // Аудио для оригинала - одним пакетом после разбора текста
+        audioQueue.push({ sentence: s_original, language: language_original });
         original.push(s_original);
 
         // наступний рядок - переклад
@@ -6652,8 +6748,8 @@ async function parseInputText(text, delimiter, isDialog, speakers) {
             chain: false,
             explanation: '' // поле для комментариев
         };
-        // генеруємо аудио перекладу
-        await generateAudioForSentence(s_translation, language_translation);
+        // аудио перекладу - теж у пакет
+        audioQueue.push({ sentence: s_translation, language: language_translation });
         translation.push(s_translation);
         
         // Проверяем, есть ли строки // для explanation после текущего предложения
@@ -6683,6 +6779,9 @@ async function parseInputText(text, delimiter, isDialog, speakers) {
 
     }
 
+    // Генерируем аудио всех предложений одним запросом
+    await generateAudioBatch(audioQueue);
+
     // Обработка ошибок перевода
     if (translation_mistake.length > 0) {
         let message = `Обнаружены ошибки в структуре текста:\n`;
@@ -315,11 +315,15 @@ function createCardDOM(d) {
     thumb.setAttribute('aria-label', `Открыть диктант: ${d.title || ''}`);
 
     const img = document.createElement('img');
-    img.src = d.cover_url;
+    // Обложка нужного размера (200x120 и @2x для high-DPI) с неизменяемым URL
+    img.src = d.cover_thumb_url || d.cover_url;
+    if (d.cover_thumb_url && d.cover_thumb_url_2x) {
+        img.srcset = `${d.cover_thumb_url} 1x, ${d.cover_thumb_url_2x} 2x`;
+    }
     img.alt = d.title || 'Обложка диктанта';
     img.loading = 'lazy';
     img.decoding = 'async';
-    img.onerror = () => { img.src = 'data/covers/cover_en.webp'; };
+    img.onerror = () => { img.removeAttribute('srcset'); img.src = 'data/covers/cover_en.webp'; };
 
     thumb.appendChild(img);
     card.appendChild(thumb);
@@ -880,8 +884,48 @@ function countDictationCompletions(dictationId) {
     return totalCount;
 }
 
+// Манифест черновиков: один запрос на страницу вместо запроса на каждую карточку
+let draftsManifestPromise = null;
+
 /**
- * Получить статистику диктанта из истории (perfect, corrected, audio)
+ * Загрузить манифест черновиков пользователя (прогресс без загрузки самих черновиков)
+ * @returns {Promise<Map>} - Map<dictation_id, {date_saved, version, size, summary}>
+ */
+function loadDraftsManifest() {
+    if (draftsManifestPromise) {
+        return draftsManifestPromise;
+    }
+
+    const token = localStorage.getItem('jwt_token');
+    draftsManifestPromise = fetch('/api/statistics/dictation_state/list', {
+        method: 'GET',
+        headers: {
+            'Authorization': `Bearer ${token}`,
+            'Content-Type': 'application/json'
+        }
+    })
+        .then(response => {
+            if (!response.ok) {
+                if (response.status === 401) {
+                    console.warn('Не авторизован для получения списка черновиков');
+                }
+                draftsManifestPromise = null;
+                return { drafts: [] };
+            }
+            return response.json();
+        })
+        .then(data => new Map((data.drafts || []).map(draft => [draft.dictation_id, draft])))
+        .catch(error => {
+            console.warn('Ошибка получения списка черновиков:', error);
+            draftsManifestPromise = null;
+            return new Map();
+        });
+
+    return draftsManifestPromise;
+}
+
+/**
+ * Получить статистику диктанта из черновика (perfect, corrected, audio)
  * @param {string} dictationId - ID диктанта
  * @returns {Object} - Объект с полями {perfect, corrected, audio, hasDraft}
  */
@@ -896,60 +940,20 @@ async function getDictationStats(dictationId) {
         return { perfect: 0, corrected: 0, audio: 0, hasDraft: false };
     }
 
-    try {
-        const response = await fetch(`/api/statistics/dictation_state/${dictationId}`, {
-            method: 'GET',
-            headers: {
-                'Authorization': `Bearer ${token}`,
-                'Content-Type': 'application/json'
-            }
-        });
-
-        if (response.ok) {
-            const data = await response.json();
-            const state = data.state;
-            if (state) {
-                const draftStats = computeDraftStatistics(state);
-                draftStats.hasDraft = true;
-                return draftStats;
-            }
-        } else if (response.status === 401) {
-            console.warn('Не авторизован для получения состояния диктанта');
-        }
-    } catch (error) {
-        console.warn('Ошибка получения черновика диктанта:', error);
+    const manifest = await loadDraftsManifest();
+    const draft = manifest.get(dictationId);
+    if (draft && draft.summary) {
+        return {
+            perfect: draft.summary.perfect || 0,
+            corrected: draft.summary.corrected || 0,
+            audio: draft.summary.audio || 0,
+            hasDraft: true
+        };
     }
 
     return { perfect: 0, corrected: 0, audio: 0, hasDraft: false };
 }
 
-function computeDraftStatistics(state) {
-    const perSentence = state.per_sentence || {};
-    let perfect = 0;
-    let corrected = 0;
-    let audio = 0;
-
-    const toNumber = (value) => Number(value) || 0;
-
-    // Если есть агрегированные значения - добавляем их как базу
-    perfect += toNumber(state.number_of_perfect);
-    corrected += toNumber(state.number_of_corrected);
-    audio += toNumber(state.number_of_audio);
-
-    Object.values(perSentence).forEach(sentence => {
-        perfect += toNumber(sentence.number_of_perfect) + toNumber(sentence.circle_number_of_perfect);
-        corrected += toNumber(sentence.number_of_corrected) + toNumber(sentence.circle_number_of_corrected);
-        audio += toNumber(sentence.number_of_audio) + toNumber(sentence.circle_number_of_audio);
-    });
-
-    return {
-        perfect,
-        corrected,
-        audio,
-        hasDraft: false
-    };
-}
-
 
 
 
@@ -359,15 +359,12 @@ function updateAvatarDisplay(avatar) {
         const largeUrl = avatar.large || avatar.medium || avatar.original;
         const smallUrl = avatar.small || avatar.medium || avatar.original || largeUrl;
         
-        // Добавляем timestamp для избежания кеширования
-        const timestamp = new Date().getTime();
-        const largeUrlWithTimestamp = largeUrl + (largeUrl.includes('?') ? '&' : '?') + 't=' + timestamp;
-        const smallUrlWithTimestamp = smallUrl + (smallUrl.includes('?') ? '&' : '?') + 't=' + timestamp;
+        // URL версионированы сервером (v=<uploaded>), новый аватар получает новый URL,
+        // поэтому timestamp для обхода кеша не нужен
+        avatarLarge.src = largeUrl;
+        avatarSmall.src = smallUrl;
         
-        avatarLarge.src = largeUrlWithTimestamp;
-        avatarSmall.src = smallUrlWithTimestamp;
-        
-        // console.log('Установлены URL аватаров:', { large: largeUrlWithTimestamp, small: smallUrlWithTimestamp });
+        // console.log('Установлены URL аватаров:', { large: largeUrl, small: smallUrl });
     } else {
         // Заглушка для аватара по умолчанию
         const defaultLarge = '/static/icons/default-avatar-large.svg';
@@ -246,7 +246,7 @@ class UserActivityHistory {
                 return {};
             }
 
-            const response = await fetch(`${this.apiBase}/history/all`, {
+            const response = await fetch(`${this.apiBase}/history/all?fields=statistics`, {
                 headers: {
                     'Authorization': `Bearer ${token}`,
                     'Content-Type': 'application/json'
@@ -207,9 +207,8 @@ class UserManager {
       const avatarUrl = this.getAvatarUrl('small');
 
       if (avatarUrl) {
-        // Добавляем временную метку для избежания кэширования
-        const avatarUrlWithTimestamp = `${avatarUrl}&t=${Date.now()}`;
-        avatarElement.style.backgroundImage = `url(${avatarUrlWithTimestamp})`;
+        // URL версионирован сервером (v=<uploaded>), поэтому браузер может его кешировать
+        avatarElement.style.backgroundImage = `url(${avatarUrl})`;
         avatarElement.style.backgroundSize = 'cover';
         avatarElement.style.backgroundPosition = 'center';
         avatarElement.style.width = '32px';